@@ -4,46 +4,472 @@ bigtrees web app
 
 """
 from __future__ import division
-from flask import Flask, request, render_template
+import os
+import json
+import math
+import time
+import threading
+from flask import (Flask, Response, abort, g, jsonify, request,
+                   render_template, stream_with_context)
+from bigtrees.batch import chunked, compute_biomass
+from bigtrees.charts import FORMATS, STANDID, Charts
+from bigtrees.jsonstream import iter_json_array, iter_ndjson
+from bigtrees.lookup import MODES, StaleTable, binary_table
+from bigtrees.memo import BiomassCache
+from bigtrees.metrics import Metrics
+from bigtrees.registry import REGISTRY
+from bigtrees.treeindex import StaleIndex, tree_index
+from bigtrees.treetable import TreeTable
+from bigtrees.whatif import WhatIf
 
 app = Flask(__name__)
 app.debug = True
 app.config["datafile"] = "TP001_jenkins.csv"
+app.config["batchsize"] = 1000
+# the output served by /tree/<treeid>
+app.config["output"] = os.path.join("bigtrees", "bigtrees_tp001_v3.csv")
+# the inventory /whatif keeps resident: a bigtrees compute SOURCE, or
+# None for the trees of the output
+app.config["inventory"] = None
+# the dbh (cm) a SOURCE inventory's measurements must exceed, or None to
+# keep every tree, not only the big ones compute writes out
+app.config["inventory_min_dbh"] = None
+# seconds browsers may reuse a /chart image before asking again
+app.config["chart_max_age"] = 3600
+# set to True to reuse /biomass results for repeated species, dbh and
+# stand classes, in one BiomassCache shared by every request
+app.config["cache"] = False
+# request timing and the /metrics endpoint; BIGTREES_METRICS=0 turns
+# them off
+app.config["metrics"] = os.environ.get("BIGTREES_METRICS", "1") != "0"
+
+NDJSON = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+CACHE = BiomassCache()
+CHARTS = Charts()
+WHATIF = {}
+_whatif_lock = threading.Lock()
+METRICS = Metrics()
+METRICS.describe("bigtrees_request_duration_seconds", "histogram",
+                 "Time from the start of a request to the end of its response.")
+METRICS.describe("bigtrees_responses_total", "counter",
+                 "Responses by route and status code.")
+METRICS.describe("bigtrees_lookups_total", "counter",
+                 "Jenkins table lookups, by whether the table had a value.")
+METRICS.describe("bigtrees_table_loads_total", "counter",
+                 "Times the Jenkins table was opened or reopened.")
+METRICS.describe("bigtrees_table_load_seconds", "gauge",
+                 "Time the last Jenkins table load took, including compiling.")
+METRICS.describe("bigtrees_cache_hits_total", "counter",
+                 "Biomass cache lookups that found a result.")
+METRICS.describe("bigtrees_cache_misses_total", "counter",
+                 "Biomass cache lookups that did not.")
+METRICS.describe("bigtrees_cache_entries", "gauge",
+                 "Results held in the biomass cache.")
+METRICS.describe("bigtrees_cache_max_entries", "gauge",
+                 "Results the biomass cache holds before evicting.")
+METRICS.describe("bigtrees_chart_hits_total", "counter",
+                 "Charts served from the chart cache.")
+METRICS.describe("bigtrees_chart_misses_total", "counter",
+                 "Charts that had to be drawn.")
+
+def _table_and_cache():
+    """ gauge samples read from the lookup table and the biomass cache """
+    table = binary_table(app.config["datafile"], build=False)
+    return [("bigtrees_table_loads_total", None, table.loads),
+            ("bigtrees_table_load_seconds", None, table.load_seconds),
+            ("bigtrees_cache_hits_total", None, CACHE.hits),
+            ("bigtrees_cache_misses_total", None, CACHE.misses),
+            ("bigtrees_cache_entries", None, len(CACHE)),
+            ("bigtrees_cache_max_entries", None, CACHE.maxsize),
+            ("bigtrees_chart_hits_total", None, CHARTS.hits),
+            ("bigtrees_chart_misses_total", None, CHARTS.misses)]
+
+METRICS.collect(_table_and_cache)
+
+@app.before_request
+def _start_timer():
+    if app.config["metrics"]:
+        g.started = time.time()
+
+@app.after_request
+def _time_response(response):
+    """
+    record the request's latency once its response is closed, so that
+    streamed responses are timed to their last byte
+    """
+    started = g.get("started")
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    labels = {"route": route, "method": request.method}
+    status = {"route": route, "status": response.status_code}
+
+    def record():
+        METRICS.observe("bigtrees_request_duration_seconds",
+                        time.time() - started, labels)
+        METRICS.inc("bigtrees_responses_total", status)
+
+    response.call_on_close(record)
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """ every metric in the Prometheus text format """
+    if not app.config["metrics"]:
+        abort(404)
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+def find(species, quantity, mode="exact"):
+    """
+    (dbh, value) for species at quantity in the data file, looked up in
+    one of lookup.MODES, or None. Lookups read the memory-mapped binary
+    table beside the file, shared by every worker process, which
+    prepare() compiles when the app starts and which is recompiled in
+    the background when the file changes; raises StaleTable if there is
+    no binary table yet.
+    """
+    found = binary_table(app.config["datafile"], build=False).find(
+        species, quantity, mode)
+    if app.config["metrics"]:
+        METRICS.inc("bigtrees_lookups_total",
+                    {"result": "miss" if found is None else "hit"})
+    return found
+
+def lookup(species, quantity, mode="exact"):
+    """ the value for species at quantity in the data file, or None """
+    found = find(species, quantity, mode)
+    return None if found is None else found[1]
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "GET":
         return render_template("index.html")
 
-    # get species and quantity from the form
+    # get species, quantity and the lookup mode from the form
     species = request.form["species"]
-    quantity = round(float(request.form["quantity"]), 1)
-
-    # open the csv data file and go through it line by line until we find
-    # a line that matches both the requested species and quantity
-    with open(app.config["datafile"]) as datafile:
-        for line in datafile:
-            splitline = line.strip().split(',')
+    mode = request.form.get("mode", "exact")
+    if mode not in MODES:
+        abort(400)
+    quantity = float(request.form["quantity"])
+    if mode == "exact":
+        quantity = round(quantity, 1)
 
-            # check if species matches the requested species
-            species_from_file = splitline[0].strip('"')
-            if species == species_from_file:
+    # find the line that matches both the requested species and quantity,
+    # or the nearest or interpolated value
+    try:
+        value = lookup(species, quantity, mode)
+    except StaleTable as exc:
+        return render_template("index.html", lookup=str(exc)), 503
+    if value is not None:
 
-                # check if the quantity matches the requested quantity
-                quantity_from_file = float(splitline[1])
-                if quantity == quantity_from_file:
-
-                    # this is the value we want!
-                    # send it back to the template (index.html) so the user
-                    # can see it
-                    return render_template("index.html", lookup=splitline[2])
+        # this is the value we want!
+        # send it back to the template (index.html) so the user
+        # can see it
+        return render_template("index.html", lookup=value)
 
     # if we've reached this point, then we didn't find a match.
     # send an error message to the template (index.html) so the user knows
     # the lookup wasn't successful
     return render_template("index.html", lookup="No match found")
 
+def _error(message, status=400):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+def _number(name):
+    """ a finite float query argument, or ValueError """
+    try:
+        value = float(request.args[name])
+    except KeyError:
+        raise ValueError("missing argument %r" % name)
+    except ValueError:
+        raise ValueError("%s must be a number" % name)
+    if math.isnan(value) or math.isinf(value):
+        raise ValueError("%s must be finite" % name)
+    return value
+
+@app.route("/lookup")
+def lookup_value():
+    """
+    the table value for ?species=&dbh= as JSON, in the mode given by
+    &mode= (exact, nearest or interpolate; exact by default). The dbh
+    in the result is the table's for exact and nearest lookups.
+    """
+    species = request.args.get("species", "").strip()
+    mode = request.args.get("mode", "exact")
+    if mode not in MODES:
+        return _error("mode must be one of %s" % ", ".join(MODES))
+    try:
+        dbh = _number("dbh")
+    except ValueError as exc:
+        return _error(str(exc))
+    try:
+        found = find(species, dbh, mode)
+    except StaleTable as exc:
+        return _error(str(exc), 503)
+    if found is None:
+        return _error("no value for %s at %s" % (species, dbh), 404)
+    return jsonify({"species": species, "mode": mode, "dbh": found[0],
+                    "value": float(found[1])})
+
+@app.route("/lookup/range")
+def lookup_range():
+    """
+    the table's biomass curve for ?species= between &low= and &high=
+    (cm) as JSON lists of dbh and value
+    """
+    species = request.args.get("species", "").strip()
+    try:
+        low = _number("low")
+        high = _number("high")
+    except ValueError as exc:
+        return _error(str(exc))
+    if low > high:
+        return _error("low must not be above high")
+    try:
+        points = binary_table(app.config["datafile"], build=False).curve(
+            species, low, high)
+    except StaleTable as exc:
+        return _error(str(exc), 503)
+    return jsonify({"species": species, "dbh": [x for x, _ in points],
+                    "value": [float(v) for _, v in points]})
+
+@app.route("/chart")
+def chart():
+    """
+    best and jenkins biomass curves of ?species= (repeated or comma
+    separated) from &low= to &high= (cm, 5 to 150 by default) as a PNG,
+    or an SVG with &format=svg. &standid= chooses the equations. The
+    ETag changes with the species' equations, and a request whose
+    If-None-Match already has it gets a 304 without drawing anything.
+    """
+    species = [name.strip() for value in request.args.getlist("species")
+               for name in value.split(",") if name.strip()]
+    if not species:
+        return _error("missing argument 'species'")
+    standid = request.args.get("standid", STANDID).strip()
+    format = request.args.get("format", "png")
+    try:
+        low = _number("low") if "low" in request.args else 5.0
+        high = _number("high") if "high" in request.args else 150.0
+        if not 0 < low < high:
+            raise ValueError("low must be positive and below high")
+        etag = CHARTS.etag(species, low, high, standid, format)
+    except ValueError as exc:
+        return _error(str(exc))
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        etag, image = CHARTS.get(species, low, high, standid, format)
+        response = Response(image, mimetype=FORMATS[format])
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=%d" % (
+        app.config["chart_max_age"])
+    return response
+
+@app.route("/tree/<treeid>")
+def tree(treeid):
+    """
+    the output rows of one tree as JSON, read straight from their place
+    in app.config["output"] through its TREEID index. The index is
+    written by bigtrees index (or compute --index), never here: while
+    it is missing or older than the output the answer is 503.
+    """
+    try:
+        records = tree_index(app.config["output"], build=False).records(
+            treeid)
+    except StaleIndex as exc:
+        return _error(str(exc), 503)
+    if not records:
+        return _error("no tree %s" % treeid, 404)
+    return jsonify({"treeid": treeid,
+                    "measurements": [dict((name.lower(), value)
+                                          for name, value in record.items())
+                                     for record in records]})
+
+def _inventory():
+    """ the key the resident inventory of the app's config is held by """
+    if app.config["inventory"] is None:
+        return (app.config["output"], None)
+    return (app.config["inventory"], app.config["inventory_min_dbh"])
+
+def resident():
+    """
+    the WhatIf of app.config["inventory"] (or of the trees of the
+    output), or None until load_inventory() has loaded it
+    """
+    return WHATIF.get(_inventory())
+
+def load_inventory():
+    """
+    load the inventory of the app's config and keep it for the life of
+    the process, measurements with dbh above app.config["inventory_min_dbh"]
+    of a SOURCE, or every tree of the output
+    """
+    key = _inventory()
+    with _whatif_lock:
+        whatif = WHATIF.get(key)
+        if whatif is None:
+            name, min_dbh = key
+            if app.config["inventory"] is None:
+                table = TreeTable.load_output(name)
+            else:
+                from bigtrees.cli import open_source
+                table = TreeTable.load(open_source(name, min_dbh).fetch())
+            whatif = WHATIF[key] = WhatIf(table)
+    return whatif
+
+@app.route("/whatif", methods=["POST"])
+def whatif():
+    """
+    best biomass totals per stand with the equation parameters changed
+    by a JSON body {"overrides": [{species, parameter: value, ...}]}.
+    With "trees": true, the recomputed trees are listed too.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("overrides"),
+                                                    list):
+        return _error("the body must be a JSON object with a list of "
+                      "overrides")
+    inventory = resident()
+    if inventory is None:
+        # loading it here would hold the request up for the whole read
+        return _error("the inventory is not loaded: the app loads it "
+                      "when it starts", 503)
+    try:
+        result = inventory.evaluate(body["overrides"])
+    except ValueError as exc:
+        return _error(str(exc))
+    response = {"recomputed": len(result.rows),
+                "models": sorted(repr(model) for model in
+                                 result.models.values()),
+                "stands": result.stands()}
+    if body.get("trees"):
+        response["trees"] = result.trees()
+    return jsonify(response)
+
+def _guarded(records):
+    """
+    pass records through; if reading them fails, end with the error
+    itself so results already computed are still sent
+    """
+    try:
+        for record in records:
+            yield record
+    except ValueError as exc:
+        yield ValueError("malformed request body: %s" % exc)
+
+def _tree(record):
+    """ (species, dbh, standid) of one request record, or ValueError """
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("records must be JSON objects")
+    for field in ("species", "dbh", "standid"):
+        if field not in record:
+            raise ValueError("missing field %r" % field)
+    if isinstance(record["dbh"], bool):
+        raise ValueError("dbh must be a number")
+    try:
+        dbh = float(record["dbh"])
+    except (TypeError, ValueError):
+        raise ValueError("dbh must be a number")
+    if math.isnan(dbh) or math.isinf(dbh):
+        raise ValueError("dbh must be finite")
+    if dbh <= 0:
+        raise ValueError("dbh must be positive")
+    species = str(record["species"]).strip()
+    standid = str(record["standid"]).strip()
+
+    # raises ValueError for a species with no equation
+    REGISTRY.model(species, standid)
+    return (species, dbh, standid)
+
+def biomass_lines(records, size):
+    """
+    compute biomass for records of {species, dbh, standid}, size at a
+    time, yielding a list of JSON results per batch. Results line up
+    one to one with records; a record that cannot be computed, or whose
+    biomass overflows, gets an {"error": ...} result instead.
+    """
+    for batch in chunked(_guarded(records), size):
+        results = []
+        trees = []
+        for record in batch:
+            try:
+                trees.append(_tree(record))
+                results.append(None)
+            except ValueError as exc:
+                results.append({"error": str(exc)})
+
+        if trees:
+            species, dbh, standid = zip(*trees)
+            cache = CACHE if app.config["cache"] else None
+            best, jenk = compute_biomass(species, dbh, standid, cache=cache)
+            computed = iter(zip(trees, best.tolist(), jenk.tolist()))
+            for i, result in enumerate(results):
+                if result is None:
+                    ((s, x, stand), b, b1) = next(computed)
+                    if not (math.isinf(b) or math.isnan(b) or
+                            math.isinf(b1) or math.isnan(b1)):
+                        results[i] = {"species": s, "dbh": x,
+                                      "standid": stand,
+                                      "best_biomass": round(b, 4),
+                                      "jenkins_biomass": round(b1, 4)}
+                    else:
+                        results[i] = {"error": "biomass of %s at dbh %r is "
+                                               "not finite" % (s, x)}
+
+        yield [json.dumps(result, separators=(",", ":"), allow_nan=False)
+               for result in results]
+
+@app.route("/biomass", methods=["POST"])
+def biomass():
+    """
+    best and jenkins biomass for a JSON array, or a newline-delimited
+    JSON stream, of {species, dbh, standid} records. The body is read
+    and the results are streamed back in batches of app.config["batchsize"],
+    in the same format as the request.
+    """
+    ndjson = request.mimetype in NDJSON
+    if ndjson:
+        records = iter_ndjson(request.stream)
+    else:
+        records = iter_json_array(request.stream)
+    lines = biomass_lines(records, app.config["batchsize"])
+
+    def generate():
+        if ndjson:
+            for batch in lines:
+                yield "".join(line + "\n" for line in batch)
+            return
+        yield "["
+        separator = ""
+        for batch in lines:
+            if batch:
+                yield separator + ",".join(batch)
+                separator = ","
+        yield "]"
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def prepare():
+    """
+    compile the binary table of app.config["datafile"] if it is missing
+    or older than the file, and load the /whatif inventory, before any
+    request needs them. Raises ValueError if there is no such file.
+    """
+    if not os.path.exists(app.config["datafile"]):
+        raise ValueError("no lookup table at %s" % app.config["datafile"])
+    binary_table(app.config["datafile"]).refresh()
+    load_inventory()
+
 def main():
+    prepare()
     if app.debug:
         app.run()
     else:
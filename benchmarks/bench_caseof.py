@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+caseof micro-benchmark
+
+Times the row-by-row writeoutput over the big-tree rows with the old
+caseof, which evaluated every equation for every tree, and with the
+precompiled dispatch table, then the chunked batch writeoutput, and
+reports the per-row cost of each.
+
+run at terminal as
+
+        python benchmarks/bench_caseof.py [repeat]
+
+"""
+from __future__ import division, print_function
+import os
+import sys
+import csv
+import time
+import shutil
+import tempfile
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def eager_caseof(species, x, standid):
+    """ caseof as it was before the dispatch table, for comparison """
+    options = {"SEGI": bt.segi(x),
+               "ABPR": bt.abpr(x),
+               "CHNO": bt.chno(x),
+               "PISI": bt.pisi(x),
+               "PILA": bt.pila(x),
+               "ABCO": bt.abco(x),
+               "ABMA": bt.abco(x),
+               "TSHE": bt.tshe(x, standid),
+               "PSME": [bt.andrewspsme(x, standid), bt.rockypsme(x)],
+               "THPL": [bt.andrewsthpl(x), bt.rockythpl(x)]}
+    if species in ("PSME", "THPL"):
+        if standid != "MRRS":
+            return options[species][0]
+        return options[species][1]
+    return options[species]
+
+def cursor_rows(repeat):
+    """ the big-tree output, reshaped like the rows of formconnection() """
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        rows = [(treeid, study, species, standid, treeid, float(dbh), None)
+                for study, standid, species, treeid, dbh, _, _ in reader]
+    return rows * repeat
+
+def rowwise_writeoutput(cursor, caseof, path):
+    """ writeoutput as it was before the chunked pipeline, for comparison """
+    with open(path, "w") as outfile:
+        writer = csv.writer(outfile, quoting=csv.QUOTE_NONNUMERIC, delimiter=",")
+        writer.writerow(["PSP_STUDYID", "STANDID", "SPECIES", "TREEID", "DBH",
+                         "BEST_BIOMASS", "JENKINS_BIOMASS"])
+        for row in cursor:
+            treeid = str(row[0])
+            species = str(row[2]).strip()
+            dbh = float(row[5])
+            standid = str(row[3])
+            study = str(row[1])
+            (biomass, jenkbio) = caseof(species, dbh, study)
+            writer.writerow([study, standid, species, treeid, dbh,
+                             round(biomass, 4), round(jenkbio, 4)])
+
+def time_writeoutput(rows, caseof=None):
+    """
+    seconds to write rows row by row with the given caseof, or with
+    the chunked writeoutput when caseof is None
+    """
+    start = time.time()
+    if caseof is None:
+        bt.writeoutput(iter(rows), "chunked.csv")
+    else:
+        rowwise_writeoutput(iter(rows), caseof, "rowwise.csv")
+    return time.time() - start
+
+def main(repeat=10):
+    rows = cursor_rows(repeat)
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        eager = time_writeoutput(rows, eager_caseof)
+        dispatch = time_writeoutput(rows, bt.caseof)
+        chunked = time_writeoutput(rows)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    print("rows:     %d" % len(rows))
+    print("eager:    %.2f us/row" % (1e6 * eager / len(rows)))
+    print("dispatch: %.2f us/row" % (1e6 * dispatch / len(rows)))
+    print("chunked:  %.2f us/row" % (1e6 * chunked / len(rows)))
+    print("speedup:  %.1fx dispatch, %.1fx chunked" % (eager / dispatch,
+                                                     eager / chunked))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+web lookup load test
+
+Posts a mix of hits and misses to the index route through the Flask
+test client, first with the old per-request scan of the data file,
+then with the in-memory dict index and then with the memory-mapped
+binary table the app uses, and reports requests/sec for each. The
+test client skips the network, so the numbers are the cost of the
+WSGI stack plus the lookup.
+
+run from the top of the repository as
+
+        python benchmarks/bench_lookup.py [requests]
+
+"""
+from __future__ import division, print_function
+import os
+import sys
+import time
+import random
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+import app as webapp
+from bigtrees.lookup import jenkins_table
+
+DATAFILE = os.path.join(HERE, os.pardir, "TP001_jenkins.csv")
+
+def scan_lookup(species, quantity, mode="exact"):
+    """ the lookup as it was before the index, for comparison """
+    with open(webapp.app.config["datafile"]) as datafile:
+        for line in datafile:
+            splitline = line.strip().split(',')
+            if species == splitline[0].strip('"'):
+                if quantity == float(splitline[1]):
+                    return splitline[2]
+    return None
+
+def dict_lookup(species, quantity, mode="exact"):
+    """ the lookup through the csv parsed into a dict, for comparison """
+    return jenkins_table(webapp.app.config["datafile"]).lookup(species, quantity)
+
+def workload(count, seed=1):
+    """ species/quantity form posts, about one in ten a miss """
+    rng = random.Random(seed)
+    species = ["PSME", "QUKE", "TSHE", "THPL", "PILA", "ABAM"]
+    posts = []
+    for _ in range(count):
+        if rng.random() < 0.1:
+            posts.append({"species": "FAKE", "quantity": 73.5})
+        else:
+            posts.append({"species": rng.choice(species),
+                          "quantity": round(rng.uniform(5.0, 150.0), 1)})
+    return posts
+
+def requests_per_second(posts, lookup):
+    original = webapp.lookup
+    webapp.lookup = lookup
+    try:
+        client = webapp.app.test_client()
+        start = time.time()
+        for form in posts:
+            response = client.post("/", data=form)
+            assert response.status_code == 200, response.status_code
+        return len(posts) / (time.time() - start)
+    finally:
+        webapp.lookup = original
+
+def main(count=500):
+    webapp.app.config["datafile"] = DATAFILE
+    webapp.app.debug = False
+    webapp.prepare()
+    posts = workload(count)
+
+    scan = requests_per_second(posts, scan_lookup)
+    indexed = requests_per_second(posts, dict_lookup)
+    mapped = requests_per_second(posts, webapp.lookup)
+
+    print("requests: %d" % count)
+    print("scan:     %.1f req/s" % scan)
+    print("dict:     %.1f req/s" % indexed)
+    print("mmap:     %.1f req/s" % mapped)
+    print("speedup:  %.1fx" % (mapped / scan))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+parallel inventory run scaling benchmark
+
+Runs a synthetic inventory through writeoutput in one process, then
+through parallel_run with 1, 2, 4 and 8 workers sharded by stand, and
+reports throughput for each. Every parallel output is checked against
+the single-process one.
+
+run at terminal as
+
+        python benchmarks/bench_parallel.py [rows]
+
+"""
+from __future__ import division, print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+
+from bigtrees import biggest_trees as bt
+from bigtrees.parallel import parallel_run
+from synthetic import SyntheticSource
+
+def main(size=200000, workers=(1, 2, 4, 8)):
+    source = SyntheticSource(size)
+    workdir = tempfile.mkdtemp()
+    try:
+        expected = os.path.join(workdir, "serial.csv")
+        start = time.time()
+        count = bt.writeoutput(source.fetch(), expected)
+        elapsed = time.time() - start
+        print("rows:      %d (%d cpus)" % (count, os.cpu_count() or 1))
+        print("serial:    %.0f rows/s" % (count / elapsed))
+        with open(expected) as datafile:
+            expected = datafile.read()
+
+        for n in workers:
+            path = os.path.join(workdir, "parallel%d.csv" % n)
+            start = time.time()
+            parallel_run(source, path, "STANDID", workers=n)
+            elapsed = time.time() - start
+            with open(path) as datafile:
+                same = datafile.read() == expected
+            print("workers=%d: %.0f rows/s%s" % (n, count / elapsed,
+                                                "" if same else " MISMATCH"))
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
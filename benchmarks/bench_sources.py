@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+whole-pipeline benchmark on a local SQLite inventory
+
+Generates the fixture of make_fixture.py (unless it exists), then times
+writeoutput from SQLiteSource for the big trees only, with the dbh
+threshold pushed down into the query, and for the whole inventory.
+The big-tree run is repeated to show the pooled connection being reused.
+
+run at terminal as
+
+        python benchmarks/bench_sources.py [inventory.db] [--rows ROWS]
+
+"""
+from __future__ import division, print_function
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+
+from bigtrees import biggest_trees as bt
+from bigtrees.sources import SQLiteSource
+from make_fixture import make_fixture
+
+def timed_run(source, path):
+    start = time.time()
+    count = bt.writeoutput(source.fetch(), path)
+    return count, time.time() - start
+
+def main(fixture="inventory.db", size=1300000):
+    if not os.path.exists(fixture):
+        start = time.time()
+        make_fixture(fixture, size)
+        print("fixture:   %s built in %.1f s" % (fixture, time.time() - start))
+
+    workdir = tempfile.mkdtemp()
+    try:
+        output = os.path.join(workdir, "out.csv")
+        big = SQLiteSource(fixture, min_dbh=150)
+        for run in ("first", "again"):
+            count, elapsed = timed_run(big, output)
+            print("dbh > 150 (%s): %d rows in %.3f s" % (run, count, elapsed))
+        count, elapsed = timed_run(SQLiteSource(fixture, min_dbh=None), output)
+        print("inventory: %d rows in %.1f s, %.0f rows/s" % (count, elapsed,
+                                                            count / elapsed))
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="whole-pipeline benchmark on a local SQLite inventory")
+    parser.add_argument("fixture", nargs="?", default="inventory.db",
+                        help="the SQLite inventory, built if it is missing")
+    parser.add_argument("--rows", type=int, default=1300000,
+                        help="measurements in a fixture that is built")
+    args = parser.parse_args()
+    if args.fixture.isdigit():
+        parser.error("%s is a row count, not an inventory: use --rows %s" %
+                     (args.fixture, args.fixture))
+    main(args.fixture, args.rows)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+generate a local SQLite inventory
+
+Writes tp00101 (trees) and tp00102 (measurements) tables shaped like
+the FSDB ones, filled from a SyntheticSource, so that the pipeline can
+be run and benchmarked offline with SQLiteSource. The default size is
+the whole TP001 inventory, about 1.3 million measurements, with the
+real share of big trees.
+
+run at terminal as
+
+        python benchmarks/make_fixture.py inventory.db [rows]
+
+"""
+from __future__ import division, print_function
+import os
+import sys
+import time
+import sqlite3
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, HERE)
+
+from synthetic import SyntheticSource
+
+SCHEMA = """
+CREATE TABLE tp00101 (treeid TEXT PRIMARY KEY, psp_studyid TEXT,
+                      species TEXT, standid TEXT);
+CREATE TABLE tp00102 (treeid TEXT, year INTEGER, dbh REAL, tree_vigor TEXT);
+"""
+
+INDEXES = """
+CREATE INDEX tp00101_standid ON tp00101 (standid);
+CREATE INDEX tp00101_study ON tp00101 (psp_studyid);
+CREATE INDEX tp00102_treeid ON tp00102 (treeid, year);
+CREATE INDEX tp00102_dbh ON tp00102 (dbh);
+"""
+
+def make_fixture(path, size=1300000, big=0.0025, seed=0):
+    """ write a synthetic inventory of about size measurements to path """
+    if os.path.exists(path):
+        os.remove(path)
+    source = SyntheticSource(size, seed, big)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    count = 0
+    for stand in source.stands:
+        trees = {}
+        measurements = []
+        for row, year in source.measurements(*stand):
+            trees[row[0]] = (row[0], row[1], row[2], row[3])
+            measurements.append((row[4], year, row[5], row[6]))
+        connection.executemany("INSERT INTO tp00101 VALUES (?, ?, ?, ?)",
+                               trees.values())
+        connection.executemany("INSERT INTO tp00102 VALUES (?, ?, ?, ?)",
+                               measurements)
+        count += len(measurements)
+    connection.executescript(INDEXES)
+    connection.commit()
+    connection.close()
+    return count
+
+def main(path, size=1300000):
+    start = time.time()
+    count = make_fixture(path, size)
+    print("%d measurements written to %s in %.1f s" % (count, path,
+                                                       time.time() - start))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        main(sys.argv[1], int(sys.argv[2]))
+    elif len(sys.argv) > 1:
+        main(sys.argv[1])
+    else:
+        print(__doc__)
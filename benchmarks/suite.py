@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+benchmark suite
+
+Times the equations, dispatch, output and web lookup over synthetic
+inventories of 10k, 100k and 1M trees that follow the species mix of
+bigtrees_tp001_v3.csv:
+
+    function:<name>  each species function over every dbh
+    caseof           caseof over every row
+    compute_biomass  the batch engine over every row
+    writeoutput      writeoutput to a csv in a temporary directory
+    lookup           app.lookup for a random species and dbh per row
+    index            POSTs to the index route through the test client
+
+Each case is run repeat times and the fastest kept. Results are written
+as JSON, and compared with a stored baseline: a case more than the
+tolerance slower per item than in the baseline is a regression, and the
+script exits with status 1.
+
+run from the top of the repository as
+
+        python benchmarks/suite.py [--sizes 10000 100000 1000000]
+            [--output results.json] [--baseline benchmarks/baseline.json]
+            [--tolerance 0.25] [--repeat 3]
+
+"""
+from __future__ import division, print_function
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+sys.path.insert(0, HERE)
+
+from bigtrees import biggest_trees as bt
+from synthetic import SyntheticSource
+
+DATAFILE = os.path.join(HERE, os.pardir, "TP001_jenkins.csv")
+BASELINE = os.path.join(HERE, "baseline.json")
+
+SIZES = [10000, 100000, 1000000]
+
+# the species functions, and whether each takes a stand id
+FUNCTIONS = [("segi", False), ("pisi", False), ("chno", False),
+             ("rockythpl", False), ("andrewsthpl", False),
+             ("rockypsme", False), ("abco", False), ("andrewspsme", True),
+             ("pila", False), ("tshe", True), ("abpr", False)]
+
+# form posts through the WSGI stack are slow; time this many at most
+INDEX_POSTS = 2000
+
+
+def best_of(repeat, case, *args):
+    """ the fastest of repeat runs of case(*args), in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def time_function(function, standid, dbh, stands):
+    if standid:
+        for x, stand in zip(dbh, stands):
+            function(x, stand)
+    else:
+        for x in dbh:
+            function(x)
+
+def time_caseof(rows):
+    caseof = bt.caseof
+    for row in rows:
+        caseof(row[2], row[5], row[1])
+
+def time_batch(species, dbh, studies):
+    from bigtrees.batch import compute_biomass
+    compute_biomass(species, dbh, studies)
+
+def time_writeoutput(rows, path):
+    bt.writeoutput(iter(rows), path)
+
+def time_lookup(lookup, queries):
+    for species, dbh in queries:
+        lookup(species, dbh)
+
+def time_index(client, posts):
+    for form in posts:
+        response = client.post("/", data=form)
+        assert response.status_code == 200, response.status_code
+
+def lookup_queries(count, seed=0):
+    """ species and dbh queries for the lookup, about one in ten a miss """
+    from bigtrees.tables import SPECIES
+    rng = random.Random(seed)
+    names = [name for name, _ in SPECIES]
+    queries = []
+    for _ in range(count):
+        species = rng.choice(names) if rng.random() > 0.1 else "FAKE"
+        queries.append((species, round(rng.uniform(5.0, 150.0), 1)))
+    return queries
+
+def run_size(size, repeat, workdir):
+    """ {case: result} for an inventory of size rows """
+    import app as webapp
+
+    rows = list(SyntheticSource(size).fetch())
+    dbh = [row[5] for row in rows]
+    stands = [row[1] for row in rows]
+    species = [row[2] for row in rows]
+    results = {}
+
+    def record(name, items, seconds):
+        results[name] = {"items": items, "seconds": seconds,
+                         "ns_per_item": 1e9 * seconds / items}
+        print("%8d  %-24s %10.1f ns/item" % (size, name,
+                                              1e9 * seconds / items))
+
+    for name, standid in FUNCTIONS:
+        function = getattr(bt, name)
+        record("function:" + name, size,
+               best_of(repeat, time_function, function, standid, dbh, stands))
+    record("caseof", size, best_of(repeat, time_caseof, rows))
+    record("compute_biomass", size,
+           best_of(repeat, time_batch, species, dbh, stands))
+    record("writeoutput", size,
+           best_of(repeat, time_writeoutput, rows,
+                   os.path.join(workdir, "output.csv")))
+
+    webapp.app.config["datafile"] = DATAFILE
+    webapp.app.debug = False
+    webapp.prepare()
+    queries = lookup_queries(size)
+    webapp.lookup(*queries[0])
+    record("lookup", size, best_of(repeat, time_lookup, webapp.lookup, queries))
+    posts = [{"species": s, "quantity": q}
+             for s, q in queries[:min(size, INDEX_POSTS)]]
+    record("index", len(posts),
+           best_of(repeat, time_index, webapp.app.test_client(), posts))
+    return results
+
+def environment():
+    import numpy
+    return {"python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count() or 1,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def run_suite(sizes=SIZES, repeat=3):
+    """ the suite's results for each size, with the environment """
+    workdir = tempfile.mkdtemp()
+    try:
+        results = dict((str(size), run_size(size, repeat, workdir))
+                       for size in sizes)
+    finally:
+        shutil.rmtree(workdir)
+    return {"environment": environment(), "results": results}
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    (size, case, baseline ns, ns) for every case more than tolerance
+    slower per item than in the baseline. Cases missing from either
+    are skipped.
+    """
+    regressions = []
+    for size, cases in sorted(results["results"].items()):
+        base = baseline["results"].get(size, {})
+        for case, result in sorted(cases.items()):
+            if case not in base:
+                continue
+            before = base[case]["ns_per_item"]
+            after = result["ns_per_item"]
+            if after > before * (1 + tolerance):
+                regressions.append((size, case, before, after))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="bigtrees benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results here")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="compare with these results")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="slowdown per item allowed over the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.repeat)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=1, sort_keys=True)
+
+    if not os.path.exists(args.baseline):
+        print("no baseline at %s" % args.baseline)
+        return 0
+    with open(args.baseline) as basefile:
+        regressions = compare(results, json.load(basefile), args.tolerance)
+    for size, case, before, after in regressions:
+        print("REGRESSION %s %s: %.1f -> %.1f ns/item (%+.0f%%)" %
+              (size, case, before, after, 100 * (after / before - 1)))
+    if not regressions:
+        print("no regressions against %s" % args.baseline)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
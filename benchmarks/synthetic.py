@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+synthetic inventories for benchmarks
+
+SyntheticSource generates formconnection()-shaped rows that follow the
+study, stand and species mix of bigtrees_tp001_v3.csv, scaled to any
+number of rows. Each stand is generated from its own seed, so a shard
+can be produced in a worker process without the rest, and the same
+size and seed always give the same rows.
+
+By default every tree is a big tree (dbh > 150 cm). Set big to the
+share of big trees, about 0.0025 in TP001, for a full inventory where
+the rest are drawn from a lognormal around 25 cm.
+"""
+from __future__ import division
+import os
+import csv
+import random
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def species_mix():
+    """ {(study, standid): {species: count}} from the big-tree output """
+    mix = defaultdict(lambda: defaultdict(int))
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        for study, standid, species, _, _, _, _ in reader:
+            mix[(study, standid)][species] += 1
+    return dict((stand, dict(counts)) for stand, counts in mix.items())
+
+class SyntheticSource(object):
+    """ a data source of about size rows, ordered by treeid """
+    def __init__(self, size, seed=0, big=1.0):
+        self.size = size
+        self.seed = seed
+        self.big = big
+        mix = species_mix()
+        total = sum(sum(counts.values()) for counts in mix.values())
+        self.stands = []
+        for (study, standid) in sorted(mix, key=lambda stand: stand[1]):
+            counts = mix[(study, standid)]
+            rows = int(round(size * sum(counts.values()) / total))
+            species = sorted(counts)
+            weights = [counts[s] for s in species]
+            self.stands.append((study, standid, rows, species, weights))
+
+    def measurements(self, study, standid, rows, species, weights):
+        """ (row, year) for the rows of one stand """
+        rng = random.Random("%d-%s" % (self.seed, standid))
+        count = 0
+        tree = 0
+        while count < rows:
+            tree += 1
+            treeid = "%s%09d" % (standid, tree)
+            name = rng.choices(species, weights)[0]
+            if rng.random() < self.big:
+                dbh = round(150.0 + rng.expovariate(1 / 25.0), 1)
+            else:
+                dbh = round(min(max(rng.lognormvariate(3.2, 0.7), 5.0), 150.0), 1)
+            year = rng.randint(1978, 1990)
+
+            # remeasurements repeat a tree with a growing dbh
+            for _ in range(min(rng.randint(1, 3), rows - count)):
+                yield ((treeid, study, name, standid, treeid, dbh, "1"), year)
+                dbh = round(dbh + rng.uniform(0.0, 2.0), 1)
+                year += rng.randint(4, 8)
+                count += 1
+
+    def shards(self, column):
+        index = 0 if column == "PSP_STUDYID" else 1
+        return sorted(set(stand[index] for stand in self.stands))
+
+    def fetch(self, column=None, value=None):
+        for stand in self.stands:
+            if column == "PSP_STUDYID" and stand[0] != value:
+                continue
+            if column == "STANDID" and stand[1] != value:
+                continue
+            for row, _ in self.measurements(*stand):
+                yield row
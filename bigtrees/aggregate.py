@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""Biomass Aggregation
+Totals of the per-tree output by stand, study, species and measurement,
+computed in one pass over chunks of output rows.
+
+Each chunk's key columns are coded as integers (the codes of
+columnar.Categories, and for measurement the number of a row within its
+tree), the distinct key combinations of the chunk are found with one
+np.unique of the codes packed into an int64, and every total is one
+np.bincount over the chunk's group codes. Only the running totals are
+kept, one row per group, so an inventory of millions of trees
+aggregates in the memory of its groups.
+
+Group on any of KEYS. For each group the result has
+
+    rows             output rows (tree measurements) in the group
+    dbh_mean         mean dbh, cm
+    best_total       sum of best biomass
+    jenkins_total    sum of jenkins biomass
+    difference       best_total - jenkins_total
+    difference_mean  mean of best - jenkins per row
+    ratio            best_total / jenkins_total
+
+Measurements are numbered in the order a tree's rows arrive, so the
+output must be ordered by TREEID, as every source's is. A tree's rows
+are summed under each of its measurements, so group by measurement to
+keep remeasured trees from counting more than once.
+
+for example:
+    stands = Aggregator(["psp_studyid", "standid", "measurement"])
+    writeoutput(cursor, sink=stands)
+    stands.write_csv("stands.csv")
+    aggregate_output("bigtrees_tp001_v3.csv", ["species"]).results()
+"""
+from __future__ import division
+import csv
+import numpy as np
+
+from .batch import chunked
+from .columnar import NAMES, Categories
+
+KEYS = ["psp_studyid", "standid", "species", "measurement"]
+
+TOTALS = ["rows", "dbh_mean", "best_total", "jenkins_total", "difference",
+          "difference_mean", "ratio"]
+
+
+def measurement_numbers(treeid, previous=None, seen=0):
+    """
+    the number of each row within its tree, for an array of treeids in
+    order. previous and seen are the last treeid of the chunk before and
+    how many of its rows were seen, so that numbering carries across
+    chunks.
+    """
+    index = np.arange(len(treeid))
+    new = np.empty(len(treeid), dtype=bool)
+    new[0] = treeid[0] != previous
+    new[1:] = treeid[1:] != treeid[:-1]
+    starts = np.maximum.accumulate(np.where(new, index, 0))
+    numbers = index - starts
+    if not new[0]:
+        first = np.flatnonzero(new)
+        numbers[:first[0] if len(first) else len(treeid)] += seen
+    return numbers
+
+class Aggregator(object):
+    """
+    running totals of output rows grouped by the columns in by. Has the
+    sink interface, so rows can be aggregated as they are written.
+    """
+    def __init__(self, by=("psp_studyid", "standid")):
+        by = list(by)
+        if not by or any(name not in KEYS for name in by):
+            raise ValueError("aggregate by one or more of %s" % ", ".join(KEYS))
+        self.by = by
+        self.categories = dict((name, Categories()) for name in by
+                               if name != "measurement")
+        self.groups = {}
+        self.keys = []
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.sums = dict((name, np.zeros(0)) for name in
+                         ("dbh", "best", "jenkins", "difference"))
+        self._treeid = None
+        self._seen = 0
+
+    def _numbers(self, treeid):
+        numbers = measurement_numbers(treeid, self._treeid, self._seen)
+        self._treeid = treeid[-1]
+        self._seen = int(numbers[-1]) + 1
+        return numbers
+
+    def _group_codes(self, columns):
+        """ the group of each row, adding groups not seen before """
+        codes = []
+        for name in self.by:
+            if name == "measurement":
+                codes.append(self._numbers(np.asarray(columns["treeid"])))
+            else:
+                codes.append(self.categories[name].encode(columns[name]))
+
+        # one mixed-radix integer per row, so the distinct keys are one
+        # np.unique of an int64 array
+        combined = np.zeros(len(codes[0]), dtype=np.int64)
+        radixes = []
+        for code in codes:
+            radix = int(code.max()) + 1
+            combined = combined * radix + code
+            radixes.append(radix)
+        distinct, inverse = np.unique(combined, return_inverse=True)
+
+        mapping = np.empty(len(distinct), dtype=np.int64)
+        for i, value in enumerate(distinct.tolist()):
+            key = []
+            for radix in reversed(radixes):
+                value, code = divmod(value, radix)
+                key.append(code)
+            key = tuple(reversed(key))
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = len(self.keys)
+                self.keys.append(key)
+            mapping[i] = group
+        return mapping[inverse.reshape(-1)]
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = dict(zip(NAMES, zip(*rows)))
+        groups = self._group_codes(columns)
+
+        size = len(self.keys)
+        if size > len(self.rows):
+            grow = size - len(self.rows)
+            self.rows = np.concatenate([self.rows, np.zeros(grow, np.int64)])
+            for name in self.sums:
+                self.sums[name] = np.concatenate([self.sums[name],
+                                                  np.zeros(grow)])
+
+        best = np.asarray(columns["best_biomass"], dtype=np.float64)
+        jenkins = np.asarray(columns["jenkins_biomass"], dtype=np.float64)
+        self.rows += np.bincount(groups, minlength=size)
+        for name, weights in (("dbh", columns["dbh"]), ("best", best),
+                              ("jenkins", jenkins),
+                              ("difference", best - jenkins)):
+            self.sums[name] += np.bincount(groups, weights=weights,
+                                           minlength=size)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key(self, codes):
+        """ the values of a group's key columns """
+        return tuple(code if name == "measurement" else
+                     self.categories[name].values[code]
+                     for name, code in zip(self.by, codes))
+
+    def results(self):
+        """ one dict per group, in key order, of its key and TOTALS """
+        results = []
+        for group, codes in sorted(enumerate(self.keys),
+                                   key=lambda item: self._key(item[1])):
+            rows = int(self.rows[group])
+            best = float(self.sums["best"][group])
+            jenkins = float(self.sums["jenkins"][group])
+            result = dict(zip(self.by, self._key(codes)))
+            result.update({
+                "rows": rows,
+                "dbh_mean": float(self.sums["dbh"][group]) / rows,
+                "best_total": best,
+                "jenkins_total": jenkins,
+                "difference": best - jenkins,
+                "difference_mean": float(self.sums["difference"][group]) / rows,
+                "ratio": best / jenkins if jenkins else None,
+            })
+            results.append(result)
+        return results
+
+    def write_csv(self, path):
+        """ write results() as a csv, key columns first """
+        with open(path, "w") as outfile:
+            writer = csv.writer(outfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow([name.upper() for name in self.by + TOTALS])
+            for result in self.results():
+                writer.writerow([result[name] for name in self.by + TOTALS])
+
+def aggregate_output(path, by=("psp_studyid", "standid"), chunksize=10000):
+    """ an Aggregator over an output csv, read chunksize rows at a time """
+    aggregator = Aggregator(by)
+    with open(path) as datafile:
+        reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+        next(reader)
+        for rows in chunked(reader, chunksize):
+            aggregator.write(rows)
+    return aggregator
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Vectorized Big Tree Biomass Generators
+The same equations as biggest_trees, evaluated over whole arrays of
+trees at once. Rows are grouped by species and by the registry model
+(biomass and height equation) their stand resolves to, so each model
+costs one pass of numpy ufuncs instead of one python call per tree.
+
+for example:
+    best, jenkins = compute_biomass(["PSME", "TSHE"], [154.5, 162.0],
+                                    ["HJRS", "RS28"])
+"""
+from __future__ import division
+import itertools
+import numpy as np
+
+from .registry import REGISTRY
+
+
+# jenkins group coefficients (b0, b1) and the digits each scalar function
+# rounds its jenkins biomass to
+JENKINS = {
+    "SEGI": (-2.2304, 2.4435, 4),
+    "PISI": (-2.2304, 2.4435, 4),
+    "CHNO": (-2.5384, 2.4814, 4),
+    "THPL": (-2.5384, 2.4814, 5),
+    "PSME": (-2.2304, 2.4435, 5),
+    "ABCO": (-2.5384, 2.4814, 5),
+    "ABMA": (-2.5384, 2.4814, 5),
+    "PILA": (-2.5356, 2.4349, 5),
+    "TSHE": (-2.5384, 2.4814, 5),
+    "ABPR": (-2.5384, 2.4814, 5),
+}
+
+def jenkins(species, x):
+    """ jenkins biomass for an array of dbh, rounded like the scalar functions """
+    b0, b1, digits = JENKINS[species]
+    return np.round(0.001 * np.exp(b0 + b1 * np.log1p(np.round(x, 2))), digits)
+
+def group_rows(species, standid, registry=REGISTRY):
+    """
+    group rows by the equations they use. Returns a list of (species,
+    model) keys and, for each key, the array of row indices that use it.
+
+    models come from one lookup in the registry's SelectionIndex.
+    """
+    index = registry.index
+    ids = index.resolve(species, standid)
+    sp_values, sp_inverse = np.unique(species, return_inverse=True)
+    pairs, row_keys = np.unique(sp_inverse.reshape(-1) * len(index.models) + ids,
+                                return_inverse=True)
+    row_keys = row_keys.reshape(-1)
+
+    keys = [(str(sp_values[pair // len(index.models)]),
+             index.models[pair % len(index.models)]) for pair in pairs.tolist()]
+    order = np.argsort(row_keys, kind="mergesort")
+    bounds = np.cumsum(np.bincount(row_keys, minlength=len(keys)))
+    groups = np.split(order, bounds[:-1])
+    return keys, groups
+
+def tiers(species, standid, registry=REGISTRY):
+    """ the tier code (QUALITY) of the equation each tree resolves to """
+    index = registry.index
+    return index.tiers[index.resolve(species, standid)]
+
+def compute_biomass(species, dbh, standid, registry=REGISTRY, cache=None):
+    """
+    best and jenkins biomass for arrays of species, dbh (cm) and stand id.
+    Returns two float arrays in row order; element i equals
+    caseof(species[i], dbh[i], standid[i]). With a memo.BiomassCache,
+    only the dbh values it does not hold are computed.
+    """
+    species = np.asarray(species)
+    standid = np.asarray(standid)
+    dbh = np.asarray(dbh, dtype=np.float64)
+
+    best = np.empty(dbh.shape, dtype=np.float64)
+    jenk = np.empty(dbh.shape, dtype=np.float64)
+    if dbh.size == 0:
+        return (best, jenk)
+
+    if cache is not None:
+        from .memo import cached_group
+
+    keys, groups = group_rows(species, standid, registry)
+    for (name, model), rows in zip(keys, groups):
+        x = dbh[rows]
+        if cache is not None:
+            best[rows], jenk[rows] = cached_group(name, model, x, cache)
+            continue
+        best[rows] = model(x)
+        jenk[rows] = jenkins(name, x)
+    return (best, jenk)
+
+def chunked(iterable, size):
+    """ lists of up to size consecutive items from iterable """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -36,15 +36,14 @@ dead branches, may not be explicitly included when maybe they should
    a density, and must use a proxy
 In the case of 4, 5 or 6, revisit Tier 1 and possibly step down a notch.
 """
-import csv
 import math
-import decimal 
-import matplotlib as plt
-import numpy as np
-import os
-import itertools
-import pymssql
 
+# only math is needed by the equations; numpy, the database drivers and
+# the output backends are imported by the functions that use them
+
+# stands above 1000 m elevation, where the high-elevation height
+# equations apply
+HIGH_ELEVATION_STANDS = ("RS04", "RS18", "CMNF", "RS21", "RS22", "RS23", "RS28")
 
 def drange(start, stop, step):
     """ 
@@ -339,7 +338,7 @@ def tshe(x, standid):
     """    
     woodden = 0.42
 
-    if standid in ["RS04", "RS18", "CMNF", "RS21", "RS22", "RS23", "RS28"]:
+    if standid in HIGH_ELEVATION_STANDS:
         # for elevations > 1000
         height = 1.37+57.1592*(1-math.exp(-0.023814*x))**1.5623
     else:
@@ -380,88 +379,104 @@ def abpr(x):
 
     return(biomass,jenkbio)
 
-def formconnection():
+def formconnection(column=None, value=None):
     """
     Connect to the MS SQL server and execute a query to get the data 
-    which contains trees with DBH > 200 cm.
-    """
-
-    # Connect to MSSQL Server
-    conn = pymssql.connect(server="stewartia.forestry.oregonstate.edu:1433",
-                            user="petersonf",
-                            password="D0ntd1sATLGA!!",
-                            database="FSDBDATA")
- 
-    # Create a database cursor
-    cursor = conn.cursor()
- 
-    # Replace this nonsense with your own query :)
-    query = """SELECT fsdbdata.dbo.tp00101.treeid, fsdbdata.dbo.tp00101.psp_studyid,
-            fsdbdata.dbo.tp00101.species, fsdbdata.dbo.tp00101.standid, fsdbdata.dbo.tp00102.treeid, 
-            fsdbdata.dbo.tp00102.dbh, fsdbdata.dbo.tp00102.tree_vigor FROM fsdbdata.dbo.tp00101 
-            LEFT JOIN fsdbdata.dbo.tp00102 
-            ON fsdbdata.dbo.tp00101.treeid = fsdbdata.dbo.tp00102.treeid
-            WHERE fsdbdata.dbo.tp00102.dbh > 150 
-            ORDER BY fsdbdata.dbo.tp00102.treeid ASC"""
- 
-    # Execute the query
-    cursor.execute(query)
- 
-    return cursor
+    which contains trees with DBH > 150 cm. Pass STANDID or PSP_STUDYID
+    as column and a value to get the trees of one stand or study.
+
+    The password is read from the BIGTREES_MSSQL_PASSWORD environment
+    variable. See sources.py for other filters and for the SQLite and
+    flat-file stand-ins.
+    """
+    from .sources import MSSQLSource
+
+    return MSSQLSource(min_dbh=150).fetch(column, value)
+
+def region(standid):
+    """
+    the region an equation is chosen for: the MRRS study uses the
+    rocky mountain equations, everything else the west cascades ones
+    """
+    if standid == "MRRS":
+        return "ROCKY"
+    return "WEST"
+
+def _standless(equation):
+    """
+    adapt an equation of x alone to the (x, standid) signature shared
+    by everything in EQUATIONS
+    """
+    def wrapper(x, standid):
+        return equation(x)
+    wrapper.__name__ = equation.__name__
+    wrapper.__doc__ = equation.__doc__
+    return wrapper
+
+# (species, region) -> the one equation caseof evaluates, called as
+# equation(x, standid). Built once at import so that each tree only
+# evaluates the equation it actually uses.
+EQUATIONS = {
+    ("SEGI", "WEST"): _standless(segi),
+    ("SEGI", "ROCKY"): _standless(segi),
+    ("ABPR", "WEST"): _standless(abpr),
+    ("ABPR", "ROCKY"): _standless(abpr),
+    ("CHNO", "WEST"): _standless(chno),
+    ("CHNO", "ROCKY"): _standless(chno),
+    ("PISI", "WEST"): _standless(pisi),
+    ("PISI", "ROCKY"): _standless(pisi),
+    ("PILA", "WEST"): _standless(pila),
+    ("PILA", "ROCKY"): _standless(pila),
+    ("ABCO", "WEST"): _standless(abco),
+    ("ABCO", "ROCKY"): _standless(abco),
+    ("ABMA", "WEST"): _standless(abco),
+    ("ABMA", "ROCKY"): _standless(abco),
+    ("TSHE", "WEST"): tshe,
+    ("TSHE", "ROCKY"): tshe,
+    ("PSME", "WEST"): andrewspsme,
+    ("PSME", "ROCKY"): _standless(rockypsme),
+    ("THPL", "WEST"): _standless(andrewsthpl),
+    ("THPL", "ROCKY"): _standless(rockythpl),
+}
+
+def resolve(species, standid):
+    """
+    look up the equation for a species in the region of standid.
+    Raises ValueError for a species with no equation.
+    """
+    equation = EQUATIONS.get((species, region(standid)))
+    if equation is None:
+        raise ValueError("no biomass equation for species %r" % (species,))
+    return equation
 
 def caseof(species, x, standid):
+    """
+    best and jenkins biomass for one tree, as (biomass, jenkbio)
+    """
+    return resolve(species, standid)(x, standid)
 
-    options = {"SEGI":segi(x),
-                "ABPR": abpr(x),
-                "CHNO": chno(x),
-                "PISI": pisi(x),
-                "PILA": pila(x),
-                "ABCO": abco(x),
-                "ABMA": abco(x),
-                "TSHE": tshe(x, standid),
-                "PSME": [andrewspsme(x,standid), rockypsme(x)],
-                "THPL": [andrewsthpl(x), rockythpl(x)],}
-
-    if species == "PSME":
-        if standid != "MRRS":
-            (b,b1)= options[species][0]
-        else: 
-            (b,b1) = options[species][1]
-    elif species == "THPL":
-        if standid != "MRRS":
-            (b,b1) = options[species][0]
-        else: 
-            (b,b1) = options[species][1]
-    else:
-        (b,b1) = options[species]
-    return (b,b1)
-
-def writeoutput(cursor):
-
-    # Go through the results row-by-row and write the output to a CSV file
-    # (QUOTE_NONNUMERIC applies quotes to non-numeric data; change this to
-    # QUOTE_NONE for no quotes.  See https://docs.python.org/2/library/csv.html
-    # for other settings options)
-    with open("bigtrees_tp001_v3.csv", "w") as outfile:
-        writer = csv.writer(outfile, quoting=csv.QUOTE_NONNUMERIC, delimiter = ",")
-        writer.writerow(["PSP_STUDYID", "STANDID", "SPECIES", "TREEID", "DBH", "BEST_BIOMASS", "JENKINS_BIOMASS"])
-        for row in cursor:
-            treeid = str(row[0])
-
-            species = str(row[2]).strip()
-            
-            dbh = float(row[5])
-            
-            standid = str(row[3])
-            
-            study = str(row[1])
-            
-            (biomass, jenkbio) = caseof(species, dbh, study)
-            
-            myrow = [study, standid, species, treeid, dbh, round(biomass,4), round(jenkbio,4)]
-            
-            writer.writerow(myrow)
-        #writer.writerow(row)
+def writeoutput(cursor, path="bigtrees_tp001_v3.csv", chunksize=10000,
+                sink=None, cache=None, tier=False, index=False):
+    """
+    Compute biomass for every row of the cursor and write the results.
+
+    Rows are fetched chunksize at a time and computed as a batch, and
+    each chunk is written in one go, so memory stays constant however
+    many rows the cursor has. By default the output is a CSV file at
+    path; pass any object with write(rows) as sink to send it elsewhere.
+    A memo.BiomassCache as cache skips recomputing repeated dbh values,
+    and tier=True adds a TIER column of each equation's tier code.
+    index=True also writes a TREEID index of the file beside it (see
+    treeindex). Returns the number of rows written.
+    """
+    from .pipeline import CSVSink, HEADER, TIER_HEADER, run
+
+    if sink is not None:
+        return run(cursor, sink, chunksize, cache=cache, tier=tier)
+    if index:
+        from .treeindex import IndexedCSVSink as CSVSink
+    with CSVSink(path, TIER_HEADER if tier else HEADER) as sink:
+        return run(cursor, sink, chunksize, cache=cache, tier=tier)
 
 # c = formconnection()
 # writeoutput(c)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""Allometry Charts
+Best and Jenkins biomass curves of one or more species over a range of
+dbh, drawn server-side as PNG or SVG. Figures are drawn straight on
+matplotlib's non-interactive Agg canvas, without pyplot, so no display
+or global backend is needed and threads do not share figure state.
+
+The curves of every species come from one batch.compute_biomass call
+over POINTS evenly spaced dbh values each, with equations chosen for
+standid as in the output.
+
+A chart is identified by its species, stand, dbh range and format and
+by the equation version of each species (incremental.species_version),
+so its ETag changes whenever the coefficients it was drawn from do.
+Charts keeps the most recently drawn images by that key, and can give
+the ETag of a chart without drawing it.
+
+for example:
+    charts = Charts()
+    etag, image = charts.get(["PSME", "TSHE"], 5.0, 150.0, format="svg")
+"""
+from __future__ import division
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+try:
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+except ImportError:
+    matplotlib = None
+
+from .batch import compute_biomass
+from .incremental import species_version
+from .registry import REGISTRY
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# dbh values each curve is evaluated at
+POINTS = 200
+
+# the stand equations are chosen for when none is given
+STANDID = "HJRS"
+
+# images kept before the least recently used is dropped
+MAXSIZE = 64
+
+# no creation date or random ids, so a chart is drawn the same each time
+METADATA = {"png": {"Software": None}, "svg": {"Date": None}}
+
+
+def curves(species, low, high, standid=STANDID, points=POINTS,
+           registry=REGISTRY):
+    """
+    the dbh values from low to high (cm) and, per species, the (best,
+    jenkins) biomass arrays over them. Raises ValueError for a species
+    with no equation.
+    """
+    dbh = np.linspace(low, high, points)
+    best, jenk = compute_biomass(np.repeat(species, points),
+                                 np.tile(dbh, len(species)),
+                                 np.repeat(standid, points * len(species)),
+                                 registry)
+    return dbh, [(name, best[i * points:(i + 1) * points],
+                  jenk[i * points:(i + 1) * points])
+                 for i, name in enumerate(species)]
+
+def draw(species, low, high, standid=STANDID, format="png",
+         registry=REGISTRY):
+    """ the png or svg image bytes of the curves of species """
+    if matplotlib is None:
+        raise ImportError("charts need matplotlib")
+    dbh, lines = curves(species, low, high, standid, registry=registry)
+    figure = Figure(figsize=(8, 5))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+    for i, (name, best, jenk) in enumerate(lines):
+        color = "C%d" % (i % 10)
+        axes.plot(dbh, best, color=color, label="%s best" % name)
+        axes.plot(dbh, jenk, color=color, linestyle="--",
+                  label="%s jenkins" % name)
+    axes.set_xlim(low, high)
+    axes.set_xlabel("dbh (cm)")
+    axes.set_ylabel("biomass (Mg)")
+    axes.set_title("%s at %s" % (", ".join(species), standid))
+    axes.grid(True, alpha=0.3)
+    axes.legend(loc="upper left", fontsize="small")
+    buf = io.BytesIO()
+    with matplotlib.rc_context({"svg.hashsalt": "bigtrees"}):
+        figure.savefig(buf, format=format, metadata=METADATA[format])
+    return buf.getvalue()
+
+class Charts(object):
+    """
+    rendered charts by (species, stand, range, format, equation
+    versions), evicting the least recently used beyond maxsize. hits and
+    misses count get() calls. It may be shared by threads.
+    """
+    def __init__(self, maxsize=MAXSIZE, registry=REGISTRY):
+        self.maxsize = maxsize
+        self.registry = registry
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, species, low, high, standid=STANDID, format="png"):
+        """
+        the cache key of a chart. Raises ValueError for an unknown
+        format or species.
+        """
+        if format not in FORMATS:
+            raise ValueError("format must be one of %s" %
+                             ", ".join(sorted(FORMATS)))
+        for name in species:
+            # raises ValueError for a species with no equation
+            self.registry.model(name, standid)
+        versions = tuple(species_version(name, self.registry)
+                         for name in species)
+        return (tuple(species), standid, float(low), float(high), format,
+                versions)
+
+    def etag(self, species, low, high, standid=STANDID, format="png"):
+        """ the ETag of a chart, without drawing it """
+        return self._etag(self.key(species, low, high, standid, format))
+
+    def _etag(self, key):
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, species, low, high, standid=STANDID, format="png"):
+        """ (etag, image bytes) of a chart, drawn if it is not held """
+        key = self.key(species, low, high, standid, format)
+        with self._lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self._etag(key), image
+            self.misses += 1
+
+        image = draw(species, low, high, standid, format, self.registry)
+        with self._lock:
+            self.entries[key] = image
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return self._etag(key), image
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+"""Command Line
+The bigtrees console script.
+
+    bigtrees compute SOURCE [-o OUTPUT]   biomass for an inventory
+    bigtrees growth SOURCE [-o OUTPUT]    growth between measurements
+    bigtrees index OUTPUT                 the TREEID index of an output
+    bigtrees build-table [-o OUTPUT]      the Jenkins lookup table
+    bigtrees build-table --compile CSV    the binary table of a csv table
+    bigtrees serve [--root CHECKOUT]      the web app of a checkout
+    bigtrees bench [--rows ROWS]          pipeline throughput
+
+SOURCE is "mssql" for the FSDB server, or the path of a SQLite copy of
+the inventory tables (.db, .sqlite) or of a flat csv. Each subcommand
+imports what it needs when it runs, so the script starts in a fraction
+of the time numpy and the database drivers take to load.
+
+for example:
+    bigtrees compute inventory.db -o bigtrees_tp001_v3.csv --workers 4
+"""
+from __future__ import division, print_function
+import os
+import sys
+import time
+import argparse
+
+SOURCE_HELP = "mssql, or a SQLite (.db, .sqlite) or csv inventory file"
+SQLITE = (".db", ".sqlite", ".sqlite3")
+
+
+def open_source(name, min_dbh=150, species=None, standids=None):
+    """ the data source a SOURCE argument names """
+    from . import sources
+
+    if name == "mssql":
+        return sources.MSSQLSource(min_dbh, species, standids)
+    if name.lower().endswith(SQLITE):
+        return sources.SQLiteSource(name, min_dbh, species, standids)
+    if name.lower().endswith(".csv"):
+        return sources.FileSource(name, min_dbh, species, standids)
+    raise ValueError("unknown source %r: use %s" % (name, SOURCE_HELP))
+
+def output_sink(path, form, tier=False, index=False):
+    """
+    the sink for an output path in form csv, npy or parquet; with index,
+    a csv sink that also writes the TREEID index
+    """
+    if form == "npy":
+        from .columnar import ColumnarSink
+        return ColumnarSink(path)
+    if form == "parquet":
+        from .columnar import ParquetSink
+        return ParquetSink(path)
+    from .pipeline import CSVSink, HEADER, TIER_HEADER
+    if index:
+        from .treeindex import IndexedCSVSink as CSVSink
+    return CSVSink(path, TIER_HEADER if tier else HEADER)
+
+def compute(args):
+    from .pipeline import run
+
+    source = open_source(args.source, args.min_dbh, args.species, args.stands)
+    start = time.time()
+    if args.workers:
+        if args.format != "csv" or args.tiers:
+            raise ValueError("--workers writes csv output without tiers only")
+        from .parallel import parallel_run
+        count = parallel_run(source, args.output, args.shard, args.workers,
+                             args.chunksize)
+        if args.index:
+            from .treeindex import build_index
+            build_index(args.output)
+    else:
+        if (args.tiers or args.index) and args.format != "csv":
+            raise ValueError("--tiers and --index write csv output only")
+        with output_sink(args.output, args.format, args.tiers,
+                         args.index) as sink:
+            count = run(source.fetch(), sink, args.chunksize, tier=args.tiers)
+    print("%d rows to %s in %.1f s" % (count, args.output, time.time() - start))
+
+def growth(args):
+    from .growth import GROWTH_HEADER, run_growth
+    from .pipeline import CSVSink
+
+    source = open_source(args.source, args.min_dbh, args.species, args.stands)
+    start = time.time()
+    with CSVSink(args.output, GROWTH_HEADER) as sink:
+        count = run_growth(source.series(), sink, args.chunksize)
+    print("%d rows to %s in %.1f s" % (count, args.output, time.time() - start))
+
+def index(args):
+    from .treeindex import build_index, index_path
+
+    start = time.time()
+    count = build_index(args.output)
+    print("%d trees to %s in %.1f s" % (count, index_path(args.output),
+                                        time.time() - start))
+
+def build_table(args):
+    from .lookup import binary_path, compile_table
+    from .tables import write_csv, write_jkt
+
+    if args.compile:
+        binary = args.binary or binary_path(args.compile)
+        compile_table(args.compile, binary)
+        print("%s compiled to %s" % (args.compile, binary))
+        return
+    count = write_csv(args.output)
+    print("%d values to %s" % (count, args.output))
+    if args.binary:
+        write_jkt(args.binary)
+        print("%d values to %s" % (count, args.binary))
+
+def serve(args):
+    # app.py, templates/ and static/ live at the top of a checkout and
+    # are not installed with the package
+    root = os.path.abspath(args.root)
+    if not os.path.exists(os.path.join(root, "app.py")):
+        raise ValueError("serve needs a checkout of bigtrees: no app.py in "
+                         "%s (run it from the checkout or pass --root)" % root)
+    sys.path.insert(0, root)
+    try:
+        from app import app, prepare
+    except ImportError as exc:
+        raise ValueError("cannot load the web app in %s: %s" % (root, exc))
+    # the app's own paths are relative to the checkout, not to where
+    # serve was run
+    for key in ("datafile", "output", "inventory"):
+        path = app.config.get(key)
+        if path and path != "mssql" and not os.path.isabs(path):
+            app.config[key] = os.path.join(root, path)
+    if args.datafile:
+        app.config["datafile"] = os.path.abspath(args.datafile)
+    prepare()
+    app.debug = args.debug
+    app.run(host=args.host, port=args.port)
+
+def bench_rows(count, seed=0):
+    """ count formconnection()-shaped big-tree rows of random species """
+    import random
+    from .batch import JENKINS
+
+    rng = random.Random(seed)
+    species = sorted(JENKINS)
+    studies = ["MRRS", "HJRS", "AV06", "RS28", "TO11"]
+    for i in range(count):
+        treeid = "BENCH%08d" % i
+        yield (treeid, rng.choice(studies), rng.choice(species), "BN01",
+               treeid, round(150.0 + rng.expovariate(1 / 25.0), 1), "1")
+
+def bench(args):
+    import shutil
+    import tempfile
+    from .pipeline import CSVSink, run
+
+    rows = list(bench_rows(args.rows))
+    workdir = tempfile.mkdtemp()
+    try:
+        with CSVSink(os.path.join(workdir, "bench.csv")) as sink:
+            start = time.time()
+            run(iter(rows), sink, args.chunksize)
+            elapsed = time.time() - start
+    finally:
+        shutil.rmtree(workdir)
+    print("%d rows in %.2f s: %.0f rows/s" % (args.rows, elapsed,
+                                              args.rows / elapsed))
+
+def parser():
+    main = argparse.ArgumentParser(prog="bigtrees",
+                                   description="big tree biomass")
+    commands = main.add_subparsers(dest="command")
+    commands.required = True
+
+    p = commands.add_parser("compute", help="biomass for an inventory")
+    p.add_argument("source", help=SOURCE_HELP)
+    p.add_argument("-o", "--output", default="bigtrees_tp001_v3.csv")
+    p.add_argument("--format", choices=["csv", "npy", "parquet"],
+                   default="csv")
+    p.add_argument("--min-dbh", type=float, default=150)
+    p.add_argument("--species", nargs="+")
+    p.add_argument("--stands", nargs="+")
+    p.add_argument("--chunksize", type=int, default=10000)
+    p.add_argument("--workers", type=int,
+                   help="run shards in this many processes")
+    p.add_argument("--shard", choices=["STANDID", "PSP_STUDYID"],
+                   default="STANDID")
+    p.add_argument("--tiers", action="store_true",
+                   help="add the tier code of each row's equation")
+    p.add_argument("--index", action="store_true",
+                   help="also write the TREEID index of the output")
+    p.set_defaults(func=compute)
+
+    p = commands.add_parser("growth", help="growth between measurements")
+    p.add_argument("source", help=SOURCE_HELP + " with measurement years")
+    p.add_argument("-o", "--output", default="bigtrees_growth.csv")
+    p.add_argument("--min-dbh", type=float, default=150,
+                   help="only trees with a measurement over this dbh; "
+                        "all of their measurements are kept")
+    p.add_argument("--species", nargs="+")
+    p.add_argument("--stands", nargs="+")
+    p.add_argument("--chunksize", type=int, default=10000)
+    p.set_defaults(func=growth)
+
+    p = commands.add_parser("index", help="the TREEID index of an output")
+    p.add_argument("output", help="an output csv")
+    p.set_defaults(func=index)
+
+    p = commands.add_parser("build-table", help="the Jenkins lookup table")
+    p.add_argument("-o", "--output", default="TP001_jenkins.csv")
+    p.add_argument("--binary", help="also write a binary (.jkt) table here")
+    p.add_argument("--compile", metavar="CSV",
+                   help="instead, compile an existing csv table to a binary "
+                        "table (beside it, or at --binary)")
+    p.set_defaults(func=build_table)
+
+    p = commands.add_parser("serve", help="the web app")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=7000)
+    p.add_argument("--datafile", help="the Jenkins table to serve")
+    p.add_argument("--root", default=".",
+                   help="the checkout that holds app.py (this directory)")
+    p.add_argument("--debug", action="store_true")
+    p.set_defaults(func=serve)
+
+    p = commands.add_parser("bench", help="pipeline throughput")
+    p.add_argument("--rows", type=int, default=100000)
+    p.add_argument("--chunksize", type=int, default=10000)
+    p.set_defaults(func=bench)
+    return main
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    try:
+        args.func(args)
+    except ValueError as exc:
+        print("bigtrees: %s" % exc, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
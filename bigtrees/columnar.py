@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""Columnar Output
+Binary sinks for the output pipeline, and a loader for what they write.
+
+ColumnarSink writes one structured .npy file of fixed-width records,
+
+    psp_studyid, standid, species  categorical codes (uint16)
+    treeid                         categorical codes (uint32)
+    dbh, best_biomass, jenkins_biomass  float64
+
+with the categories of each coded column in a .json file beside it.
+load_columns() memory-maps the .npy, so opening a multi-million-row
+result costs a header read, and each column is a zero-copy view.
+
+ParquetSink writes the same columns, dictionary-encoded, to a Parquet
+file when pyarrow is installed. pyarrow is imported only when one is
+made, so loading this module (as the web app does) stays cheap.
+
+for example:
+    writeoutput(cursor, sink=ColumnarSink("bigtrees_tp001_v3.npy"))
+    columns = load_columns("bigtrees_tp001_v3.npy")
+    columns["best_biomass"][columns.mask("species", "PSME")].sum()
+"""
+from __future__ import division
+import json
+import struct
+import numpy as np
+
+from .pipeline import HEADER
+
+# the output columns, named as in HEADER
+NAMES = [name.lower() for name in HEADER]
+
+CATEGORICAL = NAMES[:4]
+
+DTYPE = np.dtype(list(zip(NAMES, ["<u2", "<u2", "<u2", "<u4",
+                                  "<f8", "<f8", "<f8"])))
+
+# bytes reserved for the .npy header, so it can be rewritten in place
+# with the final row count when the sink is closed
+HEADER_SIZE = 512
+
+
+def npy_header(dtype, length, size=HEADER_SIZE):
+    """ a version 1.0 .npy header for length records, padded to size bytes """
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype),
+                   "fortran_order": False, "shape": (length,)})
+    header = header.ljust(size - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + \
+        header.encode("latin1")
+
+def categories_path(path):
+    """ where the categories of the columnar file at path are kept """
+    if path.endswith(".npy"):
+        path = path[:-4]
+    return path + ".json"
+
+class Categories(object):
+    """ codes for the distinct values of a column, in order of first use """
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = dict((value, i) for i, value in enumerate(self.values))
+
+    def encode(self, values, strip=False, limit=None):
+        """
+        codes for an array of values, adding any new ones. Each distinct
+        value is converted to str (and stripped) once. Raises ValueError
+        if there would be more than limit values.
+        """
+        distinct, inverse = np.unique(
+            np.asarray(values, dtype=object).astype(str), return_inverse=True)
+        mapping = np.empty(len(distinct), dtype=np.int64)
+        for i, value in enumerate(distinct.tolist()):
+            if strip:
+                value = value.strip()
+            code = self.codes.get(value)
+            if code is None:
+                if limit is not None and len(self.values) >= limit:
+                    raise ValueError("more than %d distinct values" % limit)
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            mapping[i] = code
+        return mapping[inverse.reshape(-1)]
+
+def encode_column(categories, name, values, dtype, strip=False):
+    """
+    codes for the values of column name in categories, as dtype. Raises
+    ValueError rather than wrap when they outgrow it.
+    """
+    try:
+        return categories.encode(values, strip, np.iinfo(dtype).max + 1)
+    except ValueError as exc:
+        raise ValueError("%s: %s for %s codes" % (name, exc, dtype))
+
+class ColumnarSink(object):
+    """ writes output rows to a structured .npy file, one chunk at a time """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.categories = dict((name, Categories()) for name in CATEGORICAL)
+        self.outfile = open(path, "wb")
+        self.outfile.write(npy_header(DTYPE, 0))
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        records = np.empty(len(rows), dtype=DTYPE)
+        for name, values in zip(NAMES, columns):
+            if name in CATEGORICAL:
+                values = encode_column(self.categories[name], name, values,
+                                       DTYPE[name])
+            records[name] = values
+        self.outfile.write(records.tobytes())
+        self.count += len(rows)
+
+    def close(self):
+        self.outfile.seek(0)
+        self.outfile.write(npy_header(DTYPE, self.count))
+        self.outfile.close()
+        with open(categories_path(self.path), "w") as catfile:
+            json.dump(dict((name, self.categories[name].values)
+                           for name in CATEGORICAL), catfile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ParquetSink(object):
+    """
+    writes output rows to a Parquet file, one row group per chunk, with
+    the categorical columns dictionary-encoded. Needs pyarrow.
+    """
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetSink needs pyarrow")
+        self.pyarrow = pyarrow
+        self.path = path
+        self.schema = pyarrow.schema(
+            [(name, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()))
+             for name in CATEGORICAL] +
+            [(name, pyarrow.float64())
+             for name in NAMES[4:]])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        pyarrow = self.pyarrow
+        columns = list(zip(*rows))
+        arrays = [pyarrow.array(values).dictionary_encode()
+                  for values in columns[:4]]
+        arrays += [pyarrow.array(values, type=pyarrow.float64())
+                   for values in columns[4:]]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays,
+                                                          schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Columns(object):
+    """
+    a memory-mapped columnar output. columns[name] is the array of a
+    column (codes, for the categorical ones); decode(name) gives the
+    values, and mask(name, value) selects the rows with that value.
+    """
+    def __init__(self, records, categories):
+        self.records = records
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, name):
+        return self.records[name]
+
+    def decode(self, name):
+        return np.asarray(self.categories[name])[self.records[name]]
+
+    def mask(self, name, value):
+        try:
+            code = self.categories[name].index(value)
+        except ValueError:
+            return np.zeros(len(self.records), dtype=bool)
+        return self.records[name] == code
+
+def load_columns(path):
+    """ open a ColumnarSink file without reading its data """
+    with open(categories_path(path)) as catfile:
+        categories = json.load(catfile)
+    return Columns(np.load(path, mmap_mode="r"), categories)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Growth Time Series
+Biomass growth between the measurements of each tree. Rows come from a
+source's series(), in the shape of formconnection() rows with the
+measurement year in place of the measurement treeid:
+
+    (treeid, psp_studyid, species, standid, year, dbh, tree_vigor)
+
+grouped by treeid, as every source orders them. Chunks are cut on tree
+boundaries, so a tree's measurements are always computed together.
+Each chunk is sorted by (treeid, year) with one np.lexsort, biomass is
+computed for every measurement as one batch, and the intervals between
+a tree's measurements are np.diff of the sorted columns, masked where a
+new tree starts. No Python loop runs per tree, and only a chunk of rows
+is held at a time.
+
+Each output row is one measurement, in GROWTH_HEADER order. The
+interval columns describe the growth since the tree's measurement
+before, and are empty for its first:
+
+    YEARS                 years since the measurement before
+    DBH_INCREMENT         change in dbh, cm
+    BIOMASS_INCREMENT     change in best biomass
+    GROWTH_RATE           BIOMASS_INCREMENT per year
+    RELATIVE_GROWTH_RATE  log(best biomass / best biomass before) per year
+
+for example:
+    source = SQLiteSource("inventory.db")
+    with CSVSink("growth.csv", GROWTH_HEADER) as sink:
+        run_growth(source.series(), sink)
+"""
+from __future__ import division
+import numpy as np
+
+from .batch import compute_biomass
+from .pipeline import CHUNKSIZE, fetch_chunks
+
+GROWTH_HEADER = ["PSP_STUDYID", "STANDID", "SPECIES", "TREEID", "YEAR",
+                 "DBH", "BEST_BIOMASS", "JENKINS_BIOMASS", "YEARS",
+                 "DBH_INCREMENT", "BIOMASS_INCREMENT", "GROWTH_RATE",
+                 "RELATIVE_GROWTH_RATE"]
+
+
+def tree_chunks(chunks):
+    """
+    chunks of rows cut on tree boundaries: the rows of the last tree of
+    each chunk are held back and start the next one
+    """
+    carry = []
+    for chunk in chunks:
+        rows = carry + list(chunk)
+        last = str(rows[-1][0])
+        cut = len(rows)
+        while cut > 0 and str(rows[cut - 1][0]) == last:
+            cut -= 1
+        carry = rows[cut:]
+        if cut:
+            yield rows[:cut]
+    if carry:
+        yield carry
+
+def _year(value):
+    return np.nan if value is None or value == "" else float(value)
+
+def intervals(treeid, year, dbh, best):
+    """
+    (years, dbh increment, biomass increment, growth rate, relative
+    growth rate) arrays for measurements sorted by (treeid, year), NaN
+    for each tree's first measurement and rates NaN for zero intervals
+    """
+    first = np.ones(len(treeid), dtype=bool)
+    first[1:] = treeid[1:] != treeid[:-1]
+
+    years = np.full(len(treeid), np.nan)
+    grown = np.full(len(treeid), np.nan)
+    increment = np.full(len(treeid), np.nan)
+    years[1:] = np.diff(year)
+    grown[1:] = np.diff(dbh)
+    increment[1:] = np.diff(best)
+    years[first] = grown[first] = increment[first] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        span = np.where(years > 0, years, np.nan)
+        rate = increment / span
+        relative = np.full(len(treeid), np.nan)
+        relative[1:] = np.log(best[1:] / best[:-1])
+        relative /= span
+    relative[~np.isfinite(relative)] = np.nan
+    return years, grown, increment, rate, relative
+
+def _values(column, digits=4):
+    """ a column as rounded floats, with None for NaN """
+    return [None if v != v else v
+            for v in np.round(column, digits).tolist()]
+
+def growth_rows(chunk, cache=None):
+    """
+    output rows, in GROWTH_HEADER order, for a chunk of series() rows
+    holding every measurement of its trees
+    """
+    treeid = np.array([str(row[0]) for row in chunk])
+    year = np.array([_year(row[4]) for row in chunk])
+    order = np.lexsort((year, treeid))
+    chunk = [chunk[i] for i in order.tolist()]
+    treeid = treeid[order]
+    year = year[order]
+    study = [str(row[1]) for row in chunk]
+    species = [str(row[2]).strip() for row in chunk]
+    standid = [str(row[3]) for row in chunk]
+    dbh = np.array([float(row[5]) for row in chunk])
+
+    # as in the output, the study id chooses the equations
+    best, jenk = compute_biomass(species, dbh, study, cache=cache)
+    columns = intervals(treeid, year, dbh, best)
+
+    years = [None if y != y else int(y) for y in year.tolist()]
+    return [list(row) for row in
+            zip(study, standid, species, treeid.tolist(), years,
+                dbh.tolist(), [round(b, 4) for b in best.tolist()],
+                [round(b1, 4) for b1 in jenk.tolist()],
+                _values(columns[0], 1), _values(columns[1], 1),
+                *[_values(column) for column in columns[2:]])]
+
+def run_growth(cursor, sink, chunksize=CHUNKSIZE, cache=None):
+    """
+    compute growth for every series() row of cursor into sink, any
+    object with a write(rows) method. Returns the number of rows.
+    """
+    count = 0
+    for chunk in tree_chunks(fetch_chunks(cursor, chunksize)):
+        rows = growth_rows(chunk, cache)
+        sink.write(rows)
+        count += len(rows)
+    return count
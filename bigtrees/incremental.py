@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""Incremental Recomputation
+Refreshes an output CSV from its data source, computing only the
+measurements that are new or changed since the previous run.
+
+Beside the output, a manifest records for each output row
+
+    TREEID, OCCURRENCE, DBH, VERSION
+
+where OCCURRENCE tells apart the rows of a tree with the same DBH (0
+for the first) and VERSION is a hash of the equations the row was
+computed with and of the species, study and stand that chose them. An
+output line depends on nothing else, so on the next run a source row
+whose (TREEID, DBH, OCCURRENCE) is in the manifest with the same
+VERSION keeps its previous output line, and only the rest go through
+the batch engine. Recalibrating one species' equations therefore
+recomputes only that species.
+
+Both the source and the previous output must be ordered by TREEID, as
+every data source in sources.py is, and are merge-joined a tree at a
+time. The order of a tree's rows does not matter: the sources order
+only by treeid, and a tree whose rows come back in another order is
+still matched row for row.
+
+for example:
+    stats = incremental_run(SQLiteSource("inventory.db").fetch(),
+                            "bigtrees_tp001_v3.csv")
+"""
+from __future__ import division
+import io
+import os
+import csv
+import hashlib
+import itertools
+
+from .batch import JENKINS
+from .pipeline import CHUNKSIZE, HEADER, biomass_rows, fetch_chunks
+from .registry import PROXIES, REGISTRY
+
+MANIFEST = ["TREEID", "OCCURRENCE", "DBH", "VERSION"]
+
+
+def manifest_path(path):
+    """ where the manifest of the output at path is kept """
+    return path + ".manifest"
+
+def species_version(species, registry=REGISTRY):
+    """ a hash of every coefficient used for a species """
+    source = PROXIES.get(species, species)
+    equations = sorted(
+        (e.key, e.form, e.b0, e.b1, e.b2, e.baskerville, e.woodden)
+        for e in registry.equations if e.species == source)
+    return hashlib.sha1(repr((equations, JENKINS.get(species))).encode(
+        "utf-8")).hexdigest()
+
+class Versions(object):
+    """ the VERSION of rows, cached per species, study and stand """
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.cache = {}
+
+    def __call__(self, species, study, standid):
+        key = (species, study, standid)
+        version = self.cache.get(key)
+        if version is None:
+            text = repr((species_version(species, self.registry),) + key)
+            version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+            self.cache[key] = version
+        return version
+
+def source_trees(cursor, chunksize=CHUNKSIZE):
+    """ (treeid, rows) for every tree of cursor """
+    rows = itertools.chain.from_iterable(fetch_chunks(cursor, chunksize))
+    for treeid, tree in itertools.groupby(rows, lambda row: str(row[0])):
+        yield treeid, list(tree)
+
+def previous_rows(path):
+    """
+    (treeid, occurrence, dbh, version, line) for each row of a previous
+    output and its manifest; nothing if either is missing
+    """
+    if not (os.path.exists(path) and os.path.exists(manifest_path(path))):
+        return
+    with io.open(path, newline="") as output:
+        with io.open(manifest_path(path), newline="") as manifest:
+            next(output)
+            reader = csv.reader(manifest)
+            next(reader)
+            for line, (treeid, occurrence, dbh, version) in zip(output, reader):
+                yield treeid, int(occurrence), float(dbh), version, line
+
+def previous_trees(path):
+    """
+    (treeid, {(dbh, occurrence): (version, line)}) for each tree of a
+    previous output
+    """
+    for treeid, rows in itertools.groupby(previous_rows(path),
+                                          lambda row: row[0]):
+        yield treeid, dict(((dbh, occurrence), (version, line))
+                           for _, occurrence, dbh, version, line in rows)
+
+def incremental_run(cursor, path, chunksize=CHUNKSIZE, registry=REGISTRY):
+    """
+    bring the output at path up to date with the rows of cursor,
+    reusing the unchanged rows of the previous output. Writes the output
+    and its manifest, then returns counts of the rows reused, computed
+    and dropped.
+    """
+    versions = Versions(registry)
+    stats = {"reused": 0, "computed": 0, "dropped": 0}
+    previous = previous_trees(path)
+    last = next(previous, None)
+
+    new_path = path + ".new"
+    new_manifest = manifest_path(path) + ".new"
+    with open(new_path, "w") as outfile:
+        with open(new_manifest, "w") as manifest:
+            writer = csv.writer(outfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(HEADER)
+            manifest_writer = csv.writer(manifest)
+            manifest_writer.writerow(MANIFEST)
+
+            window = []
+            for treeid, rows in source_trees(cursor, chunksize):
+                # drop previous trees that are no longer in the source
+                while last is not None and last[0] < treeid:
+                    stats["dropped"] += len(last[1])
+                    last = next(previous, None)
+                kept = {}
+                if last is not None and last[0] == treeid:
+                    kept = last[1]
+                    last = next(previous, None)
+                stats["dropped"] += max(len(kept) - len(rows), 0)
+
+                counts = {}
+                for row in rows:
+                    dbh = float(row[5])
+                    occurrence = counts.get(dbh, 0)
+                    counts[dbh] = occurrence + 1
+                    version = versions(str(row[2]).strip(), str(row[1]),
+                                       str(row[3]))
+                    found = kept.get((dbh, occurrence))
+                    line = found[1] if found and found[0] == version else None
+                    window.append((treeid, occurrence, dbh, version, line,
+                                   row))
+
+                if len(window) >= chunksize:
+                    _flush(window, outfile, writer, manifest_writer, stats,
+                           registry)
+                    window = []
+            _flush(window, outfile, writer, manifest_writer, stats, registry)
+
+    while last is not None:
+        stats["dropped"] += len(last[1])
+        last = next(previous, None)
+
+    os.rename(new_path, path)
+    os.rename(new_manifest, manifest_path(path))
+    return stats
+
+def _flush(window, outfile, writer, manifest_writer, stats, registry):
+    """ compute the changed rows of a window as one batch and write it all """
+    computed = iter(biomass_rows([row for _, _, _, _, line, row in window
+                                  if line is None], registry=registry))
+    for treeid, occurrence, dbh, version, line, row in window:
+        if line is None:
+            writer.writerow(next(computed))
+            stats["computed"] += 1
+        else:
+            outfile.write(line)
+            stats["reused"] += 1
+        manifest_writer.writerow([treeid, occurrence, repr(dbh), version])
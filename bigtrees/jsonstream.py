@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Streaming JSON Readers
+Read records one at a time from a file-like object holding either a
+JSON array of objects or newline-delimited JSON (one object per line),
+so that a body of any size is parsed in bounded memory.
+
+for example:
+    for record in iter_ndjson(request.stream):
+        ...
+"""
+import json
+import codecs
+
+
+def iter_ndjson(stream):
+    """ objects from a stream of newline-delimited JSON; blank lines skipped """
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_json_array(stream, chunksize=65536):
+    """
+    the items of a JSON array, decoded one at a time while the stream
+    is read in chunks of chunksize. Raises ValueError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+    state = "open"
+
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError("unexpected end of JSON array")
+            chunk = stream.read(chunksize)
+            eof = not chunk
+            if isinstance(chunk, bytes):
+                chunk = utf8.decode(chunk, eof)
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+
+        char = buf[pos]
+        if state == "open":
+            if char != "[":
+                raise ValueError("expected a JSON array")
+            pos += 1
+            state = "first"
+        elif state in ("first", "next") and char == "]":
+            return
+        elif state == "next":
+            if char != ",":
+                raise ValueError("expected ',' or ']' at character %d" % pos)
+            pos += 1
+            state = "item"
+        else:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # the item may continue past the end of the buffer
+                if eof:
+                    raise
+                chunk = stream.read(chunksize)
+                eof = not chunk
+                if isinstance(chunk, bytes):
+                    chunk = utf8.decode(chunk, eof)
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            pos = end
+            state = "next"
+            yield item
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+
+"""Jenkins Lookup Table
+Holds a precomputed table such as TP001_jenkins.csv in memory, keyed by
+species and integer tenths of a centimetre, so a lookup is one dict
+probe instead of a scan of the file. The table is re-read when the
+file's modification time changes.
+
+The same table can be compiled to a binary file that web workers
+memory-map, so they share one copy in the page cache and a lookup is
+one offset computation. The file is
+
+    header  64 bytes: magic "BTJK", version (uint16), digits (uint16),
+            species count (uint32), offset of the values (uint64)
+    index   32 bytes per species: code (16 bytes, NUL-padded), first
+            dbh in tenths (uint32), dbh count (uint32), offset of its
+            first value in the value array (uint64)
+    values  float32, one per species and dbh tenth, NaN where the
+            table has no value
+
+all little-endian. A value is returned rounded to the table's digits,
+which gives back the string found in the csv.
+
+A BinaryTable made with build=False, as the web app's is, never
+compiles its csv in the caller's thread. When the csv changes it keeps
+answering from the table it has mapped while a background thread
+compiles the new one, which it maps once written. Only a binary table
+that is missing altogether raises StaleTable; the app compiles it when
+it starts, and bigtrees build-table --compile compiles it for any other
+server.
+
+Besides exact lookups, a BinaryTable answers queries between and beyond
+the table's dbh values from a sorted array of the dbh tenths each
+species has a value for, searched with bisect:
+
+    nearest      the value at the table dbh closest to dbh
+    interpolate  the straight line between the values either side of dbh
+    curve        every (dbh, value) from low to high
+
+each O(log n) in the table's dbh values (curve, plus its output).
+
+for example:
+    table = JenkinsTable("TP001_jenkins.csv")
+    table.lookup("QUKE", 73.5)   # "4.82057"
+    binary_table("TP001_jenkins.csv").lookup("QUKE", 73.5)   # "4.82057"
+    binary_table("TP001_jenkins.csv").find("QUKE", 73.54, "interpolate")
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import math
+import mmap
+import array
+import bisect
+import struct
+import time
+import tempfile
+import threading
+from collections import defaultdict
+
+MAGIC = b"BTJK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQ")
+HEADER_SIZE = 64
+ENTRY = struct.Struct("<16sIIQ")
+VALUE = struct.Struct("<f")
+
+# lookup modes of BinaryTable.find
+MODES = ("exact", "nearest", "interpolate")
+
+
+class StaleTable(ValueError):
+    """ a binary table is missing and is not compiled by the caller """
+
+
+def binary_path(path):
+    """ where the binary table of a csv table is kept """
+    return os.path.splitext(path)[0] + ".jkt"
+
+def publish(temp, path):
+    """
+    rename the finished file temp to path, readable by all as the umask
+    allows (mkstemp makes it readable by its owner only), so web workers
+    running as another user can open it
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp, 0o666 & ~umask)
+    os.rename(temp, path)
+
+def tenths(dbh):
+    """ dbh in cm as an integer number of tenths of a centimetre """
+    return int(round(float(dbh) * 10))
+
+def finite(dbh):
+    """ whether dbh is a number other than nan or infinity """
+    dbh = float(dbh)
+    return not (math.isnan(dbh) or math.isinf(dbh))
+
+class JenkinsTable(object):
+    """
+    a species x dbh lookup table read from a csv of species, dbh, value
+    rows. Values are kept as the strings found in the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _read(self):
+        values = {}
+        with open(self.path) as datafile:
+            for species, dbh, value in csv.reader(datafile):
+                values[(species, tenths(dbh))] = value
+        return values
+
+    def refresh(self):
+        """ (re)load the table if the file changed since it was read """
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return False
+        with self._lock:
+            if mtime != self.mtime:
+                self.values = self._read()
+                self.mtime = mtime
+        return True
+
+    def lookup(self, species, dbh):
+        """ the value for species at dbh (cm), or None if there is none """
+        self.refresh()
+        if not finite(dbh):
+            return None
+        return self.values.get((species, tenths(dbh)))
+
+_tables = {}
+
+def jenkins_table(path):
+    """ the shared JenkinsTable for path, created on first use """
+    table = _tables.get(path)
+    if table is None:
+        table = _tables.setdefault(path, JenkinsTable(path))
+    return table
+
+def write_binary(path, species, starts, values, digits):
+    """
+    write a binary table of species, each with the values (an array)
+    for dbh tenths from its start. The file is written beside path and
+    renamed into place, so readers never see it half written.
+    """
+    import numpy as np
+
+    index = b""
+    offset = 0
+    for name, start, row in zip(species, starts, values):
+        index += ENTRY.pack(name.encode("ascii"), start, len(row), offset)
+        offset += len(row)
+    data = HEADER_SIZE + len(index)
+    data += -data % 8
+    header = HEADER.pack(MAGIC, VERSION, digits, len(species), data)
+
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(handle, "wb") as outfile:
+        outfile.write(header.ljust(HEADER_SIZE, b"\0"))
+        outfile.write(index.ljust(data - HEADER_SIZE, b"\0"))
+        for row in values:
+            outfile.write(np.asarray(row, dtype="<f4").tobytes())
+    publish(temp, path)
+
+def _round(value, digits):
+    """ a table value as the string the csv has for it """
+    return repr(round(value, digits))
+
+def compile_table(csvpath, path):
+    """ write the csv table at csvpath as a binary table at path """
+    import numpy as np
+
+    rows = defaultdict(dict)
+    digits = 0
+    with open(csvpath) as datafile:
+        for species, dbh, value in csv.reader(datafile):
+            rows[species][tenths(dbh)] = float(value)
+            if "." in value:
+                digits = max(digits, len(value) - value.index(".") - 1)
+    species = list(rows)
+    starts = []
+    values = []
+    for name in species:
+        found = rows[name]
+        start = min(found)
+        row = np.full(max(found) - start + 1, np.nan)
+        for t, value in found.items():
+            row[t - start] = value
+        starts.append(start)
+        values.append(row)
+    write_binary(path, species, starts, values, digits)
+
+class BinaryTable(object):
+    """
+    a memory-mapped binary table, reopened when the file's modification
+    time changes. Given the csv it was compiled from as source, the
+    binary file is (re)compiled whenever the csv is newer: first, or,
+    without build, in a background thread while the mapped table goes
+    on answering. loads counts the times the table was (re)opened, and
+    load_seconds is how long the last one took, including any compile.
+
+    The open table is published as one tuple, (digits, index, values,
+    keys), which readers take once; a map that is replaced is unmapped
+    when its last reader lets go of it.
+    """
+    def __init__(self, path, source=None, build=True):
+        self.path = path
+        self.source = source
+        self.build = build
+        self.mtime = None
+        self.table = None
+        self.loads = 0
+        self.load_seconds = 0.0
+        self._compile_seconds = 0.0
+        self._compiling = None
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with open(self.path, "rb") as datafile:
+            data = mmap.mmap(datafile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, digits, count, offset = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a binary jenkins table" % self.path)
+        index = {}
+        for i in range(count):
+            name, start, length, first = ENTRY.unpack_from(
+                data, HEADER_SIZE + i * ENTRY.size)
+            # keep the byte position of each species' first value
+            index[name.rstrip(b"\0").decode("ascii")] = (
+                start, length, offset + 4 * first)
+        return digits, index, data, {}
+
+    def _compile(self):
+        start = time.time()
+        compile_table(self.source, self.path)
+        self._compile_seconds = time.time() - start
+
+    def _compile_later(self, source_mtime):
+        """
+        compile the source in a background thread, once per version of
+        the source, so a csv that fails to compile is not retried on
+        every lookup
+        """
+        with self._lock:
+            if self._compiled == source_mtime:
+                return
+            self._compiled = source_mtime
+            self._compiling = threading.Thread(target=self._compile,
+                                               name="compile %s" % self.path)
+            self._compiling.daemon = True
+            self._compiling.start()
+
+    def wait(self, timeout=None):
+        """ wait for a background compile, if one is running """
+        thread = self._compiling
+        if thread is not None:
+            thread.join(timeout)
+
+    def _mtime(self):
+        """
+        the binary file's modification time, after compiling the source
+        csv if the binary file is missing or older. Without build, the
+        compile is started in the background instead, and StaleTable is
+        raised if there is no binary file to answer from meanwhile.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        source_mtime = None
+        if self.source is not None:
+            source_mtime = os.stat(self.source).st_mtime
+        stale = source_mtime is not None and (
+            mtime is None or mtime < source_mtime)
+        if stale and self.build:
+            with self._lock:
+                self._compile()
+            return os.stat(self.path).st_mtime
+        if stale:
+            self._compile_later(source_mtime)
+        if mtime is None:
+            if self.source is None:
+                raise StaleTable("the binary table %s is missing: run "
+                                 "bigtrees build-table --binary %s" %
+                                 (self.path, self.path))
+            raise StaleTable("the binary table %s is missing: it is being "
+                             "compiled from %s" % (self.path, self.source))
+        return mtime
+
+    def refresh(self):
+        """ (re)open the table if the file changed since it was opened """
+        mtime = self._mtime()
+        if mtime == self.mtime:
+            return False
+        start = time.time()
+        with self._lock:
+            if mtime != self.mtime:
+                # one assignment, so a reader sees the old table or the
+                # new one, never a mix; the old map is left to whoever
+                # still holds it
+                self.table = self._open()
+                self.mtime = mtime
+                self.loads += 1
+                self.load_seconds = (time.time() - start +
+                                     self._compile_seconds)
+                self._compile_seconds = 0.0
+        return True
+
+    def lookup(self, species, dbh):
+        """ the value for species at dbh (cm), or None if there is none """
+        self.refresh()
+        digits, index, values, _ = self.table
+        entry = index.get(species)
+        if entry is None or not finite(dbh):
+            return None
+        start, length, first = entry
+        offset = tenths(dbh) - start
+        if not 0 <= offset < length:
+            return None
+        value = VALUE.unpack_from(values, first + 4 * offset)[0]
+        if value != value:
+            return None
+        return _round(value, digits)
+
+    def keys(self, species):
+        """
+        the table's digits, and the sorted dbh tenths with a value for
+        species and the values, read from the mapped table once per
+        species and kept with it. None for a species not in the table.
+        """
+        self.refresh()
+        digits, index, values, cache = self.table
+        found = cache.get(species)
+        if found is None:
+            entry = index.get(species)
+            if entry is None:
+                return None
+            start, length, first = entry
+            row = array.array("f")
+            row.frombytes(values[first:first + 4 * length])
+            if sys.byteorder == "big":
+                row.byteswap()
+            keys = array.array("i")
+            found = array.array("d")
+            for i, value in enumerate(row):
+                if value == value:
+                    keys.append(start + i)
+                    found.append(value)
+            found = cache.setdefault(species, (keys, found))
+        return (digits,) + found
+
+    def nearest(self, species, dbh):
+        """
+        (table dbh, value) at the table dbh closest to dbh (cm), the
+        lower one on a tie, or None if species is not in the table
+        """
+        found = self.keys(species)
+        if not found or not found[1]:
+            return None
+        digits, keys, values = found
+        t = float(dbh) * 10
+        i = bisect.bisect_left(keys, t)
+        if i == len(keys) or (i > 0 and t - keys[i - 1] <= keys[i] - t):
+            i -= 1
+        return (keys[i] / 10, _round(values[i], digits))
+
+    def interpolate(self, species, dbh):
+        """
+        the value at dbh (cm) on the straight line between the table's
+        values either side of it, or None outside the table's dbh range
+        """
+        found = self.keys(species)
+        if not found:
+            return None
+        digits, keys, values = found
+        t = float(dbh) * 10
+        i = bisect.bisect_left(keys, t)
+        if i == len(keys):
+            return None
+        if keys[i] == t:
+            return _round(values[i], digits)
+        if i == 0:
+            return None
+        share = (t - keys[i - 1]) / (keys[i] - keys[i - 1])
+        return _round(values[i - 1] + share * (values[i] - values[i - 1]),
+                      digits)
+
+    def curve(self, species, low, high):
+        """ [(dbh, value)] for every table dbh from low to high (cm) """
+        found = self.keys(species)
+        if not found:
+            return []
+        digits, keys, values = found
+        i = bisect.bisect_left(keys, float(low) * 10 - 1e-6)
+        j = bisect.bisect_right(keys, float(high) * 10 + 1e-6)
+        return [(keys[k] / 10, _round(values[k], digits))
+                for k in range(i, j)]
+
+    def find(self, species, dbh, mode="exact"):
+        """
+        (dbh, value) for species at dbh (cm) in one of MODES, or None.
+        dbh is the table's for exact and nearest, and dbh itself for
+        interpolate. A dbh of nan or infinity has no value.
+        """
+        if mode not in MODES:
+            raise ValueError("unknown lookup mode %r: use %s" %
+                             (mode, ", ".join(MODES)))
+        if not finite(dbh):
+            return None
+        if mode == "exact":
+            value = self.lookup(species, dbh)
+            return None if value is None else (tenths(dbh) / 10, value)
+        if mode == "nearest":
+            return self.nearest(species, dbh)
+        value = self.interpolate(species, dbh)
+        return None if value is None else (float(dbh), value)
+
+_binary_tables = {}
+
+def binary_table(path, build=True):
+    """
+    the shared BinaryTable for path, created on first use. For a csv
+    path the binary table is kept beside it, with the extension .jkt,
+    and compiled when the csv changes: in the background if build is
+    False.
+    """
+    table = _binary_tables.get((path, build))
+    if table is None:
+        if os.path.splitext(path)[1] == ".jkt":
+            table = BinaryTable(path, build=build)
+        else:
+            table = BinaryTable(binary_path(path), source=path, build=build)
+        table = _binary_tables.setdefault((path, build), table)
+    return table
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Memoized Biomass
+A bounded least-recently-used cache of equation results, for inventories
+where the same species, dbh and stand class repeat across trees and
+remeasurements.
+
+Results are keyed on the species, the registry model (the biomass and
+height equation) a stand resolves to together with the coefficients of
+both, and the dbh in tenths of a cm, the resolution TP001 records. A
+cache shared by recalibrated registries never mixes their results. A dbh
+off that grid is computed without the cache, so cached results are
+always exactly those of caseof and compute_biomass. Give each its own
+cache, as the scalar and vectorized equations can differ in the last
+place.
+
+for example:
+    cache = BiomassCache(maxsize=100000)
+    best, jenkins = cached_caseof("PSME", 154.5, "HJRS", cache)
+    writeoutput(cursor, cache=cache)
+    cache.stats()
+"""
+from __future__ import division
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from .registry import REGISTRY
+
+MAXSIZE = 65536
+
+
+def quantize(x):
+    """ dbh as integer tenths of a cm, or None if it is off that grid """
+    q = int(round(x * 10))
+    if q / 10 != x:
+        return None
+    return q
+
+class BiomassCache(object):
+    """
+    (best, jenkins) biomass by (species, model key, dbh tenths), evicting
+    the least recently used entry beyond maxsize. hits and misses count
+    lookups since the cache was made or cleared. It may be shared by
+    threads.
+    """
+    def __init__(self, maxsize=MAXSIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ the cached value for key, or None """
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries), "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def cached_caseof(species, x, standid, cache, registry=REGISTRY):
+    """ caseof(species, x, standid), looked up in cache first """
+    from .biggest_trees import caseof
+
+    q = quantize(x)
+    if q is None:
+        return caseof(species, x, standid)
+    key = (species, registry.model(species, standid).version, q)
+    value = cache.get(key)
+    if value is None:
+        value = caseof(species, x, standid)
+        cache.put(key, value)
+    return value
+
+def cached_group(name, model, x, cache):
+    """
+    best and jenkins biomass for an array x of dbh that all use one
+    model, computing only the distinct dbh the cache does not hold
+    """
+    from .batch import jenkins
+
+    best = np.empty(x.shape, dtype=np.float64)
+    jenk = np.empty(x.shape, dtype=np.float64)
+    q = np.round(x * 10)
+    grid = q / 10 == x
+
+    # dbh off the 0.1 cm grid are never cached
+    off = ~grid
+    if off.any():
+        best[off] = model(x[off])
+        jenk[off] = jenkins(name, x[off])
+
+    values, inverse = np.unique(q[grid].astype(np.int64), return_inverse=True)
+    found = np.empty((len(values), 2), dtype=np.float64)
+    missing = []
+    for i, value in enumerate(values.tolist()):
+        cached = cache.get((name, model.version, value))
+        if cached is None:
+            missing.append(i)
+        else:
+            found[i] = cached
+    if missing:
+        missing = np.asarray(missing)
+        xs = values[missing] / 10
+        found[missing, 0] = model(xs)
+        found[missing, 1] = jenkins(name, xs)
+        for i in missing.tolist():
+            cache.put((name, model.version, int(values[i])),
+                      (float(found[i, 0]), float(found[i, 1])))
+    best[grid] = found[inverse, 0]
+    jenk[grid] = found[inverse, 1]
+    return best, jenk
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""Metrics
+Counters, gauges and histograms kept in process, and rendered in the
+Prometheus text exposition format. Recording a value is a dict lookup
+and an addition under a lock, cheap enough to do on every request.
+
+Values that already live elsewhere, such as cache hit counts, are read
+by collectors at render time rather than copied on every change.
+
+for example:
+    metrics = Metrics()
+    metrics.observe("bigtrees_request_duration_seconds", 0.003,
+                    {"route": "/"})
+    metrics.inc("bigtrees_lookups_total", {"result": "hit"})
+    text = metrics.render()
+"""
+from __future__ import division
+import bisect
+import threading
+
+# request latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels):
+    """ a sorted, hashable form of a label dict """
+    return tuple(sorted(labels.items())) if labels else ()
+
+def _format(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace(
+        "\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs)
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram(object):
+    """ counts of observations at or below each bucket bound """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class Metrics(object):
+    """
+    named metrics, each with any number of label sets. help and type
+    are declared with describe(); collectors are functions called by
+    render() that return (name, labels, value) gauge samples.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.types = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self.types[name] = kind
+        self.help[name] = text
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, value, labels=None, buckets=BUCKETS):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def collect(self, collector):
+        """ add a function returning (name, labels, value) samples """
+        self.collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def _samples(self):
+        """ {name: [(labels, suffix, value)]} of every metric """
+        samples = {}
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, []).append((labels, (), value))
+            for (name, labels), value in self.gauges.items():
+                samples.setdefault(name, []).append((labels, (), value))
+            for (name, labels), histogram in self.histograms.items():
+                rows = samples.setdefault(name, [])
+                total = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),),
+                                        histogram.counts):
+                    total += count
+                    rows.append((labels, ("_bucket", (("le", _number(bound)),)),
+                                 total))
+                rows.append((labels, ("_sum", ()), histogram.sum))
+                rows.append((labels, ("_count", ()), total))
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                samples.setdefault(name, []).append((_labels(labels), (),
+                                                     value))
+        return samples
+
+    def render(self):
+        """ every metric in the Prometheus text format """
+        lines = []
+        for name, rows in sorted(self._samples().items()):
+            if name in self.help:
+                lines.append("# HELP %s %s" % (name, self.help[name]))
+            if name in self.types:
+                lines.append("# TYPE %s %s" % (name, self.types[name]))
+            for labels, suffix, value in sorted(rows, key=_order):
+                if suffix:
+                    suffix, extra = suffix
+                else:
+                    suffix, extra = "", ()
+                lines.append("%s%s%s %s" % (name, suffix,
+                                            _format(labels, extra),
+                                            _number(value)))
+        return "\n".join(lines) + "\n"
+
+def _order(row):
+    """ samples grouped by label set, buckets in bound order """
+    labels, suffix, _ = row
+    if not suffix:
+        return (labels, 0, 0.0)
+    kind, extra = suffix
+    if kind == "_bucket":
+        bound = dict(extra)["le"]
+        return (labels, 0, float("inf") if bound == "+Inf" else float(bound))
+    return (labels, 1 if kind == "_sum" else 2, 0.0)
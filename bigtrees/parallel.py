@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Parallel Inventory Run
+Splits the inventory into shards by STANDID or PSP_STUDYID, runs each
+shard through the streaming pipeline in a worker process, and merges
+the shard outputs by TREEID into one CSV identical to a single-process
+run of the same source.
+
+for example:
+    parallel_run(MSSQLSource(), "bigtrees_tp001_v3.csv", workers=8)
+"""
+from __future__ import division
+import io
+import os
+import csv
+import shutil
+import heapq
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from .pipeline import CHUNKSIZE, CSVSink, run
+
+
+def run_shard(source, column, value, path, chunksize=CHUNKSIZE):
+    """ write the output rows of one shard, without a header, to path """
+    with CSVSink(path, header=None) as sink:
+        return run(source.fetch(column, value), sink, chunksize, overlap=False)
+
+def _treeid(line):
+    """ the TREEID field of an output line """
+    return next(csv.reader([line]))[3]
+
+def merge(paths, outfile):
+    """
+    merge shard files, each ordered by TREEID, into outfile. Ties keep
+    the order of paths, so the result does not depend on which worker
+    finished first.
+    """
+    shards = [io.open(path, newline="") for path in paths]
+    try:
+        outfile.writelines(heapq.merge(*[iter(shard) for shard in shards],
+                                       key=_treeid))
+    finally:
+        for shard in shards:
+            shard.close()
+
+def parallel_run(source, path, column="STANDID", workers=None,
+                 chunksize=CHUNKSIZE):
+    """
+    compute every row of source in worker processes, one shard of
+    column at a time, and write the merged output to path. Returns the
+    number of rows written.
+    """
+    shards = source.shards(column)
+    workdir = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(workdir, "shard%06d.csv" % i)
+                 for i in range(len(shards))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_shard, source, column, value,
+                                   shard_path, chunksize)
+                       for value, shard_path in zip(shards, paths)]
+            count = sum(future.result() for future in futures)
+
+        with CSVSink(path) as sink:
+            merge(paths, sink.outfile)
+        return count
+    finally:
+        shutil.rmtree(workdir)
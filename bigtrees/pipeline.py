@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""Streaming Output Pipeline
+Runs inventory rows through the batch engine in chunks:
+
+    cursor.fetchmany(n) -> compute_biomass -> sink.write(rows)
+
+Only one or two chunks are held at a time, so a full-inventory run
+streams through in constant memory. Fetching the next chunk runs on a
+background thread while the current one is computed and written.
+
+for example:
+    with CSVSink("bigtrees_tp001_v3.csv") as sink:
+        run(formconnection(), sink, chunksize=10000)
+"""
+from __future__ import division
+import csv
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .batch import chunked, compute_biomass, tiers
+from .registry import REGISTRY
+
+HEADER = ["PSP_STUDYID", "STANDID", "SPECIES", "TREEID", "DBH",
+          "BEST_BIOMASS", "JENKINS_BIOMASS"]
+
+# the header when each row also has the tier code of its equation
+TIER_HEADER = HEADER + ["TIER"]
+
+CHUNKSIZE = 10000
+
+
+def fetch_chunks(cursor, size=CHUNKSIZE):
+    """
+    lists of up to size rows from a db-api cursor, using fetchmany when
+    the cursor has it; any other iterable of rows is chunked directly
+    """
+    fetchmany = getattr(cursor, "fetchmany", None)
+    if fetchmany is None:
+        for chunk in chunked(cursor, size):
+            yield chunk
+        return
+    while True:
+        chunk = fetchmany(size)
+        if not chunk:
+            return
+        yield chunk
+
+def prefetch(chunks, depth=2):
+    """
+    iterate chunks on a background thread, keeping up to depth of them
+    ready. Errors raised while fetching are re-raised to the consumer.
+    """
+    ready = queue.Queue(depth)
+    stop = threading.Event()
+    finished = object()
+
+    def put(item):
+        """ queue item, unless the consumer stops waiting for it """
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    return
+        except Exception as exc:
+            put((finished, exc))
+            return
+        put((finished, None))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            chunk, error = ready.get()
+            if error is not None:
+                raise error
+            if chunk is finished:
+                return
+            yield chunk
+    finally:
+        stop.set()
+
+def biomass_rows(chunk, cache=None, tier=False, registry=REGISTRY):
+    """
+    output rows for a chunk of formconnection() rows, in the HEADER
+    column order, computed as one batch with the equations of registry
+    (through cache, if given). With tier, each row ends with its
+    equation's tier code.
+    """
+    treeid = [str(row[0]) for row in chunk]
+    study = [str(row[1]) for row in chunk]
+    species = [str(row[2]).strip() for row in chunk]
+    standid = [str(row[3]) for row in chunk]
+    dbh = [float(row[5]) for row in chunk]
+
+    # biomass has always been computed with the study id in the stand
+    # id argument of caseof
+    best, jenk = compute_biomass(species, dbh, study, registry, cache)
+    best = [round(b, 4) for b in best.tolist()]
+    jenk = [round(b1, 4) for b1 in jenk.tolist()]
+    if tier:
+        return [list(row) for row in
+                zip(study, standid, species, treeid, dbh, best, jenk,
+                    tiers(species, study, registry).tolist())]
+    return [list(row) for row in
+            zip(study, standid, species, treeid, dbh, best, jenk)]
+
+def output_chunks(cursor, chunksize=CHUNKSIZE, overlap=True, cache=None,
+                  tier=False):
+    """ lists of output rows, one per chunk fetched from cursor """
+    chunks = fetch_chunks(cursor, chunksize)
+    if overlap:
+        chunks = prefetch(chunks)
+    for chunk in chunks:
+        yield biomass_rows(chunk, cache, tier)
+
+class CSVSink(object):
+    """
+    writes output rows to a csv file, one writerows call per chunk,
+    after the header unless it is None. (QUOTE_NONNUMERIC applies quotes
+    to non-numeric data; change this to QUOTE_NONE for no quotes.)
+    """
+    def __init__(self, path, header=HEADER):
+        self.path = path
+        self.outfile = open(path, "w")
+        self.writer = csv.writer(self.outfile, quoting=csv.QUOTE_NONNUMERIC,
+                                 delimiter=",")
+        if header is not None:
+            self.writer.writerow(header)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Tee(object):
+    """ writes each chunk to every one of sinks, and closes them all """
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, rows):
+        for sink in self.sinks:
+            sink.write(rows)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def run(cursor, sink, chunksize=CHUNKSIZE, overlap=True, cache=None,
+        tier=False):
+    """
+    stream every row of cursor through the batch engine into sink, any
+    object with a write(rows) method. Returns the number of rows written.
+    Pass a memo.BiomassCache as cache to reuse results across chunks,
+    and tier=True to add the TIER column.
+    """
+    count = 0
+    for rows in output_chunks(cursor, chunksize, overlap, cache, tier):
+        sink.write(rows)
+        count += len(rows)
+    return count
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+
+"""Equation Registry
+Compiles bigtreesource.csv into vectorizable kernels, once, at import.
+Each row of the table becomes an Equation of one of four forms:
+
+    loglog:     biomass = exp(B0 + B1 * ln(1 + x))
+    power:      biomass = baskerville * woodden * (B0 * x ** B1)
+    chapman:    height = 1.37 + B0 * (1 - exp(B1 * x)) ** B2
+    formfactor: biomass = woodden * (B1 * height * (0.01 * x) ** 2)
+
+A formfactor biomass is paired with the chapman height for its species,
+region and stand in a Model. Adding or recalibrating an equation is then
+an edit to the table rather than to the code.
+
+Equations are chosen down a fallback chain: an equation for the stand
+itself, then for its elevation class, then for any stand; in the tree's
+region before those for ALL regions; and the species' own equations
+before those of its proxy. Where more than one equation fits at the
+same step, the best tier (QUALITY, for example T1.1.T2.3) wins.
+SelectionIndex holds the choice for every species, region and stand
+class in an array, so a batch of trees resolves in one lookup.
+
+for example:
+    model = REGISTRY.model("PSME", "HJRS")
+    biomass = model(np.array([154.5, 156.1]))
+    ids = REGISTRY.index.resolve(["PSME", "TSHE"], ["HJRS", "RS28"])
+"""
+from __future__ import division
+import os
+import re
+import csv
+import numpy as np
+
+from .biggest_trees import HIGH_ELEVATION_STANDS, region
+
+SOURCE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                      "bigtreesource.csv")
+
+# species without equations of their own, and the species whose
+# equations they borrow
+PROXIES = {"ABMA": "ABCO"}
+
+def _number(value):
+    """ table cells hold a float or the literal None """
+    if value in ("None", ""):
+        return None
+    return float(value)
+
+ELEVATIONS = ["ELEV>1000", "ELEV<1000"]
+
+REGIONS = ["WEST", "ROCKY"]
+
+def tier(quality):
+    """
+    a sortable (tier 1, tier 2) notch of a QUALITY code such as
+    "T1.1.T2.3a."; codes that do not parse sort last
+    """
+    match = re.match(r"T1\.(\d+)([a-z]?)\.T2\.(\d+)([a-z]?)", quality or "")
+    if match is None:
+        return (99, "", 99, "")
+    return (int(match.group(1)), match.group(2), int(match.group(3)),
+            match.group(4))
+
+def stand_chain(standid):
+    """ the STANDID values an equation may have for a stand, best first """
+    return [standid, elevation(standid), "NULL"]
+
+def elevation(standid):
+    """ the STANDID class of the elevation-dependent height equations """
+    if standid in HIGH_ELEVATION_STANDS:
+        return "ELEV>1000"
+    return "ELEV<1000"
+
+class Equation(object):
+    """
+    one row of bigtreesource.csv, compiled to a kernel over arrays of
+    dbh (cm). formfactor equations also take the height array.
+    """
+    def __init__(self, species, component, geo, standid, rawform, b0, b1, b2,
+                 baskerville, woodden, quality):
+        self.species = species
+        self.component = component
+        self.geo = geo
+        self.standid = standid
+        self.rawform = rawform
+        self.b0 = b0
+        self.b1 = b1
+        self.b2 = b2
+        self.baskerville = baskerville
+        self.woodden = woodden
+        self.quality = quality
+
+        if component == "HEIGHT":
+            self.form = "chapman"
+        elif "log" in rawform:
+            self.form = "loglog"
+        elif "height" in rawform:
+            self.form = "formfactor"
+        else:
+            self.form = "power"
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row["SPECIES"], row["COMPONENT"], row["GEO"],
+                   row["STANDID"], row["RAWFORM"], _number(row["B0"]),
+                   _number(row["B1"]), _number(row["B2"]),
+                   _number(row["baskerville"]), _number(row["woodden"]),
+                   row["QUALITY"].strip())
+
+    @property
+    def key(self):
+        return (self.species, self.component, self.geo, self.standid)
+
+    @property
+    def parameters(self):
+        """ the form and coefficients, which decide the results """
+        return (self.form, self.b0, self.b1, self.b2, self.baskerville,
+                self.woodden)
+
+    def __call__(self, x, height=None):
+        if self.form == "chapman":
+            return 1.37 + self.b0 * (1 - np.exp(self.b1 * x)) ** self.b2
+        if self.form == "loglog":
+            return np.exp(self.b0 + self.b1 * np.log1p(x))
+        if self.form == "formfactor":
+            return self.woodden * (self.b1 * height * (0.01 * x) ** 2)
+        baskerville = self.baskerville
+        if baskerville is None:
+            baskerville = 1.0
+        return baskerville * self.woodden * (self.b0 * x ** self.b1)
+
+    def __repr__(self):
+        return "Equation(%s)" % ", ".join(self.key)
+
+class Model(object):
+    """
+    a biomass equation together with the height equation it needs, if
+    any. Calling a model on an array of dbh gives the best biomass.
+    """
+    def __init__(self, biomass, height=None):
+        self.biomass = biomass
+        self.height = height
+
+    @property
+    def key(self):
+        if self.height is None:
+            return (self.biomass.key, None)
+        return (self.biomass.key, self.height.key)
+
+    @property
+    def version(self):
+        """
+        the key with the parameters of both equations, the same only for
+        models that give the same results
+        """
+        height = self.height
+        return (self.biomass.key, self.biomass.parameters,
+                None if height is None else (height.key, height.parameters))
+
+    @property
+    def quality(self):
+        return self.biomass.quality
+
+    def __call__(self, x):
+        if self.height is None:
+            return self.biomass(x)
+        return self.biomass(x, self.height(x))
+
+    def __repr__(self):
+        return "Model(%r, %r)" % (self.biomass, self.height)
+
+class Registry(object):
+    """
+    the equations of bigtreesource.csv, and the model each (species,
+    stand id) pair resolves to. Models are built on first use and
+    cached, so resolving the same pair again is a dict lookup.
+    """
+    def __init__(self, equations):
+        self.equations = list(equations)
+        self._models = {}
+        self._selected = {}
+        self._index = None
+
+    @classmethod
+    def load(cls, path=SOURCE):
+        with open(path) as sourcefile:
+            reader = csv.DictReader(sourcefile, skipinitialspace=True)
+            return cls([Equation.from_row(row) for row in reader])
+
+    @property
+    def species(self):
+        found = set(equation.species for equation in self.equations)
+        return sorted(found | set(p for p in PROXIES if PROXIES[p] in found))
+
+    @property
+    def index(self):
+        """ the SelectionIndex of this registry, built on first use """
+        if self._index is None:
+            self._index = SelectionIndex(self)
+        return self._index
+
+    def _find(self, species, component, geo, standids):
+        """
+        the best-tier equation at the first step of the fallback chain
+        that has one: standids in order, each in geo before ALL, and
+        species before its proxy
+        """
+        names = [species]
+        if species in PROXIES:
+            names.append(PROXIES[species])
+        for name in names:
+            for standid in standids:
+                for place in (geo, "ALL"):
+                    found = [e for e in self.equations
+                             if e.species == name and e.component == component
+                             and e.geo == place and e.standid == standid]
+                    if found:
+                        return min(found, key=lambda e: tier(e.quality))
+        return None
+
+    def select(self, species, geo, standids):
+        """
+        the model for species in region geo, with standids the STANDID
+        chain to fall back along. Raises ValueError for a species with
+        no equation.
+        """
+        key = (species, geo, tuple(standids))
+        cached = self._selected.get(key)
+        if cached is not None:
+            return cached
+
+        biomass = self._find(species, "BIOMASS", geo, standids)
+        if biomass is None:
+            raise ValueError("no biomass equation for species %r" % (species,))
+        height = None
+        if biomass.form == "formfactor":
+            height = self._find(biomass.species, "HEIGHT", geo, standids)
+            if height is None:
+                raise ValueError("no height equation for species %r" % (species,))
+
+        # share one Model between every stand that resolves to the same
+        # equations, so callers can group trees by model
+        model = Model(biomass, height)
+        for other in self._selected.values():
+            if other.key == model.key:
+                model = other
+                break
+        self._selected[key] = model
+        return model
+
+    def model(self, species, standid):
+        """
+        the model for a tree of species in standid, as caseof would
+        choose it. Raises ValueError for a species with no equation.
+        """
+        cached = self._models.get((species, standid))
+        if cached is None:
+            cached = self._models[(species, standid)] = self.select(
+                species, region(standid), stand_chain(standid))
+        return cached
+
+class SelectionIndex(object):
+    """
+    the model chosen for every species, region and stand class, as an
+    array of model ids. A stand's class is the stand itself where an
+    equation names it, and otherwise its elevation class. tiers holds
+    the QUALITY code of each model's biomass equation.
+    """
+    def __init__(self, registry):
+        self.species = registry.species
+        named = sorted(set(e.standid for e in registry.equations) -
+                       set(ELEVATIONS + ["NULL"]))
+        self.classes = ([(standid, elevation(standid)) for standid in named] +
+                        [(None, level) for level in ELEVATIONS])
+        self.models = []
+        ids = {}
+        self.table = np.full((len(self.species), len(REGIONS),
+                              len(self.classes)), -1, dtype=np.int64)
+        for i, species in enumerate(self.species):
+            for j, geo in enumerate(REGIONS):
+                for k, (standid, level) in enumerate(self.classes):
+                    chain = [level, "NULL"]
+                    if standid is not None:
+                        chain.insert(0, standid)
+                    try:
+                        model = registry.select(species, geo, chain)
+                    except ValueError:
+                        continue
+                    if model.key not in ids:
+                        ids[model.key] = len(self.models)
+                        self.models.append(model)
+                    self.table[i, j, k] = ids[model.key]
+        self.tiers = np.array([model.quality for model in self.models])
+        self._species = dict((name, i) for i, name in enumerate(self.species))
+        self._named = dict((standid, k) for k, (standid, _) in
+                           enumerate(self.classes) if standid is not None)
+
+    def stand_codes(self, standid):
+        """ the region and class codes of a stand """
+        geo = REGIONS.index(region(standid))
+        if standid in self._named:
+            return (geo, self._named[standid])
+        return (geo, len(self._named) + ELEVATIONS.index(elevation(standid)))
+
+    def resolve(self, species, standid):
+        """
+        the model id of each tree, for arrays of species and stand ids;
+        self.models[id] is the model and self.tiers[id] its tier code.
+        Raises ValueError if any species has no equation.
+        """
+        species = np.asarray(species)
+        standid = np.asarray(standid)
+        sp_values, sp_inverse = np.unique(species, return_inverse=True)
+        sp_codes = np.array([self._species.get(str(name), -1)
+                             for name in sp_values.tolist()], dtype=np.int64)
+        st_values, st_inverse = np.unique(standid, return_inverse=True)
+        st_codes = np.array([self.stand_codes(str(stand))
+                             for stand in st_values.tolist()],
+                            dtype=np.int64).reshape(-1, 2)
+
+        codes = sp_codes[sp_inverse.reshape(-1)]
+        stands = st_codes[st_inverse.reshape(-1)]
+        ids = self.table[codes, stands[:, 0], stands[:, 1]]
+        missing = (codes < 0) | (ids < 0)
+        if missing.any():
+            raise ValueError("no biomass equation for species %r" %
+                             (str(species[missing][0]),))
+        return ids
+
+REGISTRY = Registry.load()
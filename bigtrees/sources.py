@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+"""Inventory Data Sources
+A source yields inventory rows in the shape of formconnection():
+
+    (treeid, psp_studyid, species, standid, treeid, dbh, tree_vigor)
+
+ordered by treeid, and can list and fetch the shards (stands or
+studies) of the inventory separately, so that shards can be run in
+parallel processes. Trees with no stand or study form a shard of their
+own, listed as None. series() gives the same rows with the measurement
+year in place of the measurement treeid, ordered by treeid and year,
+for growth.run_growth. Sources hold only their settings and are
+picklable; connections are opened on first use and reused by later
+runs in the same process and thread.
+
+Every source takes the same filters, which the SQL backends push down
+into the query:
+    min_dbh:  only measurements with dbh > min_dbh (None for all); for
+              series(), every measurement of the trees with one
+    species:  only these species codes
+    standids: only these stands
+
+series() keeps whole trees so that growth.run_growth sees the interval
+in which a tree crosses min_dbh.
+
+for example:
+    source = SQLiteSource("inventory.db", min_dbh=150, species=["PSME"])
+    writeoutput(source.fetch())
+"""
+from __future__ import division
+import os
+import abc
+import csv
+import sqlite3
+import itertools
+import threading
+
+# position of each shard column in a row
+SHARD_INDEX = {"STANDID": 3, "PSP_STUDYID": 1}
+
+_connections = {}
+
+# a base class for abstract classes, on python 2 and 3
+ABC = abc.ABCMeta("ABC", (object,), {})
+
+def shard_value(value):
+    """ a shard column's value as shards() lists it: text, or None for NULL """
+    return None if value is None else str(value)
+
+def shard_order(values):
+    """ distinct shard values, sorted, with None first """
+    return sorted(set(values), key=lambda value: (value is not None,
+                                                  value or ""))
+
+def _is_open(connection):
+    """ whether a connection can still give cursors """
+    try:
+        connection.cursor().close()
+    except Exception:
+        return False
+    return True
+
+def _prune():
+    """
+    forget the connections of threads that have ended and of other
+    processes, closing those this process opened
+    """
+    pid = os.getpid()
+    alive = set(thread.ident for thread in threading.enumerate())
+    for key in list(_connections):
+        if key[0] == pid and key[1] in alive:
+            continue
+        connection = _connections.pop(key, None)
+        if connection is not None and key[0] == pid:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+def pooled(key, connect):
+    """
+    the open connection for key in this process and thread, made with
+    connect() the first time it is asked for, or again once it has been
+    closed. Connections of threads that have ended are closed then.
+    """
+    key = (os.getpid(), threading.current_thread().ident) + tuple(key)
+    connection = _connections.get(key)
+    if connection is None or not _is_open(connection):
+        _prune()
+        connection = _connections[key] = connect()
+    return connection
+
+def close_all():
+    """ close every pooled connection of this process """
+    for key in list(_connections):
+        if key[0] == os.getpid():
+            _connections.pop(key).close()
+
+class Source(object):
+    """ the filters shared by every backend """
+    def __init__(self, min_dbh=150, species=None, standids=None):
+        self.min_dbh = min_dbh
+        self.species = list(species) if species else None
+        self.standids = list(standids) if standids else None
+
+    def keep(self, row, dbh=True):
+        """
+        whether a row passes the filters, for backends without a query.
+        Without dbh, the min_dbh filter is left out.
+        """
+        if dbh and self.min_dbh is not None and \
+                not float(row[5]) > self.min_dbh:
+            return False
+        if self.species is not None and str(row[2]).strip() not in self.species:
+            return False
+        if self.standids is not None and str(row[3]) not in self.standids:
+            return False
+        return True
+
+    def in_shard(self, row, column, value):
+        """ whether a row is in the shard where column is value """
+        return column is None or \
+            shard_value(row[SHARD_INDEX[column]]) == value
+
+    def whole_trees(self, rows):
+        """
+        the rows, grouped by treeid, of the trees with a measurement over
+        min_dbh, every measurement of each kept
+        """
+        for _, tree in itertools.groupby(rows, lambda row: str(row[0])):
+            tree = list(tree)
+            if self.min_dbh is None or \
+                    any(float(row[5]) > self.min_dbh for row in tree):
+                for row in tree:
+                    yield row
+
+class RowSource(Source):
+    """
+    rows held in memory. For series(), give rows with the year in place
+    of the measurement treeid.
+    """
+    def __init__(self, rows, min_dbh=None, species=None, standids=None):
+        Source.__init__(self, min_dbh, species, standids)
+        self.rows = sorted(rows, key=lambda row: str(row[0]))
+
+    def shards(self, column):
+        index = SHARD_INDEX[column]
+        return shard_order(shard_value(row[index]) for row in self.fetch())
+
+    def fetch(self, column=None, value=None):
+        return (row for row in self.rows if self.keep(row) and
+                self.in_shard(row, column, value))
+
+    def series(self, column=None, value=None):
+        rows = (row for row in self.rows if self.keep(row, dbh=False) and
+                self.in_shard(row, column, value))
+        return iter(sorted(self.whole_trees(rows),
+                           key=lambda row: (str(row[0]), row[4])))
+
+class FileSource(Source):
+    """
+    a flat csv file of joined rows with a header naming TREEID,
+    PSP_STUDYID, SPECIES, STANDID, DBH and TREE_VIGOR, ordered by TREEID.
+    The file is streamed, and filtered as it is read. series() also
+    needs a YEAR column.
+    """
+    def __init__(self, path, min_dbh=150, species=None, standids=None):
+        Source.__init__(self, min_dbh, species, standids)
+        self.path = path
+
+    def _rows(self, years=False):
+        with open(self.path) as datafile:
+            for record in csv.DictReader(datafile):
+                yield (record["TREEID"], record["PSP_STUDYID"],
+                       record["SPECIES"], record["STANDID"],
+                       int(record["YEAR"]) if years else record["TREEID"],
+                       float(record["DBH"]), record["TREE_VIGOR"])
+
+    def shards(self, column):
+        index = SHARD_INDEX[column]
+        return shard_order(shard_value(row[index]) for row in self.fetch())
+
+    def fetch(self, column=None, value=None):
+        return (row for row in self._rows() if self.keep(row) and
+                self.in_shard(row, column, value))
+
+    def series(self, column=None, value=None):
+        """ rows with their YEAR, in file order (grouped by TREEID) """
+        rows = (row for row in self._rows(years=True)
+                if self.keep(row, dbh=False) and
+                self.in_shard(row, column, value))
+        return self.whole_trees(rows)
+
+class SQLSource(Source, ABC):
+    """
+    the tp00101 (trees) and tp00102 (measurements) tables of a database,
+    joined on treeid. Subclasses name the tables, the parameter marker
+    and how to connect.
+    """
+    trees = "tp00101"
+    measurements = "tp00102"
+    marker = "?"
+
+    @abc.abstractmethod
+    def connect(self):
+        """ a new connection to the database """
+
+    @abc.abstractmethod
+    def connection(self):
+        """ the pooled connection of this process and thread """
+
+    def _where(self, column=None, value=None, years=False):
+        """
+        the WHERE clause and its parameters for the filters. With years,
+        min_dbh selects trees rather than measurements.
+        """
+        clauses = []
+        params = []
+        if self.min_dbh is not None and years:
+            clauses.append("%s.treeid IN (SELECT treeid FROM %s WHERE dbh > %s)"
+                           % (self.trees, self.measurements, self.marker))
+            params.append(self.min_dbh)
+        elif self.min_dbh is not None:
+            clauses.append(self.measurements + ".dbh > " + self.marker)
+            params.append(self.min_dbh)
+        for name, values in (("species", self.species),
+                             ("standid", self.standids)):
+            if values is not None:
+                clauses.append("%s.%s IN (%s)" % (self.trees, name,
+                               ", ".join([self.marker] * len(values))))
+                params.extend(values)
+        if column is not None and value is None:
+            clauses.append("%s.%s IS NULL" % (self.trees, column.lower()))
+        elif column is not None:
+            clauses.append("%s.%s = %s" % (self.trees, column.lower(),
+                                           self.marker))
+            params.append(value)
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def _join(self):
+        return (" FROM %(t)s LEFT JOIN %(m)s ON %(t)s.treeid = %(m)s.treeid" %
+                {"t": self.trees, "m": self.measurements})
+
+    def query(self, column=None, value=None, years=False):
+        """
+        the SELECT statement and parameters for fetch(), or with years
+        for series()
+        """
+        where, params = self._where(column, value, years)
+        names = {"t": self.trees, "m": self.measurements}
+        select = ("SELECT %(t)s.treeid, %(t)s.psp_studyid, %(t)s.species, "
+                  "%(t)s.standid, %(m)s.treeid, %(m)s.dbh, %(m)s.tree_vigor")
+        order = " ORDER BY %(m)s.treeid ASC"
+        if years:
+            select = select.replace("%(m)s.treeid,", "%(m)s.year,")
+            order += ", %(m)s.year ASC"
+        return (select % names + self._join() + where + order % names,
+                params)
+
+    def shards(self, column):
+        if column not in SHARD_INDEX:
+            raise KeyError(column)
+        where, params = self._where()
+        cursor = self.connection().cursor()
+        cursor.execute("SELECT DISTINCT %s.%s" % (self.trees, column.lower()) +
+                       self._join() + where, tuple(params))
+        return shard_order(shard_value(row[0]) for row in cursor.fetchall())
+
+    def fetch(self, column=None, value=None):
+        if column is not None and column not in SHARD_INDEX:
+            raise KeyError(column)
+        query, params = self.query(column, value)
+        cursor = self.connection().cursor()
+        cursor.execute(query, tuple(params))
+        return cursor
+
+    def series(self, column=None, value=None):
+        """ a cursor over the rows with their year, by treeid and year """
+        if column is not None and column not in SHARD_INDEX:
+            raise KeyError(column)
+        query, params = self.query(column, value, years=True)
+        cursor = self.connection().cursor()
+        cursor.execute(query, tuple(params))
+        return cursor
+
+class SQLiteSource(SQLSource):
+    """ a local SQLite copy of the inventory tables """
+    def __init__(self, path, min_dbh=150, species=None, standids=None):
+        SQLSource.__init__(self, min_dbh, species, standids)
+        self.path = path
+
+    def connect(self):
+        # cursors may be read on the pipeline's prefetch thread
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def connection(self):
+        return pooled(("sqlite", self.path), self.connect)
+
+class MSSQLSource(SQLSource):
+    """
+    the FSDB MS SQL server. The password is read from the
+    BIGTREES_MSSQL_PASSWORD environment variable, and the server, user
+    and database may be overridden the same way.
+    """
+    trees = "fsdbdata.dbo.tp00101"
+    measurements = "fsdbdata.dbo.tp00102"
+    marker = "%s"
+
+    def __init__(self, min_dbh=150, species=None, standids=None,
+                 server=None, user=None, database=None):
+        SQLSource.__init__(self, min_dbh, species, standids)
+        self.server = server or os.environ.get(
+            "BIGTREES_MSSQL_SERVER", "stewartia.forestry.oregonstate.edu:1433")
+        self.user = user or os.environ.get("BIGTREES_MSSQL_USER", "petersonf")
+        self.database = database or os.environ.get(
+            "BIGTREES_MSSQL_DATABASE", "FSDBDATA")
+
+    def connect(self):
+        import pymssql
+        return pymssql.connect(server=self.server, user=self.user,
+                               password=os.environ.get("BIGTREES_MSSQL_PASSWORD"),
+                               database=self.database)
+
+    def connection(self):
+        return pooled(("mssql", self.server, self.user, self.database),
+                      self.connect)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""Jenkins Table Builder
+Generates the species x dbh grid of Jenkins biomass in TP001_jenkins.csv,
+
+    "SPECIES",dbh,biomass
+
+for dbh from 5.0 to 150.0 cm in 0.1 cm steps. The dbh axis is built
+from integer tenths of a cm rather than by adding a float step, and
+each Jenkins group is evaluated over the whole axis in one numpy pass.
+Values are rounded to 5 digits as the jenkbio lines of biggest_trees
+do; the few cells within reach of a rounding boundary are recomputed
+with math.exp, so the table is the same, byte for byte, as one built a
+cell at a time.
+
+for example:
+    write_csv("TP001_jenkins.csv")
+    write_jkt("TP001_jenkins.jkt")
+    species, dbh, values = build_table(["PSME", "TSHE"])
+"""
+from __future__ import division
+import io
+import json
+import math
+import numpy as np
+
+from .lookup import write_binary
+
+# jenkins group coefficients (b0, b1), as in the jenkbio lines
+GROUPS = {
+    "df": (-2.2304, 2.4435),
+    "tfh": (-2.5384, 2.4814),
+    "wood": (-0.7152, 1.7029),
+    "mb": (-1.9123, 2.3867),
+    "mh": (-2.4800, 2.4835),
+    "aa": (-2.2094, 2.3867),
+    "cl": (-2.0336, 2.2592),
+    "pine": (-2.5356, 2.4349),
+    "hmo": (-2.0127, 2.4342),
+}
+
+# the species of the table, in its order, and their jenkins groups.
+# CHNO is tabled as cedar/larch, though chno() uses the true fir group.
+SPECIES = [
+    ("PSME", "df"), ("SEGI", "df"), ("PISI", "df"),
+    ("ABAM", "tfh"), ("ABCO", "tfh"), ("ABGR", "tfh"), ("ABLA", "tfh"),
+    ("ABLA2", "tfh"), ("ABMA", "tfh"), ("ABPR", "tfh"), ("TABR", "tfh"),
+    ("TSHE", "tfh"), ("TSME", "tfh"), ("THPL", "tfh"),
+    ("ACCI", "wood"),
+    ("ACGL", "mb"), ("ACMA", "mb"), ("ACGL2", "mb"),
+    ("ALIN", "mh"), ("ALSI", "mh"), ("ALRU", "mh"), ("CONU", "mh"),
+    ("MAFUPOTR", "mh"), ("POTR2", "mh"), ("PREM", "mh"), ("PRUNU", "mh"),
+    ("RHPU", "mh"), ("SASC", "mh"), ("SALIX", "mh"),
+    ("ARME", "aa"), ("CACH", "aa"),
+    ("CADE", "cl"), ("CADE3", "cl"), ("CHNO", "cl"), ("LIDE2", "cl"),
+    ("PICO", "pine"), ("PIEN", "pine"), ("PIJE", "pine"), ("PILA", "pine"),
+    ("PIMO", "pine"), ("PIPO", "pine"),
+    ("QUGA", "hmo"), ("QUKE", "hmo"),
+]
+
+# the dbh axis, in tenths of a cm
+START = 50
+STOP = 1500
+
+DIGITS = 5
+
+
+def group_values(b0, b1, x, digits=DIGITS):
+    """
+    round(0.001*exp(b0 + b1*log1p(x)), digits) for an array x, the same
+    to the last bit as the scalar expression
+    """
+    values = 0.001 * np.exp(b0 + b1 * np.log1p(x))
+    scaled = values * 10 ** digits
+    # numpy and math may differ in the last place; where that could move
+    # a value across a rounding boundary, use math's value
+    near = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near).tolist():
+        values[i] = 0.001 * math.exp(b0 + b1 * math.log1p(x[i]))
+    return np.array([round(v, digits) for v in values.tolist()])
+
+def build_table(species=None, start=START, stop=STOP):
+    """
+    the table for species (all of SPECIES by default) over dbh from start
+    to stop tenths of a cm inclusive. Returns the species, the dbh array
+    (cm) and a species x dbh array of values.
+    """
+    groups = dict(SPECIES)
+    if species is None:
+        species = [name for name, _ in SPECIES]
+    dbh = np.arange(start, stop + 1) / 10
+    values = np.empty((len(species), len(dbh)), dtype=np.float64)
+    computed = {}
+    for i, name in enumerate(species):
+        group = groups[name]
+        if group not in computed:
+            computed[group] = group_values(GROUPS[group][0], GROUPS[group][1],
+                                           dbh)
+        values[i] = computed[group]
+    return species, dbh, values
+
+def write_csv(path, species=None, start=START, stop=STOP):
+    """ write the table as TP001_jenkins.csv is written, in one go """
+    species, dbh, values = build_table(species, start, stop)
+    dbh = ["%.1f" % x for x in dbh.tolist()]
+    lines = []
+    for name, row in zip(species, values.tolist()):
+        prefix = '"%s",' % name
+        lines.extend(prefix + x + "," + repr(v) + "\r\n"
+                     for x, v in zip(dbh, row))
+    with io.open(path, "w", newline="") as outfile:
+        outfile.write(u"".join(lines))
+    return len(lines)
+
+def write_npy(path, species=None, start=START, stop=STOP):
+    """
+    write the table as a species x dbh .npy array, with its species and
+    dbh range in a .json file beside it
+    """
+    species, dbh, values = build_table(species, start, stop)
+    np.save(path, values)
+    base = path[:-4] if path.endswith(".npy") else path
+    with open(base + ".json", "w") as jsonfile:
+        json.dump({"species": species, "start": start, "stop": stop}, jsonfile)
+    return values.size
+
+def write_jkt(path, species=None, start=START, stop=STOP):
+    """ write the table as a binary table for lookup.BinaryTable """
+    species, dbh, values = build_table(species, start, stop)
+    write_binary(path, species, [start] * len(species), values, DIGITS)
+    return values.size
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+"""Tree Index
+A sidecar index of an output csv that maps each TREEID to the bytes of
+its rows, so the rows of one tree are found by one hash probe and one
+read, whatever the size of the output. A tree's rows must be together
+in the file, as they are in every output (sources order by TREEID).
+
+The index is written beside the output, with the extension .tix:
+
+    header  64 bytes: magic "BTIX", version (uint16), key width
+            (uint16), slot count (uint32, a power of two), tree count
+            (uint64), byte size of the output it indexes (uint64)
+    slots   one per slot: TREEID (key width bytes, NUL-padded), offset
+            of the tree's first row (uint64), byte length of its rows
+            (uint32), row count (uint32); row count 0 marks an empty slot
+
+all little-endian. A tree's slot is the crc32 of its TREEID modulo the
+slot count, or the first empty-or-matching slot after it; the table is
+never more than half full, so a lookup probes one or two slots.
+
+IndexedCSVSink writes the index as it writes the output, and
+build_index indexes an output already written in one pass over it.
+A TreeIndex made with build=False, as the web app's is, never builds
+one itself: a missing or out of date index raises StaleIndex, so a
+request is never held up by a scan of the whole output.
+
+for example:
+    with IndexedCSVSink("bigtrees_tp001_v3.csv") as sink:
+        run(cursor, sink)
+    tree_index("bigtrees_tp001_v3.csv").records("AG05000100019")
+"""
+from __future__ import division
+import io
+import os
+import csv
+import mmap
+import zlib
+import struct
+import tempfile
+import threading
+
+from .lookup import publish
+from .pipeline import HEADER
+
+MAGIC = b"BTIX"
+VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHHIQQ")
+HEADER_SIZE = 64
+
+# the column of TREEID in every output
+TREEID = HEADER.index("TREEID")
+
+
+class StaleIndex(ValueError):
+    """ an output's index is missing or older than the output """
+
+def index_path(path):
+    """ the index file of an output csv """
+    return os.path.splitext(path)[0] + ".tix"
+
+def _slot_struct(width):
+    return struct.Struct("<%dsQII" % width)
+
+class TreeSpans(object):
+    """
+    the byte span of each tree's rows, from row offsets and lengths
+    added in file order. Raises ValueError if a tree's rows are split.
+    """
+    def __init__(self):
+        self.spans = {}
+        self._treeid = None
+
+    def add(self, treeid, offset, length):
+        if treeid == self._treeid:
+            start, size, rows = self.spans[treeid]
+            self.spans[treeid] = (start, size + length, rows + 1)
+            return
+        if treeid in self.spans:
+            raise ValueError("the rows of tree %s are not together" % treeid)
+        self.spans[treeid] = (offset, length, 1)
+        self._treeid = treeid
+
+def write_index(path, spans, size):
+    """
+    write the index of an output of size bytes, with spans a dict of
+    treeid: (offset, length, rows), beside path and renamed into place
+    """
+    keys = dict((treeid, treeid.encode("utf-8")) for treeid in spans)
+    width = max([len(key) for key in keys.values()] + [1])
+    count = 8
+    while count < 2 * len(spans):
+        count *= 2
+    slot = _slot_struct(width)
+    table = bytearray(count * slot.size)
+    mask = count - 1
+    for treeid, (offset, length, rows) in spans.items():
+        key = keys[treeid]
+        i = zlib.crc32(key) & mask
+        while struct.unpack_from("<I", table, i * slot.size + width + 12)[0]:
+            i = (i + 1) & mask
+        slot.pack_into(table, i * slot.size, key, offset, length, rows)
+
+    header = INDEX_HEADER.pack(MAGIC, VERSION, width, count, len(spans), size)
+    target = index_path(path)
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)))
+    with os.fdopen(handle, "wb") as outfile:
+        outfile.write(header.ljust(HEADER_SIZE, b"\0"))
+        outfile.write(table)
+    publish(temp, target)
+
+def build_index(path):
+    """
+    index the output csv at path in one pass over it. Returns the number
+    of trees.
+    """
+    spans = TreeSpans()
+    sizes = []
+    with open(path, "rb") as datafile:
+        header = datafile.readline()
+        offset = len(header)
+
+        def lines():
+            for line in datafile:
+                sizes.append(len(line))
+                yield line.decode("utf-8")
+
+        # the reader takes one line per row, so sizes holds its length
+        for row in csv.reader(lines()):
+            length = sizes.pop()
+            spans.add(row[TREEID], offset, length)
+            offset += length
+    write_index(path, spans.spans, offset)
+    return len(spans.spans)
+
+class IndexedCSVSink(object):
+    """
+    writes output rows to a csv file as pipeline.CSVSink does, and its
+    tree index beside it when closed
+    """
+    def __init__(self, path, header=HEADER):
+        self.path = path
+        self.outfile = open(path, "wb")
+        self.spans = TreeSpans()
+        self.offset = 0
+        if header is not None:
+            self.offset = self.outfile.write(self._format([header])[0])
+        self.column = (header or HEADER).index("TREEID")
+
+    @staticmethod
+    def _format(rows):
+        """ the encoded csv text of rows, and the byte length of each """
+        text = io.StringIO()
+        writer = csv.writer(text, quoting=csv.QUOTE_NONNUMERIC, delimiter=",")
+        lengths = []
+        for row in rows:
+            start = text.tell()
+            writer.writerow(row)
+            lengths.append(text.tell() - start)
+        data = text.getvalue().encode("utf-8")
+        if len(data) != text.tell():
+            # not ascii: measure each row in bytes
+            lengths = [len(line.encode("utf-8")) for line in
+                       text.getvalue().splitlines(True)]
+        return data, lengths
+
+    def write(self, rows):
+        data, lengths = self._format(rows)
+        for row, length in zip(rows, lengths):
+            self.spans.add(str(row[self.column]), self.offset, length)
+            self.offset += length
+        self.outfile.write(data)
+
+    def close(self):
+        self.outfile.close()
+        write_index(self.path, self.spans.spans, self.offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TreeIndex(object):
+    """
+    the rows of an output csv by TREEID, through its memory-mapped
+    index. The index is (re)built whenever it is missing, older than the
+    output or made for an output of another size (or, without build,
+    StaleIndex is raised), and reopened when it changes.
+
+    The open index is published as one tuple, (data, width, count,
+    header), which readers take once; a map that is replaced is unmapped
+    when its last reader lets go of it.
+    """
+    def __init__(self, path, build=True):
+        self.path = path
+        self.build = build
+        self.index = index_path(path)
+        self.mtime = None
+        self.table = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with open(self.path) as datafile:
+            header = next(csv.reader(datafile))
+        with open(self.index, "rb") as indexfile:
+            data = mmap.mmap(indexfile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, count, trees, size = \
+            INDEX_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a tree index" % self.index)
+        return data, width, count, header
+
+    def _stale(self):
+        try:
+            mtime = os.stat(self.index).st_mtime
+        except OSError:
+            return True
+        if mtime < os.stat(self.path).st_mtime:
+            return True
+        with open(self.index, "rb") as indexfile:
+            size = INDEX_HEADER.unpack(indexfile.read(INDEX_HEADER.size))[5]
+        return size != os.path.getsize(self.path)
+
+    def refresh(self):
+        """ (re)open the index if it or the output changed """
+        try:
+            current = (self.mtime is not None and
+                       os.stat(self.index).st_mtime == self.mtime and
+                       os.stat(self.path).st_mtime <= self.mtime)
+        except OSError:
+            current = False
+        if current:
+            return False
+        with self._lock:
+            if self._stale():
+                if not self.build:
+                    raise StaleIndex("the index of %s is missing or out of "
+                                     "date: run bigtrees index %s" %
+                                     (self.path, self.path))
+                build_index(self.path)
+            # one assignment, so a reader sees the old index or the new
+            # one, never a mix; the old map is left to whoever holds it
+            self.table = self._open()
+            self.mtime = os.stat(self.index).st_mtime
+        return True
+
+    def _table(self):
+        self.refresh()
+        return self.table
+
+    def span(self, treeid):
+        """ (offset, length, rows) of treeid's rows, or None """
+        return self._span(self._table(), treeid)
+
+    def _span(self, table, treeid):
+        data, width, count, _ = table
+        key = str(treeid).encode("utf-8")
+        if len(key) > width:
+            return None
+        slot = _slot_struct(width)
+        mask = count - 1
+        i = zlib.crc32(key) & mask
+        while True:
+            found, offset, length, rows = slot.unpack_from(
+                data, HEADER_SIZE + i * slot.size)
+            if not rows:
+                return None
+            if found.rstrip(b"\0") == key:
+                return (offset, length, rows)
+            i = (i + 1) & mask
+
+    def rows(self, treeid):
+        """ the output rows of treeid, parsed as they were written """
+        return self._rows(self._table(), treeid)
+
+    def _rows(self, table, treeid):
+        span = self._span(table, treeid)
+        if span is None:
+            return []
+        offset, length, _ = span
+        with open(self.path, "rb") as datafile:
+            datafile.seek(offset)
+            data = datafile.read(length).decode("utf-8")
+        return list(csv.reader(io.StringIO(data),
+                               quoting=csv.QUOTE_NONNUMERIC))
+
+    def records(self, treeid):
+        """ the output rows of treeid as dicts keyed by the header """
+        table = self._table()
+        return [dict(zip(table[3], row)) for row in self._rows(table, treeid)]
+
+_indexes = {}
+
+def tree_index(path, build=True):
+    """ the shared TreeIndex for the output at path, created on first use """
+    index = _indexes.get((path, build))
+    if index is None:
+        index = _indexes.setdefault((path, build), TreeIndex(path, build))
+    return index
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""Tree Table
+The inventory held in memory as one NumPy structured array of compact
+records, instead of a tuple of Python objects per row:
+
+    treeid                       utf-8 bytes, NUL-padded (16 bytes)
+    psp_studyid, standid, species, tree_vigor
+                                 categorical codes (uint16)
+    year                         int16, -1 where unknown
+    dbh                          float64
+
+34 bytes a row, and nothing else per row: measured at two measurements
+a tree, a table holds 34 bytes a row in all, against 90 with treeid
+interned (a Python string and a dict entry per tree) and 305 for the
+rows as tuples. The other text columns are interned to small
+integers with columnar.Categories, one shared dictionary per column, so
+a species or stand code is stripped and stored once however many rows
+it has. Pass the categories of one table to another to give them the
+same codes.
+
+Biomass is computed per distinct (species, study) pair rather than per
+row: the pairs are resolved to their models once, and each model runs
+over the dbh of its rows. Output rows are built only when written, from
+the shared category strings.
+
+for example:
+    table = TreeTable.load(source.fetch())
+    table = TreeTable.load_output("bigtrees_tp001_v3.csv")
+    best, jenkins = table.biomass()
+    with CSVSink("bigtrees_tp001_v3.csv") as sink:
+        table.run(sink)
+"""
+from __future__ import division
+import csv
+import numpy as np
+
+from .batch import jenkins
+from .columnar import Categories, encode_column
+from .pipeline import CHUNKSIZE, fetch_chunks
+from .registry import REGISTRY
+
+DTYPE = np.dtype([("treeid", "S16"), ("psp_studyid", "<u2"),
+                  ("standid", "<u2"), ("species", "<u2"),
+                  ("tree_vigor", "<u2"), ("year", "<i2"), ("dbh", "<f8")])
+
+CATEGORICAL = ["psp_studyid", "species", "standid", "tree_vigor"]
+
+# the position of each categorical column in a formconnection() row
+POSITIONS = {"treeid": 0, "psp_studyid": 1, "species": 2, "standid": 3,
+             "tree_vigor": 6}
+
+
+class TreeTable(object):
+    """
+    inventory rows as compact records. records is the structured array,
+    and categories[name] the shared Categories of each coded column.
+    """
+    def __init__(self, records, categories=None):
+        self.records = records
+        self.categories = categories or dict(
+            (name, Categories()) for name in CATEGORICAL)
+
+    @classmethod
+    def load(cls, cursor, chunksize=CHUNKSIZE, categories=None, years=False):
+        """
+        a table of every formconnection() row of cursor, read chunksize
+        rows at a time. With years, the rows are series() rows with the
+        year in place of the measurement treeid.
+        """
+        table = cls(np.empty(0, dtype=DTYPE), categories)
+        parts = [table.encode(chunk, years)
+                 for chunk in fetch_chunks(cursor, chunksize)]
+        if parts:
+            table.records = np.concatenate(parts)
+        return table
+
+    @classmethod
+    def load_output(cls, path, chunksize=CHUNKSIZE, categories=None):
+        """
+        a table of the trees in an output csv, which holds every column
+        but tree_vigor and year
+        """
+        with open(path) as datafile:
+            reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+            next(reader)
+            rows = ((row[3], row[0], row[2], row[1], row[3], row[4], "")
+                    for row in reader)
+            return cls.load(rows, chunksize, categories)
+
+    def encode(self, rows, years=False):
+        """ records for a list of formconnection() rows """
+        records = np.empty(len(rows), dtype=DTYPE)
+        columns = list(zip(*rows))
+        treeid = np.array([str(value).encode("utf-8")
+                           for value in columns[POSITIONS["treeid"]]])
+        if treeid.dtype.itemsize > DTYPE["treeid"].itemsize:
+            raise ValueError("treeid: a treeid is longer than %d bytes" %
+                             DTYPE["treeid"].itemsize)
+        records["treeid"] = treeid
+        for name in CATEGORICAL:
+            records[name] = encode_column(self.categories[name], name,
+                                          columns[POSITIONS[name]],
+                                          DTYPE[name], strip=name == "species")
+        if years:
+            records["year"] = [-1 if year is None else year
+                               for year in columns[4]]
+        else:
+            records["year"] = -1
+        records["dbh"] = columns[5]
+        return records
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes
+
+    def decode(self, name):
+        """ the values of a coded column (or treeid), one per row """
+        values = np.empty(len(self), dtype=object)
+        values[:] = self.strings(name)
+        return values
+
+    def strings(self, name, records=None):
+        """
+        the values of a coded column (or treeid) as a list of str, for
+        records, or every row
+        """
+        if records is None:
+            records = self.records
+        if name == "treeid":
+            return [value.decode("utf-8")
+                    for value in records["treeid"].tolist()]
+        values = self.categories[name].values
+        return [values[code] for code in records[name].tolist()]
+
+    def select(self, mask):
+        """ a table of the rows where mask is true, sharing categories """
+        return TreeTable(self.records[mask], self.categories)
+
+    def _pairs(self, registry):
+        """
+        the distinct (species, study) pairs as species * width + study,
+        the pair of each row, the model id of each pair, and width
+        """
+        species = self.records["species"].astype(np.int64)
+        study = self.records["psp_studyid"].astype(np.int64)
+        names = self.categories["species"].values
+        studies = self.categories["psp_studyid"].values
+        width = len(studies)
+        pairs, inverse = np.unique(species * width + study,
+                                   return_inverse=True)
+        # as in the output, the study id chooses the equations
+        ids = registry.index.resolve(
+            [names[p // width] for p in pairs.tolist()],
+            [studies[p % width] for p in pairs.tolist()])
+        return pairs, inverse.reshape(-1), ids, width
+
+    def model_ids(self, registry=REGISTRY):
+        """ the id in registry.index.models of each row's model """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        _, inverse, ids, _ = self._pairs(registry)
+        return ids[inverse]
+
+    def biomass(self, registry=REGISTRY, cache=None):
+        """
+        best and jenkins biomass for every row, as float64 arrays. As in
+        the output, the study id chooses the equations.
+        """
+        dbh = self.records["dbh"]
+        best = np.empty(len(dbh))
+        jenk = np.empty(len(dbh))
+        if not len(dbh):
+            return best, jenk
+        if cache is not None:
+            from .memo import cached_group
+
+        # resolve each distinct species and study pair once
+        pairs, inverse, ids, width = self._pairs(registry)
+        names = self.categories["species"].values
+        index = registry.index
+
+        # then run each (species, model) over the dbh of its rows
+        groups = (pairs // width) * len(index.models) + ids
+        keys, key_of_pair = np.unique(groups, return_inverse=True)
+        row_keys = key_of_pair.reshape(-1)[inverse]
+        order = np.argsort(row_keys, kind="mergesort")
+        bounds = np.cumsum(np.bincount(row_keys, minlength=len(keys)))
+        for key, rows in zip(keys.tolist(), np.split(order, bounds[:-1])):
+            name = names[key // len(index.models)]
+            model = index.models[key % len(index.models)]
+            x = dbh[rows]
+            if cache is not None:
+                best[rows], jenk[rows] = cached_group(name, model, x, cache)
+            else:
+                best[rows] = model(x)
+                jenk[rows] = jenkins(name, x)
+        return best, jenk
+
+    def output_rows(self, best, jenk, start=0, stop=None):
+        """
+        output rows, in pipeline.HEADER order, for rows start to stop
+        given their biomass
+        """
+        part = self.records[start:stop]
+        columns = [self.strings(name, part) for name in
+                   ("psp_studyid", "standid", "species", "treeid")]
+        columns.append(part["dbh"].tolist())
+        columns.append([round(b, 4) for b in best[start:stop].tolist()])
+        columns.append([round(b1, 4) for b1 in jenk[start:stop].tolist()])
+        return [list(row) for row in zip(*columns)]
+
+    def run(self, sink, chunksize=CHUNKSIZE, cache=None):
+        """
+        compute every row and write the output rows to sink, chunksize
+        at a time. Returns the number of rows written.
+        """
+        best, jenk = self.biomass(cache=cache)
+        for start in range(0, len(self), chunksize):
+            sink.write(self.output_rows(best, jenk, start, start + chunksize))
+        return len(self)
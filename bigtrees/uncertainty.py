@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""Biomass Uncertainty
+Monte Carlo confidence intervals for best biomass, per tree and per
+stand, computed through the batch engine as (trees x samples) arrays.
+
+Each sample multiplies a tree's best biomass by two lognormal errors:
+
+    residual   drawn for every tree and sample, log-scale sd sigma
+    parameter  drawn once per equation and sample, shared by every tree
+               the equation is used for, sd sigma / sqrt(fit_size)
+
+both centred so that the mean of the samples is the point estimate.
+sigma comes from an equation's Baskerville correction factor,
+cf = exp(sigma**2 / 2). Equations without one (the log-log and form
+factor equations) use the pooled sigma of those with one as a proxy,
+and as the sizes of the fitting data sets are not recorded, fit_size is
+an assumption to set when they are known.
+
+Samples are float32, stand totals float64. Trees are taken a block at a
+time, sized so the block's samples fit in budget bytes, and stand totals
+are kept per sample, so the memory used does not grow with the
+inventory. Residuals are drawn in row order from one generator, so
+results depend on the seed but not on chunk sizes.
+
+for example:
+    mc = MonteCarlo(samples=1000, level=0.95)
+    with CSVSink("intervals.csv", INTERVAL_HEADER) as sink:
+        mc.run(cursor, sink)
+    stands = mc.stand_intervals()
+"""
+from __future__ import division
+import math
+import zlib
+import numpy as np
+
+from .batch import group_rows
+from .pipeline import CHUNKSIZE, fetch_chunks
+from .registry import REGISTRY
+
+INTERVAL_HEADER = ["PSP_STUDYID", "STANDID", "SPECIES", "TREEID", "DBH",
+                   "BEST_BIOMASS", "MEAN_BIOMASS", "LOWER", "UPPER"]
+
+# assumed number of trees each equation was fit to
+FIT_SIZE = 30
+
+# bytes of samples held at once
+BUDGET = 64 * 1024 * 1024
+
+
+def correction_sigma(cf):
+    """ the log-scale residual sd of a Baskerville correction factor """
+    return math.sqrt(2 * math.log(cf))
+
+def pooled_sigma(registry=REGISTRY):
+    """ the pooled residual sd of the equations with a correction factor """
+    sigmas = [correction_sigma(e.baskerville) for e in registry.equations
+              if e.baskerville is not None and e.component == "BIOMASS"]
+    return math.sqrt(sum(s * s for s in sigmas) / len(sigmas))
+
+class MonteCarlo(object):
+    """
+    samples of best biomass for trees, and running per-sample totals by
+    study and stand
+    """
+    def __init__(self, samples=1000, level=0.95, seed=0, fit_size=FIT_SIZE,
+                 budget=BUDGET, registry=REGISTRY):
+        self.samples = samples
+        self.level = level
+        self.seed = seed
+        self.fit_size = fit_size
+        self.block = max(1, budget // (4 * samples))
+        self.registry = registry
+        self.pooled = pooled_sigma(registry)
+        self.rng = np.random.default_rng(seed)
+        self._parameters = {}
+        self.stands = {}
+        self.stand_keys = []
+        self.stand_rows = np.zeros(0, dtype=np.int64)
+        self.stand_best = np.zeros(0)
+        self.stand_totals = np.zeros((0, samples))
+
+    def sigma(self, model):
+        """ the residual sd of a model's biomass equation """
+        if model.biomass.baskerville is not None:
+            return correction_sigma(model.biomass.baskerville)
+        return self.pooled
+
+    def parameter_errors(self, model):
+        """
+        the multiplicative parameter error of a model in each sample,
+        drawn from a generator of its own, so it does not depend on the
+        order models are met in
+        """
+        errors = self._parameters.get(model.key)
+        if errors is None:
+            sd = self.sigma(model) / math.sqrt(self.fit_size)
+            rng = np.random.default_rng(
+                [self.seed, zlib.crc32(repr(model.key).encode("utf-8"))])
+            errors = np.exp(rng.normal(-sd * sd / 2, sd, self.samples))
+            errors = errors.astype(np.float32)
+            self._parameters[model.key] = errors
+        return errors
+
+    def sample(self, species, dbh, standid):
+        """
+        the point estimates and a (trees x samples) array of sampled best
+        biomass for arrays of species, dbh (cm) and stand id
+        """
+        species = np.asarray(species)
+        dbh = np.asarray(dbh, dtype=np.float64)
+        standid = np.asarray(standid)
+        # residuals in row order, before rows are grouped by model
+        draws = self.rng.standard_normal((len(dbh), self.samples),
+                                         dtype=np.float32)
+        best = np.empty(len(dbh))
+
+        keys, groups = group_rows(species, standid, self.registry)
+        for (_, model), rows in zip(keys, groups):
+            best[rows] = model(dbh[rows])
+            sd = self.sigma(model)
+            errors = draws[rows]
+            errors *= sd
+            errors -= sd * sd / 2
+            np.exp(errors, out=errors)
+            errors *= self.parameter_errors(model)
+            draws[rows] = errors
+        draws *= best[:, None].astype(np.float32)
+        return best, draws
+
+    def _add_stands(self, study, standid, best, samples):
+        """ add a block's samples to the totals of its stands """
+        codes = np.empty(len(study), dtype=np.int64)
+        for i, key in enumerate(zip(study, standid)):
+            code = self.stands.get(key)
+            if code is None:
+                code = self.stands[key] = len(self.stand_keys)
+                self.stand_keys.append(key)
+            codes[i] = code
+
+        grow = len(self.stand_keys) - len(self.stand_rows)
+        if grow:
+            self.stand_rows = np.concatenate([self.stand_rows,
+                                              np.zeros(grow, np.int64)])
+            self.stand_best = np.concatenate([self.stand_best, np.zeros(grow)])
+            self.stand_totals = np.concatenate(
+                [self.stand_totals, np.zeros((grow, self.samples))])
+
+        order = np.argsort(codes, kind="mergesort")
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True,
+                                      sorted_codes[1:] != sorted_codes[:-1]])
+        present = sorted_codes[starts]
+        self.stand_rows[present] += np.diff(np.r_[starts, len(codes)])
+        self.stand_best[present] += np.add.reduceat(best[order], starts)
+        self.stand_totals[present] += np.add.reduceat(
+            samples[order], starts, axis=0, dtype=np.float64)
+
+    def bounds(self, samples):
+        """ mean and the level interval of each row of samples """
+        tail = (1 - self.level) / 2
+        lower, upper = np.quantile(samples, [tail, 1 - tail], axis=1)
+        return samples.mean(axis=1), lower, upper
+
+    def trees(self, chunk):
+        """
+        interval rows, in INTERVAL_HEADER order, for a chunk of
+        formconnection() rows, adding them to their stands' totals
+        """
+        output = []
+        for start in range(0, len(chunk), self.block):
+            block = chunk[start:start + self.block]
+            treeid = [str(row[0]) for row in block]
+            study = [str(row[1]) for row in block]
+            species = [str(row[2]).strip() for row in block]
+            standid = [str(row[3]) for row in block]
+            dbh = [float(row[5]) for row in block]
+
+            # as in the output, the study id chooses the equations
+            best, samples = self.sample(species, dbh, study)
+            self._add_stands(study, standid, best, samples)
+            mean, lower, upper = self.bounds(samples)
+            for row in zip(study, standid, species, treeid, dbh,
+                           best.tolist(), mean.tolist(), lower.tolist(),
+                           upper.tolist()):
+                output.append(list(row[:5]) + [round(v, 4) for v in row[5:]])
+        return output
+
+    def run(self, cursor, sink=None, chunksize=CHUNKSIZE):
+        """
+        sample every row of cursor, writing interval rows to sink if one
+        is given. Returns the number of rows.
+        """
+        count = 0
+        for chunk in fetch_chunks(cursor, chunksize):
+            rows = self.trees(chunk)
+            if sink is not None:
+                sink.write(rows)
+            count += len(rows)
+        return count
+
+    def stand_intervals(self):
+        """
+        one dict per study and stand of its rows, total best biomass,
+        and the mean and interval of the sampled totals
+        """
+        mean, lower, upper = self.bounds(self.stand_totals)
+        results = []
+        for i in sorted(range(len(self.stand_keys)),
+                        key=lambda i: self.stand_keys[i]):
+            study, standid = self.stand_keys[i]
+            results.append({"psp_studyid": study, "standid": standid,
+                            "rows": int(self.stand_rows[i]),
+                            "best_total": float(self.stand_best[i]),
+                            "mean": float(mean[i]),
+                            "lower": float(lower[i]),
+                            "upper": float(upper[i])})
+        return results
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""What-if Recalibration
+Recompute an inventory held in memory with some equation parameters
+changed, without touching bigtreesource.csv or the database.
+
+WhatIf keeps a TreeTable resident with, computed once:
+
+    the model id of every tree and the trees of each model
+    the best biomass of every tree
+    the stand of every tree and each stand's total best biomass
+
+An override names the equations it changes by species (and optionally
+component, geo and standid, as in bigtreesource.csv) and gives new
+values for any of PARAMETERS:
+
+    {"species": "PISI", "baskerville": 1.02}
+    {"species": "PSME", "component": "HEIGHT", "b0": 60.1}
+
+Only the models that use a changed equation are rerun, over their own
+trees, and stand totals are updated by the change in those trees, so a
+what-if costs in proportion to the trees it affects. Jenkins biomass
+does not depend on the equations and is not recomputed.
+
+for example:
+    whatif = WhatIf(TreeTable.load_output("bigtrees_tp001_v3.csv"))
+    result = whatif.evaluate([{"species": "PISI", "woodden": 0.4}])
+    result.stands()
+"""
+from __future__ import division
+import copy
+import math
+import numpy as np
+
+from .registry import REGISTRY, Model
+
+PARAMETERS = ("b0", "b1", "b2", "baskerville", "woodden")
+
+# the fields an override may match equations on
+MATCH = ("species", "component", "geo", "standid")
+
+
+def _value(override, name):
+    try:
+        value = float(override[name])
+    except (TypeError, ValueError):
+        raise ValueError("%s must be a number" % name)
+    if math.isnan(value) or math.isinf(value):
+        raise ValueError("%s must be finite" % name)
+    return value
+
+def patched_equations(overrides, registry=REGISTRY):
+    """
+    {equation key: Equation} of copies of the equations overrides
+    match, with their parameters changed. Later overrides apply on top
+    of earlier ones. Raises ValueError for an override that is malformed
+    or matches no equation.
+    """
+    patched = {}
+    for override in overrides:
+        if not isinstance(override, dict) or "species" not in override:
+            raise ValueError("an override needs a species")
+        unknown = set(override) - set(MATCH) - set(PARAMETERS)
+        if unknown:
+            raise ValueError("unknown override field %r; parameters are %s" %
+                             (sorted(unknown)[0], ", ".join(PARAMETERS)))
+        match = {"species": str(override["species"]),
+                 "component": str(override.get("component", "BIOMASS"))}
+        for name in ("geo", "standid"):
+            if name in override:
+                match[name] = str(override[name])
+        found = [e for e in registry.equations
+                 if all(getattr(e, name) == value
+                        for name, value in match.items())]
+        if not found:
+            raise ValueError("no equation matches %s" % ", ".join(
+                "%s=%s" % item for item in sorted(match.items())))
+        for equation in found:
+            equation = patched.get(equation.key) or copy.copy(equation)
+            for name in PARAMETERS:
+                if name in override:
+                    setattr(equation, name, _value(override, name))
+            patched[equation.key] = equation
+    return patched
+
+class Result(object):
+    """
+    a what-if: best biomass of every tree before and after, and the
+    stand totals. rows are the trees that were recomputed.
+    """
+    def __init__(self, whatif, best, totals, rows, models):
+        self.whatif = whatif
+        self.best = best
+        self.totals = totals
+        self.rows = rows
+        self.models = models
+
+    def stands(self):
+        """ one dict per study and stand of its rows and totals """
+        whatif = self.whatif
+        results = []
+        for i, (study, standid) in enumerate(whatif.stand_keys):
+            base = float(whatif.totals[i])
+            total = float(self.totals[i])
+            results.append({"psp_studyid": study, "standid": standid,
+                            "rows": int(whatif.stand_rows[i]),
+                            "best_total": base, "whatif_total": total,
+                            "difference": total - base})
+        return results
+
+    def trees(self):
+        """ one dict per recomputed tree of its best biomass before and after """
+        table = self.whatif.table
+        part = table.records[self.rows]
+        columns = [(name, table.strings(name, part))
+                   for name in ("psp_studyid", "standid", "species", "treeid")]
+        columns.append(("dbh", part["dbh"].tolist()))
+        columns.append(("best_biomass",
+                        [round(b, 4) for b in
+                         self.whatif.best[self.rows].tolist()]))
+        columns.append(("whatif_biomass",
+                        [round(b, 4) for b in self.best[self.rows].tolist()]))
+        names = [name for name, _ in columns]
+        return [dict(zip(names, row))
+                for row in zip(*[values for _, values in columns])]
+
+class WhatIf(object):
+    """ a resident inventory, and its biomass under changed parameters """
+    def __init__(self, table, registry=REGISTRY):
+        self.table = table
+        self.registry = registry
+        self.dbh = table.records["dbh"]
+        ids = table.model_ids(registry)
+        self.best = np.empty(len(table))
+
+        # the trees of each model, computed once
+        self.groups = {}
+        order = np.argsort(ids, kind="mergesort")
+        bounds = np.flatnonzero(np.diff(ids[order])) + 1
+        for rows in np.split(order, bounds) if len(order) else []:
+            model_id = int(ids[rows[0]])
+            self.groups[model_id] = rows
+            self.best[rows] = registry.index.models[model_id](self.dbh[rows])
+
+        # and the stand of each tree, for totals
+        study = table.records["psp_studyid"].astype(np.int64)
+        standid = table.records["standid"].astype(np.int64)
+        width = max(len(table.categories["standid"].values), 1)
+        stands, self.stands = np.unique(study * width + standid,
+                                        return_inverse=True)
+        self.stands = self.stands.reshape(-1)
+        self.stand_keys = [
+            (table.categories["psp_studyid"].values[code // width],
+             table.categories["standid"].values[code % width])
+            for code in stands.tolist()]
+        self.stand_rows = np.bincount(self.stands, minlength=len(stands))
+        self.totals = np.bincount(self.stands, weights=self.best,
+                                  minlength=len(stands))
+
+    def affected(self, patched):
+        """ {model id: recalibrated Model} of the models patched changes """
+        models = {}
+        for model_id in self.groups:
+            model = self.registry.index.models[model_id]
+            height = model.height
+            if model.biomass.key in patched or (
+                    height is not None and height.key in patched):
+                models[model_id] = Model(
+                    patched.get(model.biomass.key, model.biomass),
+                    None if height is None else patched.get(height.key,
+                                                            height))
+        return models
+
+    def evaluate(self, overrides):
+        """
+        the Result of recomputing the trees whose equations overrides
+        change. Raises ValueError for a malformed override.
+        """
+        models = self.affected(patched_equations(overrides, self.registry))
+        best = self.best.copy()
+        totals = self.totals.copy()
+        changed = []
+        for model_id, model in models.items():
+            rows = self.groups[model_id]
+            best[rows] = model(self.dbh[rows])
+            totals += np.bincount(self.stands[rows],
+                                  weights=best[rows] - self.best[rows],
+                                  minlength=len(totals))
+            changed.append(rows)
+        rows = np.sort(np.concatenate(changed)) if changed else \
+            np.zeros(0, dtype=np.int64)
+        return Result(self, best, totals, rows, models)
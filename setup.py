@@ -15,6 +15,15 @@ setup(
     license="MIT",
     url="https://github.com/dataRonin/bigtrees",
     packages=["bigtrees"],
-    install_requires=["Flask"],
+    package_data={"bigtrees": ["*.csv"]},
+    install_requires=["Flask", "numpy"],
+    extras_require={
+        "charts": ["matplotlib"],
+        "mssql": ["pymssql"],
+        "parquet": ["pyarrow"],
+    },
+    entry_points={
+        "console_scripts": ["bigtrees = bigtrees.cli:main"],
+    },
     keywords = ["biomass", "trees"]
 )
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+bigtrees biomass aggregation unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+from collections import defaultdict
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.aggregate import Aggregator, aggregate_output, measurement_numbers
+from bigtrees.pipeline import CSVSink, Tee
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def output_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+        next(reader)
+        return list(reader)
+
+class TestAggregate(unittest.TestCase):
+
+    def test_measurement_numbers(self):
+        """rows are numbered within their tree, across chunks"""
+        first = np.array(["A", "A", "B", "B", "B"])
+        self.assertEqual(measurement_numbers(first).tolist(), [0, 1, 0, 1, 2])
+        second = np.array(["B", "C", "C"])
+        self.assertEqual(measurement_numbers(second, "B", 3).tolist(),
+                         [3, 0, 1])
+        self.assertEqual(measurement_numbers(np.array(["B"]), "B", 4).tolist(),
+                         [4])
+
+    def test_by_stand(self):
+        """stand totals match a row by row sum, in any chunk size"""
+        rows = output_rows()
+        expected = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+        for study, standid, _, _, dbh, best, jenkins in rows:
+            totals = expected[(study, standid)]
+            totals[0] += 1
+            totals[1] += dbh
+            totals[2] += best
+            totals[3] += jenkins
+
+        for chunksize in (7, 10000):
+            results = aggregate_output(OUTPUT, ["psp_studyid", "standid"],
+                                       chunksize).results()
+            self.assertEqual(len(results), 58)
+            self.assertEqual([(r["psp_studyid"], r["standid"])
+                              for r in results], sorted(expected))
+            for result in results:
+                count, dbh, best, jenkins = expected[(result["psp_studyid"],
+                                                      result["standid"])]
+                self.assertEqual(result["rows"], count)
+                self.assertAlmostEqual(result["dbh_mean"], dbh / count)
+                self.assertAlmostEqual(result["best_total"], best, 6)
+                self.assertAlmostEqual(result["jenkins_total"], jenkins, 6)
+                self.assertAlmostEqual(result["difference"], best - jenkins, 6)
+                self.assertAlmostEqual(result["ratio"], best / jenkins)
+
+    def test_by_measurement(self):
+        """a tree's first row is measurement 0 wherever chunks split"""
+        rows = output_rows()
+        trees = len(set(row[3] for row in rows))
+        for chunksize in (1, 5, 10000):
+            aggregator = aggregate_output(OUTPUT, ["measurement"], chunksize)
+            results = aggregator.results()
+            self.assertEqual(results[0]["measurement"], 0)
+            self.assertEqual(results[0]["rows"], trees)
+            self.assertEqual(sum(r["rows"] for r in results), len(rows))
+
+    def test_species_sink(self):
+        """an aggregator aggregates rows as writeoutput writes them"""
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "out.csv")
+            species = Aggregator(["species"])
+            cursor = iter([(r[3], r[0], r[2], r[1], r[3], r[4], None)
+                           for r in output_rows()])
+            with Tee(CSVSink(path), species) as sink:
+                bt.writeoutput(cursor, sink=sink, chunksize=500)
+            results = dict((r["species"], r) for r in species.results())
+            self.assertEqual(len(results), 10)
+            self.assertEqual(results["PSME"]["rows"], 1811)
+            expected = dict((r["species"], r) for r in
+                            aggregate_output(path, ["species"]).results())
+            self.assertEqual(sorted(results), sorted(expected))
+
+            totals = os.path.join(workdir, "species.csv")
+            species.write_csv(totals)
+            with open(totals) as datafile:
+                reader = csv.reader(datafile)
+                self.assertEqual(next(reader)[:3], ["SPECIES", "ROWS",
+                                                    "DBH_MEAN"])
+                self.assertEqual(len(list(reader)), 10)
+        finally:
+            shutil.rmtree(workdir)
+
+    def test_bad_keys(self):
+        """only KEYS can be grouped on"""
+        self.assertRaises(ValueError, Aggregator, ["dbh"])
+        self.assertRaises(ValueError, Aggregator, [])
+
+if __name__ == "__main__":
+    unittest.main()
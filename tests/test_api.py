@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+bigtrees batch biomass api unit tests
+
+"""
+from __future__ import division
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+from flask_testing import TestCase
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from app import app, prepare
+from bigtrees import biggest_trees as bt
+from bigtrees.jsonstream import iter_json_array, iter_ndjson
+from bigtrees.lookup import binary_table
+from bigtrees.treeindex import build_index
+
+DATAFILE = os.path.join(HERE, os.pardir, "TP001_jenkins.csv")
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+RECORDS = [
+    {"species": "PSME", "dbh": 154.5, "standid": "MRRS"},
+    {"species": "FAKE", "dbh": 154.5, "standid": "MRRS"},
+    {"species": "TSHE", "dbh": "162.0", "standid": "RS28"},
+    {"species": "PSME", "standid": "HJRS"},
+    {"species": "ABMA", "dbh": 170.0, "standid": "SQNP"},
+]
+
+class TestJsonStream(unittest.TestCase):
+
+    def test_array_chunks(self):
+        """array items decode across chunk boundaries"""
+        body = json.dumps(RECORDS).encode("utf-8")
+        for chunksize in (1, 7, 65536):
+            items = list(iter_json_array(io.BytesIO(body), chunksize))
+            self.assertEqual(items, RECORDS)
+
+    def test_array_malformed(self):
+        """truncated or non-array bodies raise ValueError"""
+        for body in (b"", b"{}", b'[{"a": 1}', b'[{"a": 1} {"b": 2}]'):
+            stream = io.BytesIO(body)
+            self.assertRaises(ValueError, list, iter_json_array(stream, 4))
+
+    def test_ndjson(self):
+        """ndjson yields one object per non-blank line"""
+        body = b"\n".join(json.dumps(r).encode("utf-8") for r in RECORDS)
+        self.assertEqual(list(iter_ndjson(io.BytesIO(body + b"\n\n"))), RECORDS)
+
+class TestBiomassRoute(TestCase):
+
+    def create_app(self):
+        app.config["batchsize"] = 2
+        return app
+
+    def check(self, results):
+        self.assertEqual(len(results), len(RECORDS))
+        (b, b1) = bt.caseof("PSME", 154.5, "MRRS")
+        self.assertEqual(results[0]["best_biomass"], round(b, 4))
+        self.assertEqual(results[0]["jenkins_biomass"], round(b1, 4))
+        self.assertTrue("FAKE" in results[1]["error"])
+        (b, b1) = bt.caseof("TSHE", 162.0, "RS28")
+        self.assertEqual(results[2]["best_biomass"], round(b, 4))
+        self.assertTrue("dbh" in results[3]["error"])
+        self.assertEqual(results[4]["species"], "ABMA")
+
+    def test_route_biomass_json(self):
+        """Route: HTTP POST /biomass (JSON array)"""
+        with self.app.test_client() as client:
+            response = client.post("/biomass", data=json.dumps(RECORDS),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.check(json.loads(response.get_data(as_text=True)))
+
+    def test_route_biomass_ndjson(self):
+        """Route: HTTP POST /biomass (NDJSON)"""
+        body = "\n".join(json.dumps(r) for r in RECORDS)
+        with self.app.test_client() as client:
+            response = client.post("/biomass", data=body,
+                                   content_type="application/x-ndjson")
+            self.assertEqual(response.status_code, 200)
+            lines = response.get_data(as_text=True).splitlines()
+            self.check([json.loads(line) for line in lines])
+
+    def test_route_biomass_dbh(self):
+        """Route: HTTP POST /biomass (dbh that cannot be computed)"""
+        records = [{"species": "PSME", "dbh": dbh, "standid": "HJRS"}
+                   for dbh in (-1, 0, -5.5, "nan", "inf", True, 1e200)]
+        with self.app.test_client() as client:
+            response = client.post("/biomass", data=json.dumps(records),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            text = response.get_data(as_text=True)
+            self.assertFalse("NaN" in text or "Infinity" in text)
+            results = json.loads(text)
+            self.assertEqual([result["error"] for result in results],
+                             ["dbh must be positive"] * 3 +
+                             ["dbh must be finite"] * 2 +
+                             ["dbh must be a number",
+                              "biomass of PSME at dbh 1e+200 is not finite"])
+
+    def test_route_biomass_malformed(self):
+        """Route: HTTP POST /biomass (truncated body)"""
+        body = json.dumps(RECORDS)[:-1]
+        with self.app.test_client() as client:
+            response = client.post("/biomass", data=body,
+                                   content_type="application/json")
+            results = json.loads(response.get_data(as_text=True))
+            self.assertEqual(len(results), len(RECORDS) + 1)
+            self.assertTrue("malformed" in results[-1]["error"])
+
+class TestLookupRoutes(TestCase):
+
+    def create_app(self):
+        app.config["datafile"] = DATAFILE
+        app.config["output"] = OUTPUT
+        prepare()
+        return app
+
+    def get(self, url):
+        with self.app.test_client() as client:
+            response = client.get(url)
+            return response.status_code, json.loads(
+                response.get_data(as_text=True))
+
+    def test_route_lookup(self):
+        """Route: HTTP GET /lookup in each mode"""
+        status, result = self.get("/lookup?species=QUKE&dbh=73.5")
+        self.assertEqual(status, 200)
+        self.assertEqual(result["value"], 4.82057)
+        status, result = self.get("/lookup?species=QUKE&dbh=200&mode=nearest")
+        self.assertEqual((status, result["dbh"]), (200, 150.0))
+        status, result = self.get(
+            "/lookup?species=QUKE&dbh=73.55&mode=interpolate")
+        self.assertEqual(result["dbh"], 73.55)
+        self.assertTrue(4.82057 < result["value"] < 4.83633)
+
+    def test_route_lookup_errors(self):
+        """Route: HTTP GET /lookup (misses and bad arguments)"""
+        self.assertEqual(self.get("/lookup?species=FAKE&dbh=73.5")[0], 404)
+        self.assertEqual(self.get("/lookup?species=QUKE&dbh=200")[0], 404)
+        self.assertEqual(self.get("/lookup?species=QUKE")[0], 400)
+        self.assertEqual(self.get("/lookup?species=QUKE&dbh=nan")[0], 400)
+        self.assertEqual(
+            self.get("/lookup?species=QUKE&dbh=73.5&mode=cubic")[0], 400)
+
+    def test_route_lookup_range(self):
+        """Route: HTTP GET /lookup/range"""
+        status, result = self.get("/lookup/range?species=QUKE&low=73.5&high=73.7")
+        self.assertEqual(status, 200)
+        self.assertEqual(result["dbh"], [73.5, 73.6, 73.7])
+        self.assertEqual(result["value"], [4.82057, 4.83633, 4.85213])
+        self.assertEqual(
+            self.get("/lookup/range?species=QUKE&low=80&high=70")[0], 400)
+
+    def test_route_lookup_compiled(self):
+        """Route: HTTP GET /lookup, once the table is compiled"""
+        workdir = tempfile.mkdtemp()
+        try:
+            app.config["datafile"] = os.path.join(workdir, "table.csv")
+            with open(app.config["datafile"], "w") as datafile:
+                datafile.write('"PSME",5.0,0.00857\n')
+            status, result = self.get("/lookup?species=PSME&dbh=5.0")
+            self.assertEqual(status, 503)
+            self.assertTrue("being compiled" in result["error"])
+
+            binary_table(app.config["datafile"], build=False).wait()
+            status, result = self.get("/lookup?species=PSME&dbh=5.0")
+            self.assertEqual((status, result["value"]), (200, 0.00857))
+            self.assertEqual(
+                self.get("/lookup/range?species=PSME&low=5&high=6")[0], 200)
+        finally:
+            app.config["datafile"] = DATAFILE
+            shutil.rmtree(workdir)
+
+    def test_route_tree(self):
+        """Route: HTTP GET /tree/<treeid>, once the output is indexed"""
+        workdir = tempfile.mkdtemp()
+        try:
+            app.config["output"] = os.path.join(workdir, "output.csv")
+            shutil.copy(OUTPUT, app.config["output"])
+            status, result = self.get("/tree/AG05000100019")
+            self.assertEqual(status, 503)
+            self.assertTrue("bigtrees index" in result["error"])
+
+            build_index(app.config["output"])
+            status, result = self.get("/tree/AG05000100019")
+            self.assertEqual(status, 200)
+            self.assertEqual(result["treeid"], "AG05000100019")
+            self.assertEqual(result["measurements"][0]["dbh"], 154.5)
+            self.assertEqual(result["measurements"][0]["species"], "PSME")
+            self.assertEqual(self.get("/tree/NOSUCHTREE")[0], 404)
+        finally:
+            shutil.rmtree(workdir)
+
+    def test_route_whatif_unloaded(self):
+        """Route: HTTP POST /whatif before the inventory is loaded"""
+        body = {"overrides": [{"species": "PISI", "woodden": 0.4}]}
+        try:
+            app.config["inventory"] = "inventory.db"
+            with self.app.test_client() as client:
+                response = client.post("/whatif", data=json.dumps(body),
+                                       content_type="application/json")
+                self.assertEqual(response.status_code, 503)
+        finally:
+            app.config["inventory"] = None
+
+    def test_inventory_min_dbh(self):
+        """a SOURCE inventory keeps every tree unless told otherwise"""
+        from app import load_inventory
+        workdir = tempfile.mkdtemp()
+        try:
+            app.config["inventory"] = os.path.join(workdir, "inventory.csv")
+            with open(app.config["inventory"], "w") as flatfile:
+                flatfile.write("TREEID,PSP_STUDYID,SPECIES,STANDID,DBH,"
+                               "TREE_VIGOR\n"
+                               "T1,HJRS,PSME,RS01,20.5,1\n"
+                               "T2,HJRS,PSME,RS01,160.0,1\n")
+            self.assertEqual(len(load_inventory().table), 2)
+            app.config["inventory_min_dbh"] = 150
+            self.assertEqual(len(load_inventory().table), 1)
+        finally:
+            app.config["inventory"] = None
+            app.config["inventory_min_dbh"] = None
+            shutil.rmtree(workdir)
+
+    def test_route_whatif(self):
+        """Route: HTTP POST /whatif"""
+        body = {"overrides": [{"species": "PISI", "woodden": 0.4}],
+                "trees": True}
+        with self.app.test_client() as client:
+            response = client.post("/whatif", data=json.dumps(body),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            result = json.loads(response.get_data(as_text=True))
+            self.assertEqual(result["recomputed"], 635)
+            self.assertEqual(len(result["trees"]), 635)
+            self.assertTrue(all(tree["whatif_biomass"] > tree["best_biomass"]
+                                for tree in result["trees"]))
+            changed = [s for s in result["stands"] if s["difference"]]
+            self.assertTrue(sum(s["rows"] for s in changed) >= 635)
+
+            for body in ({"overrides": [{"species": "FAKE", "b0": 1}]},
+                         {"overrides": [{"species": "PSME", "b0": None}]},
+                         {"overrides": [{"species": "PSME", "b0": "nan"}]},
+                         {"overrides": "PSME"}, []):
+                response = client.post("/whatif", data=json.dumps(body),
+                                       content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+
+    def test_route_chart(self):
+        """Route: HTTP GET /chart, cached and revalidated by ETag"""
+        url = "/chart?species=PSME,TSHE&low=5&high=300"
+        with self.app.test_client() as client:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "image/png")
+            self.assertTrue(response.data.startswith(b"\x89PNG"))
+            self.assertTrue("max-age" in response.headers["Cache-Control"])
+            etag = response.headers["ETag"]
+
+            again = client.get("/chart?species=PSME&species=TSHE&low=5&high=300")
+            self.assertEqual((again.headers["ETag"], again.data),
+                             (etag, response.data))
+            response = client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+
+            response = client.get("/chart?species=PSME&format=svg")
+            self.assertEqual(response.mimetype, "image/svg+xml")
+            for url in ("/chart", "/chart?species=FAKE",
+                        "/chart?species=PSME&format=gif",
+                        "/chart?species=PSME&low=10&high=5",
+                        "/chart?species=PSME&low=small"):
+                self.assertEqual(client.get(url).status_code, 400)
+
+    def test_route_index_mode(self):
+        """Route: HTTP POST / with a lookup mode"""
+        with self.app.test_client() as client:
+            response = client.post("/", data={"species": "QUKE",
+                                              "quantity": "73.55",
+                                              "mode": "nearest"})
+            self.assertTrue(b"4.82057" in response.data)
+            for quantity in ("nan", "inf"):
+                response = client.post("/", data={"species": "QUKE",
+                                                  "quantity": quantity})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(b"No match found" in response.data)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    for case in (TestJsonStream, TestBiomassRoute, TestLookupRoutes):
+        suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+bigtrees vectorized biomass unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.batch import compute_biomass, JENKINS
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+class TestBatch(unittest.TestCase):
+
+    def test_matches_caseof(self):
+        """compute_biomass agrees with caseof on every branch"""
+        stands = ["MRRS", "RS28", "RS04", "HJRS", "NFGY", "SQNP"]
+        species = []
+        standid = []
+        for s in sorted(JENKINS):
+            for stand in stands:
+                species.append(s)
+                standid.append(stand)
+        dbh = np.linspace(150.0, 300.0, len(species)).round(1)
+
+        best, jenk = compute_biomass(species, dbh, standid)
+        for i in range(len(species)):
+            (b, b1) = bt.caseof(species[i], float(dbh[i]), standid[i])
+            self.assertAlmostEqual(best[i], b, places=10)
+            self.assertEqual(jenk[i], b1)
+
+    def test_reproduces_output_file(self):
+        """compute_biomass reproduces bigtrees_tp001_v3.csv to 4 digits"""
+        with open(OUTPUT) as datafile:
+            rows = list(csv.reader(datafile))[1:]
+        best, jenk = compute_biomass([row[2] for row in rows],
+                                     [float(row[4]) for row in rows],
+                                     [row[0] for row in rows])
+        for i, row in enumerate(rows):
+            self.assertEqual(round(float(best[i]), 4), float(row[5]))
+            self.assertEqual(round(float(jenk[i]), 4), float(row[6]))
+
+    def test_empty(self):
+        """compute_biomass accepts empty arrays"""
+        best, jenk = compute_biomass([], [], [])
+        self.assertEqual(len(best), 0)
+        self.assertEqual(len(jenk), 0)
+
+    def test_unknown_species(self):
+        """compute_biomass rejects species without an equation"""
+        self.assertRaises(ValueError, compute_biomass, ["FAKE"], [150.0], ["HJRS"])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestBatch)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+bigtrees allometry chart unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import copy
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees import charts
+from bigtrees.charts import Charts, curves, draw
+from bigtrees.registry import REGISTRY, Registry
+
+def recalibrated(species, **parameters):
+    """ a Registry with the biomass equations of species changed """
+    equations = []
+    for equation in REGISTRY.equations:
+        equation = copy.copy(equation)
+        if equation.species == species and equation.component == "BIOMASS":
+            for name, value in parameters.items():
+                setattr(equation, name, value)
+        equations.append(equation)
+    return Registry(equations)
+
+@unittest.skipIf(charts.matplotlib is None, "matplotlib is not installed")
+class ChartsTest(unittest.TestCase):
+    """ best and jenkins curves drawn as images """
+
+    def test_curves(self):
+        """ every curve point equals caseof at its dbh """
+        dbh, lines = curves(["PSME", "TSHE"], 5.0, 300.0, "RS28", points=50)
+        self.assertEqual(len(dbh), 50)
+        self.assertEqual((dbh[0], dbh[-1]), (5.0, 300.0))
+        self.assertEqual([name for name, _, _ in lines], ["PSME", "TSHE"])
+        for name, best, jenk in lines:
+            expected = [bt.caseof(name, x, "RS28") for x in dbh.tolist()]
+            np.testing.assert_allclose(best, [b for b, _ in expected])
+            np.testing.assert_allclose(jenk, [b1 for _, b1 in expected])
+        self.assertRaises(ValueError, curves, ["FAKE"], 5.0, 300.0)
+
+    def test_draw(self):
+        """ png and svg images, the same bytes each time """
+        png = draw(["PSME"], 5.0, 150.0)
+        self.assertTrue(png.startswith(b"\x89PNG\r\n\x1a\n"))
+        self.assertEqual(draw(["PSME"], 5.0, 150.0), png)
+        svg = draw(["PSME", "SEGI"], 5.0, 150.0, format="svg")
+        self.assertTrue(b"<svg" in svg)
+        self.assertEqual(draw(["PSME", "SEGI"], 5.0, 150.0, format="svg"), svg)
+
+    def test_cache(self):
+        """ a chart is drawn once, and evicted least recently used first """
+        cache = Charts(maxsize=2)
+        etag, image = cache.get(["PSME"], 5.0, 150.0)
+        self.assertEqual(cache.get(["PSME"], 5.0, 150.0), (etag, image))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.etag(["PSME"], 5.0, 150.0), etag)
+
+        cache.get(["TSHE"], 5.0, 150.0)
+        cache.get(["PSME"], 5.0, 150.0)
+        cache.get(["PSME"], 5.0, 150.0, format="svg")
+        self.assertEqual(len(cache), 2)
+        cache.get(["PSME"], 5.0, 150.0)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits), (0, 0))
+
+    def test_etag(self):
+        """ the etag changes with the range, the stand and the equations """
+        cache = Charts()
+        etag = cache.etag(["PSME", "TSHE"], 5.0, 150.0)
+        self.assertNotEqual(cache.etag(["PSME", "TSHE"], 5.0, 151.0), etag)
+        self.assertNotEqual(cache.etag(["PSME", "TSHE"], 5.0, 150.0, "MRRS"),
+                            etag)
+        self.assertNotEqual(cache.etag(["TSHE", "PSME"], 5.0, 150.0), etag)
+        other = Charts(registry=recalibrated("TSHE", baskerville=1.1))
+        self.assertNotEqual(other.etag(["PSME", "TSHE"], 5.0, 150.0), etag)
+        self.assertEqual(other.etag(["PSME"], 5.0, 150.0),
+                         cache.etag(["PSME"], 5.0, 150.0))
+        self.assertRaises(ValueError, cache.etag, ["PSME"], 5.0, 150.0,
+                          format="gif")
+        self.assertRaises(ValueError, cache.etag, ["FAKE"], 5.0, 150.0)
+
+if __name__ == "__main__":
+    unittest.main()
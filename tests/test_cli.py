@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+bigtrees console script and import time unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+ROOT = os.path.join(HERE, os.pardir)
+sys.path.insert(0, ROOT)
+
+from bigtrees.cli import main, open_source
+from bigtrees.lookup import BinaryTable
+from bigtrees.sources import FileSource, SQLiteSource
+
+OUTPUT = os.path.join(ROOT, "bigtrees", "bigtrees_tp001_v3.csv")
+DATAFILE = os.path.join(ROOT, "TP001_jenkins.csv")
+
+# seconds a bare "import bigtrees" may take, with room for slow machines
+IMPORT_BUDGET = 0.5
+
+HEAVY = ["numpy", "matplotlib", "pymssql", "pyarrow", "flask"]
+
+def fresh_python(code):
+    """ the stdout of code run in a new interpreter on this checkout """
+    return subprocess.check_output([sys.executable, "-c", code],
+                                   cwd=ROOT).decode("utf-8").strip()
+
+class TestImport(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        """importing the package loads none of the optional backends"""
+        loaded = fresh_python(
+            "import sys, bigtrees, bigtrees.cli; "
+            "print(','.join(m for m in %r if m in sys.modules))" % HEAVY)
+        self.assertEqual(loaded, "")
+
+    def test_columnar_lazy(self):
+        """the columnar sinks load pyarrow only when a Parquet one is made"""
+        loaded = fresh_python("import sys, bigtrees.columnar; "
+                              "print('pyarrow' in sys.modules)")
+        self.assertEqual(loaded, "False")
+
+    def test_import_budget(self):
+        """importing the package stays within the import time budget"""
+        elapsed = fresh_python(
+            "import time; start = time.time(); import bigtrees; "
+            "print(time.time() - start)")
+        self.assertTrue(float(elapsed) < IMPORT_BUDGET, elapsed)
+
+    def test_equations(self):
+        """the equations are still exported from the package"""
+        import bigtrees
+        self.assertEqual(bigtrees.caseof("PSME", 154.5, "HJRS"),
+                         bigtrees.andrewspsme(154.5, "HJRS"))
+
+class TestCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def inventory(self):
+        """ a SQLite copy of the big-tree output's trees """
+        path = os.path.join(self.workdir, "inventory.db")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE tp00101 (treeid PRIMARY KEY, psp_studyid, "
+                           "species, standid)")
+        connection.execute("CREATE TABLE tp00102 (treeid, dbh, tree_vigor)")
+        with open(OUTPUT) as datafile:
+            reader = csv.reader(datafile)
+            next(reader)
+            for study, standid, species, treeid, dbh, _, _ in reader:
+                connection.execute("INSERT OR IGNORE INTO tp00101 VALUES "
+                                   "(?, ?, ?, ?)",
+                                   (treeid, study, species, standid))
+                connection.execute("INSERT INTO tp00102 VALUES (?, ?, NULL)",
+                                   (treeid, float(dbh)))
+        connection.commit()
+        connection.close()
+        return path
+
+    def test_open_source(self):
+        """SOURCE names pick the backend"""
+        self.assertTrue(isinstance(open_source("a.db"), SQLiteSource))
+        self.assertTrue(isinstance(open_source("a.csv"), FileSource))
+        self.assertRaises(ValueError, open_source, "a.txt")
+
+    def test_compute(self):
+        """compute reproduces the big-tree output from a SQLite inventory"""
+        path = os.path.join(self.workdir, "out.csv")
+        self.assertEqual(main(["compute", self.inventory(), "-o", path]), 0)
+        with open(path) as datafile:
+            with open(OUTPUT) as expected:
+                self.assertEqual(datafile.read(), expected.read())
+
+    def test_build_table(self):
+        """build-table writes TP001_jenkins.csv"""
+        path = os.path.join(self.workdir, "table.csv")
+        binary = os.path.join(self.workdir, "table.jkt")
+        self.assertEqual(main(["build-table", "-o", path, "--binary", binary]),
+                         0)
+        with open(path, "rb") as datafile:
+            with open(DATAFILE, "rb") as expected:
+                self.assertEqual(datafile.read(), expected.read())
+        self.assertTrue(os.path.exists(binary))
+
+    def test_compile_table(self):
+        """build-table --compile writes the binary table beside a csv"""
+        path = os.path.join(self.workdir, "table.csv")
+        shutil.copy(DATAFILE, path)
+        self.assertEqual(main(["build-table", "--compile", path]), 0)
+        binary = os.path.join(self.workdir, "table.jkt")
+        self.assertTrue(os.path.exists(binary))
+        self.assertEqual(
+            BinaryTable(binary, source=path, build=False).lookup("QUKE", 73.5),
+            "4.82057")
+
+    def test_unknown_source(self):
+        """an unknown source is an error, not a traceback"""
+        self.assertEqual(main(["compute", "inventory.txt"]), 1)
+
+    def test_serve_outside_checkout(self):
+        """serve away from a checkout says so instead of failing to import"""
+        workdir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(main(["serve", "--root", workdir]), 1)
+        finally:
+            shutil.rmtree(workdir)
+
+    def test_serve_elsewhere(self):
+        """serve --root finds the checkout's files from another directory"""
+        from app import app
+        config = dict(app.config)
+        cwd = os.getcwd()
+        try:
+            app.config["output"] = os.path.join("bigtrees",
+                                                "bigtrees_tp001_v3.csv")
+            os.chdir(self.workdir)
+            # a missing data file is an error, not a traceback
+            self.assertEqual(main(["serve", "--root", ROOT,
+                                   "--datafile", "missing.csv"]), 1)
+            self.assertEqual(os.path.realpath(app.config["datafile"]),
+                             os.path.realpath(os.path.join(self.workdir,
+                                                           "missing.csv")))
+            self.assertEqual(os.path.realpath(app.config["output"]),
+                             os.path.realpath(OUTPUT))
+        finally:
+            os.chdir(cwd)
+            app.config.update(config)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+bigtrees columnar output unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+import numpy as np
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees import columnar
+from bigtrees.columnar import ColumnarSink, ParquetSink, load_columns
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        with open(OUTPUT) as datafile:
+            reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+            next(reader)
+            self.expected = list(reader)
+        self.rows = [(treeid, study, species, standid, treeid, dbh, None)
+                     for study, standid, species, treeid, dbh, _, _
+                     in self.expected]
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_round_trip(self):
+        """a columnar output loads back to the csv output"""
+        path = os.path.join(self.workdir, "out.npy")
+        with ColumnarSink(path) as sink:
+            bt.writeoutput(iter(self.rows), chunksize=500, sink=sink)
+
+        columns = load_columns(path)
+        self.assertTrue(isinstance(columns.records, np.memmap))
+        self.assertEqual(len(columns), len(self.expected))
+        self.assertEqual(os.path.getsize(path),
+                         columnar.HEADER_SIZE + len(columns) * 34)
+        for i, name in enumerate(columnar.NAMES):
+            if name in columnar.CATEGORICAL:
+                values = columns.decode(name).tolist()
+            else:
+                values = columns[name].tolist()
+            self.assertEqual(values, [row[i] for row in self.expected])
+
+        self.assertEqual(len(columns.categories["species"]), 10)
+        psme = columns.mask("species", "PSME")
+        self.assertEqual(psme.sum(), 1811)
+        self.assertFalse(columns.mask("species", "FAKE").any())
+
+    def test_code_range(self):
+        """codes that would not fit their column raise, not wrap"""
+        path = os.path.join(self.workdir, "out.npy")
+        rows = [["HJRS", "S%d" % i, "PSME", "T%d" % i, 155.0, 1.0, 1.0]
+                for i in range(65537)]
+        with ColumnarSink(path) as sink:
+            sink.write(rows[:65536])
+            self.assertRaises(ValueError, sink.write, rows[65536:])
+
+    def test_empty(self):
+        """an empty output is a valid zero-length file"""
+        path = os.path.join(self.workdir, "empty.npy")
+        with ColumnarSink(path):
+            pass
+        self.assertEqual(len(load_columns(path)), 0)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        """the parquet output has the same columns"""
+        path = os.path.join(self.workdir, "out.parquet")
+        with ParquetSink(path) as sink:
+            bt.writeoutput(iter(self.rows), chunksize=500, sink=sink)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column_names, columnar.NAMES)
+        self.assertEqual(table.num_rows, len(self.expected))
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestColumnar)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+bigtrees equation dispatch unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+
+class TestDispatch(unittest.TestCase):
+
+    def test_caseof_regions(self):
+        """caseof picks the rocky equations for MRRS only"""
+        self.assertEqual(bt.caseof("PSME", 160.0, "MRRS"), bt.rockypsme(160.0))
+        self.assertEqual(bt.caseof("PSME", 160.0, "HJRS"),
+                         bt.andrewspsme(160.0, "HJRS"))
+        self.assertEqual(bt.caseof("PSME", 160.0, "RS28"),
+                         bt.andrewspsme(160.0, "RS28"))
+        self.assertEqual(bt.caseof("THPL", 160.0, "MRRS"), bt.rockythpl(160.0))
+        self.assertEqual(bt.caseof("THPL", 160.0, "HJRS"), bt.andrewsthpl(160.0))
+        self.assertEqual(bt.caseof("TSHE", 160.0, "RS04"), bt.tshe(160.0, "RS04"))
+
+    def test_caseof_single_equation(self):
+        """caseof uses the same equation for every region"""
+        for species, equation in [("SEGI", bt.segi), ("PISI", bt.pisi),
+                                  ("ABMA", bt.abco), ("PILA", bt.pila)]:
+            for standid in ("MRRS", "HJRS"):
+                self.assertEqual(bt.caseof(species, 180.0, standid),
+                                 equation(180.0))
+
+    def test_unknown_species(self):
+        """caseof raises ValueError naming an unknown species"""
+        try:
+            bt.caseof("FAKE", 160.0, "HJRS")
+        except ValueError as exc:
+            self.assertTrue("FAKE" in str(exc))
+        else:
+            self.fail("no error for an unknown species")
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDispatch)
+    unittest.TextTestRunner(verbosity=2).run(suite)
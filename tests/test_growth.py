@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+bigtrees growth time series unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import math
+import random
+import shutil
+import sqlite3
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.growth import growth_rows, run_growth, tree_chunks
+from bigtrees.sources import RowSource, SQLiteSource
+
+# (treeid, psp_studyid, species, standid, year, dbh, tree_vigor), with
+# one tree's measurements out of year order
+SERIES = [
+    ("AG05000100019", "AG05", "PSME", "AG05", 1984, 154.5, "1"),
+    ("AG05000100019", "AG05", "PSME", "AG05", 1990, 156.1, "1"),
+    ("AG05000100019", "AG05", "PSME", "AG05", 1996, 158.0, "1"),
+    ("HR01000100001", "HJRS", "TSHE", "HR01", 1995, 161.0, "1"),
+    ("HR01000100001", "HJRS", "TSHE", "HR01", 1983, 155.0, "1"),
+    ("HR02000100007", "HJRS", "THPL", "HR02", 1988, 170.2, "1"),
+]
+
+def random_series(trees=300, seed=0):
+    """ series() rows of trees with one to five measurements each """
+    rng = random.Random(seed)
+    rows = []
+    for tree in range(trees):
+        treeid = "RS%011d" % tree
+        species = rng.choice(["PSME", "TSHE", "THPL", "ABPR", "PISI"])
+        dbh = round(rng.uniform(150.0, 250.0), 1)
+        year = rng.randint(1978, 1990)
+        for _ in range(rng.randint(1, 5)):
+            rows.append((treeid, "HJRS", species, "RS01", year, dbh, "1"))
+            dbh = round(dbh + rng.uniform(0.0, 3.0), 1)
+            year += rng.randint(0, 8)
+    return rows
+
+class ListSink(object):
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+class GrowthTest(unittest.TestCase):
+    """ biomass increments between a tree's measurements """
+
+    def test_intervals(self):
+        """ increments follow each tree's measurements in year order """
+        rows = growth_rows(SERIES)
+        self.assertEqual([(row[3], row[4]) for row in rows],
+                         [("AG05000100019", 1984), ("AG05000100019", 1990),
+                          ("AG05000100019", 1996), ("HR01000100001", 1983),
+                          ("HR01000100001", 1995), ("HR02000100007", 1988)])
+        for i in (0, 3, 5):
+            self.assertEqual(rows[i][8:], [None] * 5)
+
+        before = bt.caseof("PSME", 154.5, "AG05")[0]
+        after = bt.caseof("PSME", 156.1, "AG05")[0]
+        years, grown, increment, rate, relative = rows[1][8:]
+        self.assertEqual(years, 6.0)
+        self.assertEqual(grown, 1.6)
+        self.assertAlmostEqual(increment, after - before, places=3)
+        self.assertAlmostEqual(rate, (after - before) / 6, places=3)
+        self.assertAlmostEqual(relative, math.log(after / before) / 6,
+                               places=3)
+
+    def test_zero_interval(self):
+        """ a repeated year has an increment but no rate """
+        rows = growth_rows([SERIES[0], SERIES[0][:4] + (1984, 155.0, "1")])
+        self.assertEqual(rows[1][8], 0.0)
+        self.assertTrue(rows[1][10] > 0)
+        self.assertEqual(rows[1][11:], [None, None])
+
+    def test_reference(self):
+        """ the vectorized intervals match a loop over each tree """
+        rows = growth_rows(random_series())
+        previous = None
+        for row in rows:
+            if previous is None or previous[3] != row[3]:
+                self.assertEqual(row[8:], [None] * 5)
+            else:
+                span = row[4] - previous[4]
+                best, before = (bt.caseof(row[2], row[5], "HJRS")[0],
+                                bt.caseof(row[2], previous[5], "HJRS")[0])
+                self.assertEqual(row[8], span)
+                self.assertAlmostEqual(row[10], best - before, places=3)
+                if span:
+                    self.assertAlmostEqual(row[11], (best - before) / span,
+                                           places=3)
+            previous = row
+
+    def test_tree_chunks(self):
+        """ chunks are cut between trees, never within one """
+        rows = random_series(50)
+        for size in (1, 2, 7, 1000):
+            chunks = list(tree_chunks(rows[i:i + size]
+                                      for i in range(0, len(rows), size)))
+            self.assertEqual(sum(chunks, []), rows)
+            for one, other in zip(chunks, chunks[1:]):
+                self.assertNotEqual(one[-1][0], other[0][0])
+
+    def test_chunksize(self):
+        """ output does not depend on the chunk size """
+        rows = random_series(100)
+        expected = growth_rows(rows)
+        for chunksize in (1, 3, 64):
+            sink = ListSink()
+            self.assertEqual(run_growth(iter(rows), sink, chunksize),
+                             len(rows))
+            self.assertEqual(sink.rows, expected)
+
+    def test_sources(self):
+        """ SQLite and in-memory sources give rows with their years """
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "inventory.db")
+            connection = sqlite3.connect(path)
+            connection.execute("CREATE TABLE tp00101 (treeid TEXT, "
+                               "psp_studyid TEXT, species TEXT, standid TEXT)")
+            connection.execute("CREATE TABLE tp00102 (treeid TEXT, "
+                               "year INTEGER, dbh REAL, tree_vigor TEXT)")
+            trees = dict((row[0], row[:4]) for row in SERIES)
+            connection.executemany("INSERT INTO tp00101 VALUES (?, ?, ?, ?)",
+                                   trees.values())
+            connection.executemany("INSERT INTO tp00102 VALUES (?, ?, ?, ?)",
+                                   [(row[0], row[4], row[5], row[6])
+                                    for row in SERIES])
+            connection.commit()
+            connection.close()
+
+            series = list(SQLiteSource(path).series())
+            self.assertEqual([(row[0], row[4]) for row in series],
+                             [(row[0], row[4]) for row in
+                              sorted(SERIES, key=lambda row: row[::4])])
+            self.assertEqual(growth_rows(series), growth_rows(SERIES))
+        finally:
+            shutil.rmtree(workdir)
+        self.assertEqual(growth_rows(list(RowSource(SERIES).series())),
+                         growth_rows(SERIES))
+
+    def test_min_dbh(self):
+        """ min_dbh keeps every measurement of a tree that passes it """
+        rows = [("T1", "HJRS", "PSME", "RS01", 1980, 140.0, "1"),
+                ("T1", "HJRS", "PSME", "RS01", 1990, 149.0, "1"),
+                ("T1", "HJRS", "PSME", "RS01", 2000, 152.5, "1"),
+                ("T2", "HJRS", "TSHE", "RS01", 1980, 120.0, "1"),
+                ("T2", "HJRS", "TSHE", "RS01", 1990, 130.0, "1")]
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "inventory.db")
+            connection = sqlite3.connect(path)
+            connection.execute("CREATE TABLE tp00101 (treeid TEXT, "
+                               "psp_studyid TEXT, species TEXT, standid TEXT)")
+            connection.execute("CREATE TABLE tp00102 (treeid TEXT, "
+                               "year INTEGER, dbh REAL, tree_vigor TEXT)")
+            connection.executemany("INSERT INTO tp00101 VALUES (?, ?, ?, ?)",
+                                   set(row[:4] for row in rows))
+            connection.executemany("INSERT INTO tp00102 VALUES (?, ?, ?, ?)",
+                                   [(row[0], row[4], row[5], row[6])
+                                    for row in rows])
+            connection.commit()
+            connection.close()
+            series = list(SQLiteSource(path, min_dbh=150).series())
+        finally:
+            shutil.rmtree(workdir)
+        self.assertEqual([tuple(row) for row in series], rows[:3])
+        self.assertEqual(list(RowSource(rows, min_dbh=150).series()),
+                         rows[:3])
+        self.assertEqual(len(list(RowSource(rows).series())), 5)
+        # the interval that crosses 150 cm is reported
+        growth = growth_rows(rows[:3])
+        self.assertEqual((growth[2][4], growth[2][9]), (2000, 3.5))
+
+if __name__ == "__main__":
+    unittest.main()
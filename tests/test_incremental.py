@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+bigtrees incremental recomputation unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import copy
+import random
+import shutil
+import itertools
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.incremental import incremental_run, manifest_path, species_version
+from bigtrees.pipeline import biomass_rows
+from bigtrees.registry import Equation, Registry, REGISTRY
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def cursor_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        return [(treeid, study, species, standid, treeid, float(dbh), None)
+                for study, standid, species, treeid, dbh, _, _ in reader]
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "out.csv")
+        self.rows = cursor_rows()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def read(self, path):
+        with open(path) as datafile:
+            return datafile.read()
+
+    def full(self, rows):
+        path = os.path.join(self.workdir, "full.csv")
+        bt.writeoutput(iter(rows), path)
+        return self.read(path)
+
+    def test_first_run(self):
+        """the first run computes every row and matches writeoutput"""
+        stats = incremental_run(iter(self.rows), self.path)
+        self.assertEqual(stats["computed"], len(self.rows))
+        self.assertEqual(stats["reused"], 0)
+        self.assertEqual(self.read(self.path), self.read(OUTPUT))
+        self.assertTrue(os.path.exists(manifest_path(self.path)))
+
+    def test_unchanged(self):
+        """a second run over the same rows computes nothing"""
+        incremental_run(iter(self.rows), self.path)
+        stats = incremental_run(iter(self.rows), self.path, chunksize=500)
+        self.assertEqual(stats, {"reused": len(self.rows), "computed": 0,
+                                 "dropped": 0})
+        self.assertEqual(self.read(self.path), self.read(OUTPUT))
+
+    def test_changes(self):
+        """new, changed and removed measurements are spliced in"""
+        incremental_run(iter(self.rows), self.path)
+        rows = list(self.rows)
+        treeid, study, species, standid, _, dbh, vigor = rows[10]
+        rows[10] = (treeid, study, species, standid, treeid, dbh + 1.5, vigor)
+        # a remeasurement after the last one of a tree, and the last
+        # measurement of another tree removed
+        treeid, study, species, standid, _, dbh, vigor = rows[30]
+        rows.insert(31, (treeid, study, species, standid, treeid, dbh + 3.0,
+                         vigor))
+        del rows[23]
+        rows.append(("ZZZZ9999", "MRRS", "PSME", "RS01", "ZZZZ9999", 175.0,
+                     None))
+        stats = incremental_run(iter(rows), self.path, chunksize=100)
+        self.assertEqual(stats["computed"], 3)
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(self.read(self.path), self.full(rows))
+
+    def test_reordered(self):
+        """a tree whose rows come back in another order is reused"""
+        incremental_run(iter(self.rows), self.path)
+        rng = random.Random(0)
+        rows = []
+        for _, tree in itertools.groupby(self.rows, lambda row: row[0]):
+            tree = list(tree)
+            rng.shuffle(tree)
+            rows.extend(tree)
+        self.assertNotEqual(rows, self.rows)
+        stats = incremental_run(iter(rows), self.path, chunksize=300)
+        self.assertEqual(stats, {"reused": len(rows), "computed": 0,
+                                 "dropped": 0})
+        self.assertEqual(self.read(self.path), self.full(rows))
+
+    def test_repeated_dbh(self):
+        """rows of a tree with the same dbh are told apart"""
+        rows = [("T1", "HJRS", "PSME", "RS01", "T1", 160.0, None),
+                ("T1", "HJRS", "PSME", "RS01", "T1", 160.0, None),
+                ("T1", "HJRS", "PSME", "RS01", "T1", 161.0, None)]
+        incremental_run(iter(rows), self.path)
+        stats = incremental_run(iter(rows[:2]), self.path)
+        self.assertEqual(stats, {"reused": 2, "computed": 0, "dropped": 1})
+        stats = incremental_run(iter(rows), self.path)
+        self.assertEqual(stats, {"reused": 2, "computed": 1, "dropped": 0})
+        self.assertEqual(self.read(self.path), self.full(rows))
+
+    def test_species_moved(self):
+        """a row whose species changes is recomputed"""
+        incremental_run(iter(self.rows), self.path)
+        rows = list(self.rows)
+        treeid, study, species, standid, _, dbh, vigor = rows[5]
+        other = "TSHE" if species != "TSHE" else "PSME"
+        rows[5] = (treeid, study, other, standid, treeid, dbh, vigor)
+        stats = incremental_run(iter(rows), self.path)
+        self.assertEqual(stats["computed"], 1)
+        self.assertEqual(self.read(self.path), self.full(rows))
+
+    def test_registry(self):
+        """rows are computed with the registry whose versions they record"""
+        equations = []
+        for equation in REGISTRY.equations:
+            equation = copy.copy(equation)
+            if equation.species == "PSME" and equation.component == "BIOMASS":
+                equation.woodden = 0.5
+            equations.append(equation)
+        registry = Registry(equations)
+        incremental_run(iter(self.rows), self.path, registry=registry)
+        with open(self.path) as datafile:
+            written = list(csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC))
+        expected = biomass_rows(self.rows, registry=registry)
+        self.assertEqual([row[5] for row in written[1:]],
+                         [row[5] for row in expected])
+        self.assertNotEqual(self.read(self.path), self.read(OUTPUT))
+
+        # back on the default registry, the PSME rows are computed again
+        psme = sum(1 for row in self.rows if row[2].strip() == "PSME")
+        stats = incremental_run(iter(self.rows), self.path)
+        self.assertEqual(stats["computed"], psme)
+        self.assertEqual(self.read(self.path), self.read(OUTPUT))
+
+    def test_species_version(self):
+        """recalibrating one species changes only its version"""
+        equations = []
+        for equation in REGISTRY.equations:
+            if equation.species == "THPL" and equation.b0 is not None:
+                equation = Equation(equation.species, equation.component,
+                                    equation.geo, equation.standid,
+                                    equation.rawform, equation.b0 * 1.01,
+                                    equation.b1, equation.b2,
+                                    equation.baskerville, equation.woodden,
+                                    equation.quality)
+            equations.append(equation)
+        registry = Registry(equations)
+        self.assertNotEqual(species_version("THPL", registry),
+                            species_version("THPL"))
+        self.assertEqual(species_version("PSME", registry),
+                         species_version("PSME"))
+        self.assertEqual(species_version("ABMA"), species_version("ABMA"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+bigtrees jenkins lookup table unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees.lookup import (MODES, BinaryTable, JenkinsTable, StaleTable,
+                             VALUE, binary_table, compile_table,
+                             jenkins_table, tenths)
+from bigtrees.tables import write_jkt
+
+DATAFILE = os.path.join(HERE, os.pardir, "TP001_jenkins.csv")
+
+class TestLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_tenths(self):
+        """dbh is keyed by integer tenths of a centimetre"""
+        self.assertEqual(tenths(73.5), 735)
+        self.assertEqual(tenths("150.0"), 1500)
+        self.assertEqual(tenths(0.1 + 0.2), 3)
+
+    def test_lookup(self):
+        """the table returns the value string from the file"""
+        table = JenkinsTable(DATAFILE)
+        self.assertEqual(table.lookup("QUKE", 73.5), "4.82057")
+        self.assertEqual(table.lookup("PSME", 5.0), "0.00857")
+        self.assertEqual(table.lookup("FAKE", 73.5), None)
+        self.assertEqual(table.lookup("QUKE", 10000.1), None)
+
+    def test_reload(self):
+        """the table is re-read when the file's mtime changes"""
+        path = os.path.join(self.workdir, "table.csv")
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,0.00857\n')
+        table = JenkinsTable(path)
+        self.assertEqual(table.lookup("PSME", 5.0), "0.00857")
+        self.assertFalse(table.refresh())
+
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,0.5\n')
+        os.utime(path, (table.mtime + 10, table.mtime + 10))
+        self.assertEqual(table.lookup("PSME", 5.0), "0.5")
+
+    def test_shared(self):
+        """one table is shared per path"""
+        self.assertTrue(jenkins_table(DATAFILE) is jenkins_table(DATAFILE))
+
+    def test_binary(self):
+        """the binary table gives back every value string of the csv"""
+        path = os.path.join(self.workdir, "table.jkt")
+        compile_table(DATAFILE, path)
+        table = BinaryTable(path)
+        with open(DATAFILE) as datafile:
+            for species, dbh, value in csv.reader(datafile):
+                self.assertEqual(table.lookup(species, float(dbh)), value)
+        self.assertEqual(table.lookup("FAKE", 73.5), None)
+        self.assertEqual(table.lookup("QUKE", 4.9), None)
+        self.assertEqual(table.lookup("QUKE", 10000.1), None)
+
+    def test_binary_builder(self):
+        """the table builder writes the same binary table"""
+        compiled = os.path.join(self.workdir, "compiled.jkt")
+        built = os.path.join(self.workdir, "built.jkt")
+        compile_table(DATAFILE, compiled)
+        write_jkt(built)
+        with open(compiled, "rb") as one:
+            with open(built, "rb") as other:
+                self.assertEqual(one.read(), other.read())
+
+    def test_binary_source(self):
+        """a csv is compiled beside itself, and again when it changes"""
+        path = os.path.join(self.workdir, "table.csv")
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,0.00857\n"PSME",5.2,0.00928\n')
+        table = binary_table(path)
+        self.assertEqual(table.path, os.path.join(self.workdir, "table.jkt"))
+        self.assertEqual(table.lookup("PSME", 5.0), "0.00857")
+        self.assertEqual(table.lookup("PSME", 5.1), None)
+        self.assertEqual(table.lookup("PSME", 5.2), "0.00928")
+        self.assertFalse(table.refresh())
+
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,0.5\n')
+        later = os.stat(table.path).st_mtime + 10
+        os.utime(path, (later, later))
+        self.assertEqual(table.lookup("PSME", 5.0), "0.5")
+
+    def test_nearest(self):
+        """nearest snaps to the closest table dbh, lower on a tie"""
+        path = os.path.join(self.workdir, "table.csv")
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,1.0\n"PSME",5.4,2.0\n"PSME",6.0,3.0\n')
+        table = binary_table(path)
+        self.assertEqual(table.nearest("PSME", 5.1), (5.0, "1.0"))
+        self.assertEqual(table.nearest("PSME", 5.2), (5.0, "1.0"))
+        self.assertEqual(table.nearest("PSME", 5.3), (5.4, "2.0"))
+        self.assertEqual(table.nearest("PSME", 1.0), (5.0, "1.0"))
+        self.assertEqual(table.nearest("PSME", 99.0), (6.0, "3.0"))
+        self.assertEqual(table.nearest("FAKE", 5.0), None)
+
+    def test_no_build(self):
+        """without build, the csv is compiled in the background"""
+        path = os.path.join(self.workdir, "table.csv")
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,0.00857\n')
+        table = BinaryTable(os.path.join(self.workdir, "table.jkt"),
+                            source=path, build=False)
+        self.assertRaises(StaleTable, table.lookup, "PSME", 5.0)
+        table.wait()
+        self.assertEqual(table.lookup("PSME", 5.0), "0.00857")
+
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,0.5\n')
+        later = os.stat(table.path).st_mtime + 10
+        os.utime(path, (later, later))
+        # the old table answers until the new one is written
+        self.assertTrue(table.lookup("PSME", 5.0) in ("0.00857", "0.5"))
+        table.wait()
+        self.assertEqual(table.lookup("PSME", 5.0), "0.5")
+
+    def test_no_build_binary(self):
+        """a missing binary table without its csv is an error"""
+        table = BinaryTable(os.path.join(self.workdir, "table.jkt"),
+                            build=False)
+        self.assertRaises(StaleTable, table.refresh)
+
+    def test_reopen_under_reader(self):
+        """a table reopened under a reader leaves the reader's map open"""
+        path = os.path.join(self.workdir, "table.jkt")
+        compile_table(DATAFILE, path)
+        table = BinaryTable(path)
+        table.refresh()
+        held = table.table
+        later = os.stat(path).st_mtime + 10
+        os.utime(path, (later, later))
+        self.assertTrue(table.refresh())
+        self.assertFalse(table.table is held)
+        digits, index, values, _ = held
+        start, length, first = index["QUKE"]
+        value = VALUE.unpack_from(values, first + 4 * (735 - start))[0]
+        self.assertEqual(round(value, digits), 4.82057)
+        self.assertEqual(table.lookup("QUKE", 73.5), "4.82057")
+
+    def test_published_readable(self):
+        """a compiled table is readable by other users, as the umask allows"""
+        path = os.path.join(self.workdir, "table.jkt")
+        umask = os.umask(0o022)
+        try:
+            compile_table(DATAFILE, path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+    def test_interpolate(self):
+        """interpolation is linear between table values, None outside"""
+        path = os.path.join(self.workdir, "table.csv")
+        with open(path, "w") as datafile:
+            datafile.write('"PSME",5.0,1.0\n"PSME",5.4,2.0\n"PSME",6.0,3.0\n')
+        table = binary_table(path)
+        self.assertEqual(table.interpolate("PSME", 5.4), "2.0")
+        self.assertEqual(table.interpolate("PSME", 5.1), "1.2")
+        self.assertEqual(table.interpolate("PSME", 5.7), "2.5")
+        self.assertEqual(table.interpolate("PSME", 4.9), None)
+        self.assertEqual(table.interpolate("PSME", 6.1), None)
+        self.assertEqual(table.interpolate("FAKE", 5.0), None)
+
+    def test_curve(self):
+        """a range gives every table value between its ends"""
+        table = binary_table(DATAFILE)
+        self.assertEqual(table.curve("QUKE", 73.5, 73.7),
+                         [(73.5, "4.82057"), (73.6, "4.83633"),
+                          (73.7, "4.85213")])
+        self.assertEqual(len(table.curve("QUKE", 0, 1000)), 1451)
+        self.assertEqual(table.curve("QUKE", 200, 300), [])
+        self.assertEqual(table.curve("FAKE", 5, 10), [])
+
+    def test_modes(self):
+        """find agrees with lookup on table values in every mode"""
+        table = binary_table(DATAFILE)
+        for mode in MODES:
+            self.assertEqual(table.find("QUKE", 73.5, mode),
+                             (73.5, "4.82057"))
+        self.assertEqual(table.find("QUKE", 73.54), (73.5, "4.82057"))
+        self.assertEqual(table.find("QUKE", 200.0), None)
+        self.assertRaises(ValueError, table.find, "QUKE", 73.5, "cubic")
+
+    def test_not_finite(self):
+        """nan and infinite dbh have no value in any table or mode"""
+        for dbh in ("nan", "inf", "-inf"):
+            self.assertEqual(jenkins_table(DATAFILE).lookup("QUKE", dbh), None)
+            for mode in MODES:
+                self.assertEqual(binary_table(DATAFILE).find("QUKE", dbh,
+                                                             mode), None)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLookup)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+bigtrees memoized biomass unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import copy
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.batch import compute_biomass
+from bigtrees.memo import BiomassCache, cached_caseof, quantize
+from bigtrees.registry import REGISTRY, Registry
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def output_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        return [(treeid, study, species, standid, treeid, float(dbh), None)
+                for study, standid, species, treeid, dbh, _, _ in reader]
+
+class TestMemo(unittest.TestCase):
+
+    def test_quantize(self):
+        """dbh on the 0.1 cm grid quantizes, other dbh do not"""
+        self.assertEqual(quantize(154.5), 1545)
+        self.assertEqual(quantize(150.0), 1500)
+        self.assertEqual(quantize(154.55), None)
+
+    def test_lru(self):
+        """the least recently used entry is evicted first"""
+        cache = BiomassCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()["hits"], 3)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_cached_caseof(self):
+        """cached_caseof returns what caseof does, and hits on repeats"""
+        cache = BiomassCache()
+        for species, x, standid in [("PSME", 154.5, "HJRS"),
+                                    ("TSHE", 162.0, "RS28"),
+                                    ("TSHE", 162.0, "RS01"),
+                                    ("PSME", 154.5, "HJRS"),
+                                    ("PSME", 154.55, "HJRS")]:
+            self.assertEqual(cached_caseof(species, x, standid, cache),
+                             bt.caseof(species, x, standid))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(len(cache), 3)
+
+    def test_compute_biomass(self):
+        """a cached batch equals the uncached one, including off-grid dbh"""
+        species = ["PSME", "PSME", "TSHE", "TSHE", "ABMA", "PSME"]
+        dbh = [154.5, 154.5, 162.0, 162.0, 171.25, 154.5]
+        standid = ["HJRS", "HJRS", "RS28", "RS01", "AV06", "MRRS"]
+        cache = BiomassCache()
+        for _ in range(2):
+            best, jenk = compute_biomass(species, dbh, standid, cache=cache)
+            expected = compute_biomass(species, dbh, standid)
+            np.testing.assert_array_equal(best, expected[0])
+            np.testing.assert_array_equal(jenk, expected[1])
+        self.assertEqual(cache.misses, 4)
+        self.assertEqual(cache.hits, 4)
+
+    def test_recalibrated(self):
+        """a cache shared with a recalibrated registry keeps them apart"""
+        equations = []
+        for equation in REGISTRY.equations:
+            equation = copy.copy(equation)
+            if equation.species == "PSME" and equation.component == "BIOMASS":
+                equation.woodden = 0.5
+            equations.append(equation)
+        recalibrated = Registry(equations)
+        species = ["PSME", "PSME", "TSHE"]
+        dbh = [154.5, 210.0, 162.0]
+        standid = ["HJRS", "RS28", "RS28"]
+        cache = BiomassCache()
+        for registry in (REGISTRY, recalibrated, REGISTRY):
+            best, _ = compute_biomass(species, dbh, standid, registry, cache)
+            expected, _ = compute_biomass(species, dbh, standid, registry)
+            np.testing.assert_array_equal(best, expected)
+        self.assertEqual(len(cache), 5)
+
+    def test_writeoutput(self):
+        """writeoutput through a small cache reproduces the output"""
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "out.csv")
+            cache = BiomassCache(maxsize=256)
+            bt.writeoutput(iter(output_rows()), path, chunksize=500,
+                           cache=cache)
+            with open(path) as datafile:
+                with open(OUTPUT) as expected:
+                    self.assertEqual(datafile.read(), expected.read())
+            self.assertTrue(cache.hits > 0)
+            self.assertEqual(len(cache), 256)
+        finally:
+            shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    unittest.main()
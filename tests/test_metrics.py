@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+bigtrees metrics unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import json
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+from flask_testing import TestCase
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+import app as webapp
+from bigtrees.lookup import binary_table
+from bigtrees.metrics import Metrics
+
+DATAFILE = os.path.join(HERE, os.pardir, "TP001_jenkins.csv")
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        """counters add up per label set"""
+        metrics = Metrics()
+        metrics.describe("hits_total", "counter", "Hits.")
+        metrics.inc("hits_total", {"route": "/"})
+        metrics.inc("hits_total", {"route": "/"}, 2)
+        metrics.inc("hits_total", {"route": "/biomass"})
+        self.assertEqual(metrics.render(),
+                         "# HELP hits_total Hits.\n"
+                         "# TYPE hits_total counter\n"
+                         'hits_total{route="/"} 3\n'
+                         'hits_total{route="/biomass"} 1\n')
+
+    def test_histogram(self):
+        """histogram buckets are cumulative, with sum and count"""
+        metrics = Metrics()
+        for value in (0.1, 0.3, 2.0):
+            metrics.observe("latency", value, buckets=(0.25, 1.0))
+        self.assertEqual(metrics.render(),
+                         'latency_bucket{le="0.25"} 1\n'
+                         'latency_bucket{le="1.0"} 2\n'
+                         'latency_bucket{le="+Inf"} 3\n'
+                         'latency_sum 2.4\n'
+                         'latency_count 3\n')
+
+    def test_collector(self):
+        """collectors are read at render time, labels escaped"""
+        metrics = Metrics()
+        state = {"size": 1}
+        metrics.collect(lambda: [("size", {"name": 'a"b'}, state["size"])])
+        state["size"] = 5
+        self.assertEqual(metrics.render(), 'size{name="a\\"b"} 5\n')
+
+class TestMetricsRoute(TestCase):
+
+    def create_app(self):
+        webapp.app.config["datafile"] = DATAFILE
+        webapp.app.config["metrics"] = True
+        webapp.METRICS.reset()
+        binary_table(DATAFILE).refresh()
+        return webapp.app
+
+    def tearDown(self):
+        webapp.app.config["metrics"] = True
+
+    def test_route_metrics(self):
+        """Route: HTTP GET /metrics"""
+        with self.app.test_client() as client:
+            # a server closes each response once it is sent, which is
+            # when its latency is recorded
+            client.post("/", data={"species": "QUKE",
+                                   "quantity": "73.5"}).close()
+            client.post("/", data={"species": "FAKE",
+                                   "quantity": "73.5"}).close()
+            client.post("/biomass", content_type="application/json",
+                        data=json.dumps([{"species": "PSME", "dbh": 154.5,
+                                          "standid": "HJRS"}] * 3)).close()
+            response = client.get("/metrics")
+            self.assertEqual(response.status_code, 200)
+            text = response.get_data(as_text=True)
+        self.assertTrue('bigtrees_lookups_total{result="hit"} 1' in text)
+        self.assertTrue('bigtrees_lookups_total{result="miss"} 1' in text)
+        self.assertTrue('bigtrees_request_duration_seconds_count'
+                        '{method="POST",route="/"} 2' in text)
+        self.assertTrue('bigtrees_request_duration_seconds_count'
+                        '{method="POST",route="/biomass"} 1' in text)
+        self.assertTrue('bigtrees_responses_total{route="/",status="200"} 2'
+                        in text)
+        self.assertTrue("bigtrees_table_load_seconds " in text)
+        self.assertTrue("bigtrees_cache_hits_total " in text)
+
+    def test_metrics_off(self):
+        """with metrics off nothing is recorded and /metrics is not found"""
+        webapp.app.config["metrics"] = False
+        with self.app.test_client() as client:
+            client.post("/", data={"species": "QUKE", "quantity": "73.5"})
+            self.assertEqual(client.get("/metrics").status_code, 404)
+        webapp.app.config["metrics"] = True
+        self.assertFalse("bigtrees_lookups_total" in webapp.METRICS.render())
+
+if __name__ == "__main__":
+    unittest.main()
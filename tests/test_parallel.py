@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+bigtrees parallel inventory run unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees.parallel import parallel_run
+from bigtrees.pipeline import CSVSink, run
+from bigtrees.sources import RowSource
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        with open(OUTPUT) as datafile:
+            reader = csv.reader(datafile)
+            next(reader)
+            self.source = RowSource(
+                (treeid, study, species, standid, treeid, dbh, None)
+                for study, standid, species, treeid, dbh, _, _ in reader)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def check(self, column):
+        path = os.path.join(self.workdir, column + ".csv")
+        count = parallel_run(self.source, path, column, workers=2,
+                             chunksize=100)
+        self.assertEqual(count, 3326)
+        with open(path) as result:
+            with open(OUTPUT) as expected:
+                self.assertEqual(result.read(), expected.read())
+
+    def test_by_stand(self):
+        """sharding by STANDID reproduces the single-process output"""
+        self.assertEqual(len(self.source.shards("STANDID")), 58)
+        self.check("STANDID")
+
+    def test_by_study(self):
+        """sharding by PSP_STUDYID reproduces the single-process output"""
+        self.assertEqual(len(self.source.shards("PSP_STUDYID")), 8)
+        self.check("PSP_STUDYID")
+
+    def test_null_and_commas(self):
+        """a NULL stand is a shard, and quoted commas do not split fields"""
+        rows = []
+        for row in self.source.rows:
+            treeid, study, species, standid, _, dbh, vigor = row
+            if standid == "HR02":
+                standid = None
+            elif standid == "RS34":
+                standid = "RS,34"
+                treeid = treeid[:4] + "," + treeid[4:]
+            rows.append((treeid, study, species, standid, treeid, dbh, vigor))
+        source = RowSource(rows)
+        self.assertEqual(source.shards("STANDID")[0], None)
+        path = os.path.join(self.workdir, "parallel.csv")
+        self.assertEqual(parallel_run(source, path, workers=2, chunksize=100),
+                         3326)
+        single = os.path.join(self.workdir, "single.csv")
+        with CSVSink(single) as sink:
+            run(source.fetch(), sink, 100)
+        with open(path) as result:
+            with open(single) as expected:
+                self.assertEqual(result.read(), expected.read())
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestParallel)
+    unittest.TextTestRunner(verbosity=2).run(suite)
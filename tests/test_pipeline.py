@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+bigtrees streaming output pipeline unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import threading
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.pipeline import fetch_chunks, prefetch
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+class FakeCursor(object):
+    """ a db-api cursor over formconnection()-shaped rows """
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.calls = 0
+
+    def fetchmany(self, size):
+        self.calls += 1
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+class ListSink(object):
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, rows):
+        self.chunks.append(rows)
+
+def cursor_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        return [(treeid, study, species + " ", standid, treeid, dbh, None)
+                for study, standid, species, treeid, dbh, _, _ in reader]
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_writeoutput_csv(self):
+        """writeoutput reproduces bigtrees_tp001_v3.csv in chunks"""
+        path = os.path.join(self.workdir, "out.csv")
+        cursor = FakeCursor(cursor_rows())
+        count = bt.writeoutput(cursor, path, chunksize=500)
+        self.assertEqual(count, 3326)
+        self.assertEqual(cursor.calls, 8)
+        with open(path) as result:
+            with open(OUTPUT) as expected:
+                self.assertEqual(result.read(), expected.read())
+
+    def test_writeoutput_sink(self):
+        """writeoutput sends one bulk write per chunk to a sink"""
+        sink = ListSink()
+        bt.writeoutput(iter(cursor_rows()[:25]), chunksize=10, sink=sink)
+        self.assertEqual([len(rows) for rows in sink.chunks], [10, 10, 5])
+        self.assertEqual(sink.chunks[0][0],
+                         ["MRRS", "AE10", "ABPR", "AE10000200040", 153.8,
+                          24.1944, 21.4429])
+
+    def test_fetch_chunks(self):
+        """fetch_chunks uses fetchmany, or chunks a plain iterable"""
+        self.assertEqual(list(fetch_chunks(FakeCursor(range(5)), 2)),
+                         [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(fetch_chunks(iter(range(5)), 2)),
+                         [[0, 1], [2, 3], [4]])
+
+    def test_prefetch_errors(self):
+        """errors while fetching reach the consumer"""
+        def failing():
+            yield [1]
+            raise RuntimeError("connection lost")
+        chunks = prefetch(failing())
+        self.assertEqual(next(chunks), [1])
+        self.assertRaises(RuntimeError, next, chunks)
+
+    def test_prefetch_abandoned(self):
+        """the producer ends when the consumer stops early"""
+        exhausted = threading.Event()
+
+        def fetching():
+            yield [1]
+            yield [2]
+            exhausted.set()
+        before = set(threading.enumerate())
+        chunks = prefetch(fetching(), depth=1)
+        self.assertEqual(next(chunks), [1])
+        producers = set(threading.enumerate()) - before
+        self.assertEqual(len(producers), 1)
+        # the queue is full, and the producer waits to say it finished
+        self.assertTrue(exhausted.wait(5))
+        chunks.close()
+        for producer in producers:
+            producer.join(5)
+            self.assertFalse(producer.is_alive())
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPipeline)
+    unittest.TextTestRunner(verbosity=2).run(suite)
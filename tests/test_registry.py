@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+bigtrees equation registry unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.registry import REGISTRY, Registry, Equation
+
+class TestRegistry(unittest.TestCase):
+
+    def test_forms(self):
+        """every row of bigtreesource.csv compiles to a known form"""
+        self.assertEqual(len(REGISTRY.equations), 17)
+        forms = dict((e.key, e.form) for e in REGISTRY.equations)
+        self.assertEqual(forms[("SEGI", "BIOMASS", "ALL", "NULL")], "loglog")
+        self.assertEqual(forms[("PISI", "BIOMASS", "ALL", "NULL")], "power")
+        self.assertEqual(forms[("PSME", "HEIGHT", "WEST", "RS28")], "chapman")
+        self.assertEqual(forms[("TSHE", "BIOMASS", "ALL", "NULL")], "formfactor")
+
+    def test_models_match_caseof(self):
+        """each model reproduces the biomass of caseof"""
+        x = np.array([150.0, 175.3, 210.9, 300.0])
+        for species in REGISTRY.species:
+            for standid in ("MRRS", "RS28", "RS04", "HJRS"):
+                biomass = REGISTRY.model(species, standid)(x)
+                for i in range(len(x)):
+                    (b, b1) = bt.caseof(species, x[i], standid)
+                    self.assertAlmostEqual(biomass[i], b, places=10)
+
+    def test_shared_models(self):
+        """stands that resolve to the same equations share a model"""
+        self.assertTrue(REGISTRY.model("PSME", "HJRS") is
+                        REGISTRY.model("PSME", "NFGY"))
+        self.assertTrue(REGISTRY.model("ABMA", "HJRS") is
+                        REGISTRY.model("ABCO", "HJRS"))
+        self.assertFalse(REGISTRY.model("PSME", "HJRS") is
+                         REGISTRY.model("PSME", "RS28"))
+
+    def test_recalibration(self):
+        """a changed table row changes the model built from it"""
+        equations = []
+        for e in REGISTRY.equations:
+            if e.key == ("PISI", "BIOMASS", "ALL", "NULL"):
+                e = Equation(e.species, e.component, e.geo, e.standid,
+                             e.rawform, e.b0, e.b1, e.b2, e.baskerville,
+                             2 * e.woodden, e.quality)
+            equations.append(e)
+        registry = Registry(equations)
+        self.assertAlmostEqual(registry.model("PISI", "HJRS")(180.0),
+                               2 * bt.pisi(180.0)[0], places=10)
+
+    def test_unknown_species(self):
+        """the registry raises ValueError for an unknown species"""
+        self.assertRaises(ValueError, REGISTRY.model, "FAKE", "HJRS")
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRegistry)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+bigtrees equation selection unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.batch import tiers
+from bigtrees.pipeline import TIER_HEADER, biomass_rows
+from bigtrees.registry import REGISTRY, SelectionIndex, stand_chain, tier
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+# study and stand ids covering each region, named stand and elevation
+STANDS = ["HJRS", "MRRS", "RS28", "RS04", "SQNP", "AV06", "TO11", "NCNA"]
+
+def inventory_rows():
+    """ formconnection()-like rows rebuilt from the shipped output """
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+        next(reader)
+        return [[row[3], row[0], row[2], row[1], None, row[4]]
+                for row in reader]
+
+class SelectionTest(unittest.TestCase):
+    """ the selection index and the TIER column """
+
+    def test_tier_order(self):
+        """ tier codes sort by first tier, then second, then suffixes """
+        codes = ["T1.2.T2.1.", "T1.1.T2.2.", "T1.1.T2.1a.", "T1.1.T2.1."]
+        self.assertEqual(sorted(codes, key=tier),
+                         ["T1.1.T2.1.", "T1.1.T2.1a.", "T1.1.T2.2.",
+                          "T1.2.T2.1."])
+        self.assertTrue(tier("T1.1.T2.1.") < tier(None))
+
+    def test_stand_chain(self):
+        """ a stand falls back to its elevation class, then to NULL """
+        self.assertEqual(stand_chain("RS28"), ["RS28", "ELEV>1000", "NULL"])
+        self.assertEqual(stand_chain("HJRS"), ["HJRS", "ELEV<1000", "NULL"])
+
+    def test_index_matches_model(self):
+        """ the index resolves every species and stand as model() does """
+        index = SelectionIndex(REGISTRY)
+        species = [name for name in REGISTRY.species for _ in STANDS]
+        stands = STANDS * len(REGISTRY.species)
+        ids = index.resolve(species, stands)
+        for name, standid, i in zip(species, stands, ids.tolist()):
+            self.assertIs(index.models[i], REGISTRY.model(name, standid))
+            self.assertEqual(index.tiers[i],
+                             REGISTRY.model(name, standid).quality)
+
+    def test_unknown_species(self):
+        """ a species with no equation raises ValueError """
+        with self.assertRaises(ValueError):
+            REGISTRY.index.resolve(["PSME", "FAKE"], ["HJRS", "HJRS"])
+
+    def test_tiers(self):
+        """ tiers are the QUALITY codes of the chosen biomass equations """
+        self.assertEqual(tiers(["PSME", "PSME"], ["HJRS", "MRRS"]).tolist(),
+                         [REGISTRY.model("PSME", "HJRS").quality,
+                          REGISTRY.model("PSME", "MRRS").quality])
+        self.assertEqual(tiers(["PSME"], ["HJRS"]).tolist(), ["T1.1.T2.1."])
+
+    def test_tier_column(self):
+        """ the TIER column follows the output's columns unchanged """
+        rows = inventory_rows()[:500]
+        plain = biomass_rows(rows)
+        tiered = biomass_rows(rows, tier=True)
+        self.assertEqual([row[:7] for row in tiered], plain)
+        for row in tiered:
+            self.assertEqual(row[7], REGISTRY.model(row[2], row[0]).quality)
+
+    def test_writeoutput_tiers(self):
+        """ writeoutput with tier writes TIER_HEADER and the shipped values """
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "tiers.csv")
+            bt.writeoutput(iter(inventory_rows()), path, tier=True)
+            with open(path) as datafile:
+                written = list(csv.reader(datafile))
+            with open(OUTPUT) as datafile:
+                shipped = list(csv.reader(datafile))
+        finally:
+            shutil.rmtree(workdir)
+        self.assertEqual(written[0], TIER_HEADER)
+        self.assertEqual(len(written), len(shipped))
+        self.assertEqual([row[:7] for row in written[1:]], shipped[1:])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+bigtrees data source unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees import sources
+from bigtrees.sources import (FileSource, MSSQLSource, RowSource, SQLSource,
+                              SQLiteSource, close_all)
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def output_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        return [(treeid, study, species, standid, treeid, float(dbh), "1")
+                for study, standid, species, treeid, dbh, _, _ in reader]
+
+class TestSources(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.rows = output_rows()
+
+        # the big trees plus a small one in each table format
+        rows = self.rows + [("ZZ01000000001", "HJRS", "PSME", "ZZ01",
+                             "ZZ01000000001", 20.5, "1")]
+        self.database = os.path.join(self.workdir, "inventory.db")
+        connection = sqlite3.connect(self.database)
+        connection.execute("CREATE TABLE tp00101 (treeid TEXT, "
+                           "psp_studyid TEXT, species TEXT, standid TEXT)")
+        connection.execute("CREATE TABLE tp00102 (treeid TEXT, dbh REAL, "
+                           "tree_vigor TEXT)")
+        connection.executemany("INSERT INTO tp00101 VALUES (?, ?, ?, ?)",
+                               set(row[:4] for row in rows))
+        connection.executemany("INSERT INTO tp00102 VALUES (?, ?, ?)",
+                               [row[4:] for row in rows])
+        connection.commit()
+        connection.close()
+
+        self.flatfile = os.path.join(self.workdir, "inventory.csv")
+        with open(self.flatfile, "w") as datafile:
+            writer = csv.writer(datafile)
+            writer.writerow(["TREEID", "PSP_STUDYID", "SPECIES", "STANDID",
+                             "TREEID", "DBH", "TREE_VIGOR"])
+            writer.writerows(rows)
+
+    def tearDown(self):
+        close_all()
+        shutil.rmtree(self.workdir)
+
+    def test_same_rows(self):
+        """every backend yields the formconnection() rows of the big trees"""
+        expected = sorted(self.rows)
+        for source in (SQLiteSource(self.database), FileSource(self.flatfile),
+                       RowSource(self.rows)):
+            self.assertEqual(sorted(tuple(row) for row in source.fetch()),
+                             expected)
+
+    def test_filters(self):
+        """dbh, species and stand filters are applied by every backend"""
+        expected = [row for row in self.rows if row[2] == "TSHE" and
+                    row[3] in ("HR04", "RS28") and row[5] > 160]
+        self.assertTrue(expected)
+        for source in (SQLiteSource(self.database, 160, ["TSHE"], ["HR04", "RS28"]),
+                       FileSource(self.flatfile, 160, ["TSHE"], ["HR04", "RS28"]),
+                       RowSource(self.rows, 160, ["TSHE"], ["HR04", "RS28"])):
+            self.assertEqual(sorted(tuple(row) for row in source.fetch()),
+                             sorted(expected))
+
+        everything = SQLiteSource(self.database, min_dbh=None)
+        self.assertEqual(len(list(everything.fetch())), len(self.rows) + 1)
+
+    def test_shards(self):
+        """shards and shard fetches agree between backends"""
+        sqlite = SQLiteSource(self.database)
+        flat = FileSource(self.flatfile)
+        self.assertEqual(sqlite.shards("PSP_STUDYID"), flat.shards("PSP_STUDYID"))
+        self.assertEqual(len(sqlite.shards("STANDID")), 58)
+        self.assertEqual(sorted(sqlite.fetch("STANDID", "AG05")),
+                         sorted(flat.fetch("STANDID", "AG05")))
+
+    def test_pooled(self):
+        """repeated runs reuse one connection; sources stay picklable"""
+        source = SQLiteSource(self.database)
+        self.assertTrue(source.connection() is source.connection())
+        copy = pickle.loads(pickle.dumps(source))
+        self.assertTrue(copy.connection() is source.connection())
+
+    def test_pool_pruned(self):
+        """closed connections and those of ended threads are replaced"""
+        source = SQLiteSource(self.database)
+        first = source.connection()
+        first.close()
+        second = source.connection()
+        self.assertFalse(second is first)
+        self.assertEqual(len(list(source.fetch())), 3326)
+
+        opened = []
+        worker = threading.Thread(
+            target=lambda: opened.append(source.connection()))
+        worker.start()
+        worker.join()
+        self.assertTrue(any(c is opened[0]
+                            for c in sources._connections.values()))
+        # the next new connection prunes the ended thread's
+        second.close()
+        source.connection()
+        self.assertFalse(any(c is opened[0]
+                             for c in sources._connections.values()))
+        self.assertRaises(sqlite3.ProgrammingError, opened[0].cursor)
+
+    def test_abstract(self):
+        """a SQL source must say how to connect"""
+        self.assertRaises(TypeError, SQLSource)
+
+    def test_writeoutput(self):
+        """writeoutput from SQLite reproduces bigtrees_tp001_v3.csv"""
+        path = os.path.join(self.workdir, "out.csv")
+        bt.writeoutput(SQLiteSource(self.database).fetch(), path, chunksize=700)
+        with open(path) as result:
+            with open(OUTPUT) as expected:
+                self.assertEqual(sorted(result), sorted(expected))
+
+    def test_mssql_query(self):
+        """the server query keeps the dbh threshold as a parameter"""
+        query, params = MSSQLSource(species=["PSME"]).query("STANDID", "AG05")
+        self.assertTrue("fsdbdata.dbo.tp00102.dbh > %s" in query)
+        self.assertTrue("fsdbdata.dbo.tp00101.species IN (%s)" in query)
+        self.assertTrue(query.endswith("ORDER BY fsdbdata.dbo.tp00102.treeid ASC"))
+        self.assertEqual(params, [150, "PSME", "AG05"])
+
+    def test_null_shard(self):
+        """the shard of a NULL stand is queried with IS NULL"""
+        query, params = MSSQLSource().query("STANDID", None)
+        self.assertTrue("fsdbdata.dbo.tp00101.standid IS NULL" in query)
+        self.assertEqual(params, [150])
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestSources)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+bigtrees jenkins table builder unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import json
+import math
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.tables import GROUPS, build_table, group_values, write_csv, write_npy
+
+DATAFILE = os.path.join(HERE, os.pardir, "TP001_jenkins.csv")
+
+class TestTables(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_csv(self):
+        """write_csv reproduces TP001_jenkins.csv byte for byte"""
+        path = os.path.join(self.workdir, "jenkins.csv")
+        self.assertEqual(write_csv(path), 43 * 1451)
+        with open(path, "rb") as built:
+            with open(DATAFILE, "rb") as shipped:
+                self.assertEqual(built.read(), shipped.read())
+
+    def test_group_values(self):
+        """every group matches the scalar expression on a fine grid"""
+        x = np.arange(0, 30001) / 100
+        for b0, b1 in GROUPS.values():
+            expected = [round(0.001 * math.exp(b0 + b1 * math.log1p(v)), 5)
+                        for v in x.tolist()]
+            self.assertEqual(group_values(b0, b1, x).tolist(), expected)
+
+    def test_jenkbio(self):
+        """the table agrees with the jenkbio of the scalar functions"""
+        species, dbh, values = build_table(["PSME", "TSHE", "PILA"])
+        for i, x in enumerate(dbh.tolist()[::50]):
+            self.assertEqual(values[0, i * 50], bt.andrewspsme(x, "HJRS")[1])
+            self.assertEqual(values[1, i * 50], bt.tshe(x, "HJRS")[1])
+            self.assertEqual(values[2, i * 50], bt.pila(x)[1])
+
+    def test_npy(self):
+        """write_npy saves the grid and its axes"""
+        path = os.path.join(self.workdir, "jenkins.npy")
+        write_npy(path, ["QUKE"])
+        values = np.load(path)
+        with open(os.path.join(self.workdir, "jenkins.json")) as jsonfile:
+            axes = json.load(jsonfile)
+        self.assertEqual(axes, {"species": ["QUKE"], "start": 50, "stop": 1500})
+        self.assertEqual(values[0, 735 - 50], 4.82057)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+bigtrees TREEID index unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+from collections import OrderedDict
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees import biggest_trees as bt
+from bigtrees.pipeline import CSVSink
+from bigtrees.treeindex import (IndexedCSVSink, StaleIndex, TreeIndex,
+                                TreeSpans, build_index, index_path)
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def output_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+        next(reader)
+        return list(reader)
+
+class TreeIndexTest(unittest.TestCase):
+    """ the TREEID index of an output csv """
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "output.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_sink(self):
+        """ the indexed sink writes the same csv, and the same index """
+        rows = output_rows()
+        plain = os.path.join(self.workdir, "plain.csv")
+        with CSVSink(plain) as sink:
+            sink.write(rows[:1000])
+            sink.write(rows[1000:])
+        with IndexedCSVSink(self.path) as sink:
+            sink.write(rows[:1000])
+            sink.write(rows[1000:])
+        with open(plain, "rb") as one:
+            with open(self.path, "rb") as other:
+                self.assertEqual(one.read(), other.read())
+
+        with open(index_path(self.path), "rb") as indexfile:
+            written = indexfile.read()
+        build_index(plain)
+        with open(index_path(plain), "rb") as indexfile:
+            self.assertEqual(indexfile.read(), written)
+
+    def test_every_tree(self):
+        """ every tree's rows come back as they are in the file """
+        rows = output_rows()
+        trees = OrderedDict()
+        for row in rows:
+            trees.setdefault(row[3], []).append(row)
+        shutil.copy(OUTPUT, self.path)
+        index = TreeIndex(self.path)
+        for treeid, expected in trees.items():
+            self.assertEqual(index.rows(treeid), expected)
+        self.assertEqual(index.rows("NOSUCHTREE"), [])
+        self.assertEqual(index.rows("X" * 100), [])
+        self.assertEqual(index.records(rows[0][3])[0]["TREEID"], rows[0][3])
+
+    def test_split_tree(self):
+        """ a tree whose rows are not together cannot be indexed """
+        spans = TreeSpans()
+        spans.add("A", 0, 10)
+        spans.add("A", 10, 10)
+        spans.add("B", 20, 10)
+        self.assertEqual(spans.spans["A"], (0, 20, 2))
+        self.assertRaises(ValueError, spans.add, "A", 30, 10)
+
+    def test_rebuilt(self):
+        """ the index is built when missing and rebuilt when stale """
+        rows = output_rows()
+        with CSVSink(self.path) as sink:
+            sink.write(rows[:10])
+        index = TreeIndex(self.path)
+        self.assertEqual(index.rows(rows[0][3])[0], rows[0])
+        self.assertTrue(os.path.exists(index_path(self.path)))
+        self.assertEqual(index.rows(rows[-1][3]), [])
+
+        with CSVSink(self.path) as sink:
+            sink.write(rows[-10:])
+        later = os.stat(index.index).st_mtime + 10
+        os.utime(self.path, (later, later))
+        self.assertEqual(index.rows(rows[-1][3])[-1], rows[-1])
+        self.assertEqual(index.rows(rows[0][3]), [])
+
+    def test_no_build(self):
+        """without build, a missing or stale index raises, not rebuilds"""
+        rows = output_rows()
+        with CSVSink(self.path) as sink:
+            sink.write(rows[:10])
+        index = TreeIndex(self.path, build=False)
+        self.assertRaises(StaleIndex, index.rows, rows[0][3])
+        self.assertFalse(os.path.exists(index_path(self.path)))
+        build_index(self.path)
+        self.assertEqual(index.rows(rows[0][3])[0], rows[0])
+        held = index.table
+
+        with CSVSink(self.path) as sink:
+            sink.write(rows[-10:])
+        later = os.stat(index.index).st_mtime + 10
+        os.utime(self.path, (later, later))
+        self.assertRaises(StaleIndex, index.rows, rows[-1][3])
+        build_index(self.path)
+        later += 10
+        os.utime(index.index, (later, later))
+        self.assertEqual(index.rows(rows[-1][3])[-1], rows[-1])
+        # the map of the index before is left open to whoever holds it
+        self.assertFalse(index.table is held)
+        self.assertFalse(held[0].closed)
+
+    def test_readable(self):
+        """an index is readable by other users, as the umask allows"""
+        with CSVSink(self.path) as sink:
+            sink.write(output_rows()[:10])
+        umask = os.umask(0o022)
+        try:
+            build_index(self.path)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(index_path(self.path)).st_mode & 0o777,
+                         0o644)
+
+    def test_writeoutput(self):
+        """ writeoutput with index writes the index beside the output """
+        rows = [[row[3], row[0], row[2], row[1], row[3], row[4], "1"]
+                for row in output_rows()]
+        bt.writeoutput(iter(rows), self.path, index=True)
+        index = TreeIndex(self.path)
+        self.assertEqual(index.rows(rows[-1][0])[-1][:5],
+                         [rows[-1][1], rows[-1][3], rows[-1][2], rows[-1][0],
+                          rows[-1][5]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+bigtrees compact tree table unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees.aggregate import Aggregator, aggregate_output
+from bigtrees.batch import compute_biomass
+from bigtrees.memo import BiomassCache
+from bigtrees.pipeline import CSVSink
+from bigtrees.columnar import Categories
+from bigtrees.treetable import DTYPE, TreeTable
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def inventory_rows():
+    """ formconnection() rows rebuilt from the shipped output """
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile, quoting=csv.QUOTE_NONNUMERIC)
+        next(reader)
+        return [(row[3], row[0], row[2], row[1], row[3], row[4], "1")
+                for row in reader]
+
+class TreeTableTest(unittest.TestCase):
+    """ inventory rows as coded records """
+
+    def test_output(self):
+        """ the table writes the shipped output byte for byte """
+        table = TreeTable.load(iter(inventory_rows()), chunksize=500)
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, "output.csv")
+            with CSVSink(path) as sink:
+                self.assertEqual(table.run(sink, chunksize=700), len(table))
+            with open(path) as one:
+                with open(OUTPUT) as other:
+                    self.assertEqual(one.read(), other.read())
+        finally:
+            shutil.rmtree(workdir)
+
+    def test_biomass(self):
+        """ biomass matches the batch engine on the rows, cached or not """
+        rows = inventory_rows()
+        table = TreeTable.load(iter(rows))
+        best, jenk = compute_biomass([row[2] for row in rows],
+                                     [row[5] for row in rows],
+                                     [row[1] for row in rows])
+        for cache in (None, BiomassCache()):
+            b, b1 = table.biomass(cache=cache)
+            np.testing.assert_array_equal(b, best)
+            np.testing.assert_array_equal(b1, jenk)
+
+    def test_codes(self):
+        """ codes are shared, and species are stripped before interning """
+        rows = [("T1", "HJRS", "PSME ", "RS01", "T1", 155.0, "1"),
+                ("T2", "HJRS", "PSME", "RS02", "T2", 160.0, None),
+                ("T3", "MRRS", "TSHE", "RS01", "T3", 170.0, "1")]
+        table = TreeTable.load(iter(rows))
+        self.assertEqual(table.records["species"].tolist(), [0, 0, 1])
+        self.assertEqual(table.decode("standid").tolist(),
+                         ["RS01", "RS02", "RS01"])
+        self.assertEqual(table.categories["species"].values, ["PSME", "TSHE"])
+        self.assertEqual(table.records["year"].tolist(), [-1, -1, -1])
+
+        other = TreeTable.load(iter(rows[::-1]), categories=table.categories)
+        self.assertEqual(other.records["standid"].tolist(), [0, 1, 0])
+        self.assertEqual(other.categories["species"].values, ["PSME", "TSHE"])
+
+        selected = table.select(table.records["species"] == 1)
+        self.assertEqual(selected.decode("treeid").tolist(), ["T3"])
+        self.assertRaises(ValueError, TreeTable.load,
+                          iter([("T" * 17,) + rows[0][1:]]))
+
+    def test_code_range(self):
+        """ codes that would not fit their column raise, not wrap """
+        self.assertRaises(ValueError, Categories().encode, ["a", "b", "c"],
+                          limit=2)
+        rows = [("T%d" % i, "HJRS", "PSME", "S%d" % i, "T%d" % i, 155.0, "1")
+                for i in range(65537)]
+        self.assertEqual(len(TreeTable.load(iter(rows[:65536]))), 65536)
+        self.assertRaises(ValueError, TreeTable.load, iter(rows))
+
+    def test_years(self):
+        """ series() rows keep their year """
+        rows = [("T1", "HJRS", "PSME", "RS01", 1984, 155.0, "1"),
+                ("T1", "HJRS", "PSME", "RS01", None, 156.0, "1")]
+        table = TreeTable.load(iter(rows), years=True)
+        self.assertEqual(table.records["year"].tolist(), [1984, -1])
+
+    def test_compact(self):
+        """ a row takes a fixed, small number of bytes """
+        table = TreeTable.load(iter(inventory_rows()))
+        self.assertEqual(DTYPE.itemsize, 34)
+        self.assertEqual(table.nbytes, 34 * len(table))
+        # treeids are held in the records, not as one string per tree
+        self.assertFalse("treeid" in table.categories)
+        self.assertEqual(len(TreeTable.load(iter([]))), 0)
+        self.assertEqual(len(TreeTable.load(iter([])).biomass()[0]), 0)
+
+    def test_aggregate(self):
+        """ the table feeds an Aggregator like the streaming output """
+        table = TreeTable.load(iter(inventory_rows()))
+        stands = Aggregator(["psp_studyid", "standid"])
+        table.run(stands)
+        expected = aggregate_output(OUTPUT, ["psp_studyid", "standid"])
+        self.assertEqual(stands.results(), expected.results())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+bigtrees monte carlo uncertainty unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import csv
+import math
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees.batch import compute_biomass
+from bigtrees.uncertainty import MonteCarlo, correction_sigma, pooled_sigma
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def cursor_rows():
+    with open(OUTPUT) as datafile:
+        reader = csv.reader(datafile)
+        next(reader)
+        return [(treeid, study, species, standid, treeid, float(dbh), None)
+                for study, standid, species, treeid, dbh, _, _ in reader]
+
+class TestUncertainty(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = cursor_rows()
+
+    def test_sigma(self):
+        """a correction factor gives back its residual sd"""
+        for cf in (1.016, 1.0309):
+            self.assertAlmostEqual(math.exp(correction_sigma(cf) ** 2 / 2), cf)
+        self.assertTrue(0.15 < pooled_sigma() < 0.3)
+
+    def test_unbiased(self):
+        """samples are centred on the point estimate"""
+        mc = MonteCarlo(samples=20000, fit_size=1e12)
+        best, samples = mc.sample(["PSME", "TSHE", "PILA"],
+                                  [154.5, 162.0, 171.3],
+                                  ["HJRS", "RS28", "SQNP"])
+        expected = compute_biomass(["PSME", "TSHE", "PILA"],
+                                   [154.5, 162.0, 171.3],
+                                   ["HJRS", "RS28", "SQNP"])[0]
+        np.testing.assert_array_equal(best, expected)
+        np.testing.assert_allclose(samples.mean(axis=1), best, rtol=0.01)
+
+    def test_trees(self):
+        """each tree's interval holds its point estimate"""
+        mc = MonteCarlo(samples=200)
+        count = 0
+        for row in mc.trees(self.rows[:500]):
+            best, mean, lower, upper = row[5:]
+            self.assertTrue(lower < best < upper)
+            self.assertTrue(lower < mean < upper)
+            count += 1
+        self.assertEqual(count, 500)
+
+    def test_chunks(self):
+        """results do not depend on chunk or block sizes"""
+        one = MonteCarlo(samples=100, seed=3)
+        one.run(iter(self.rows), chunksize=10000)
+        other = MonteCarlo(samples=100, seed=3, budget=4 * 100 * 37)
+        other.run(iter(self.rows), chunksize=250)
+        first = one.stand_intervals()
+        second = other.stand_intervals()
+        self.assertEqual(len(first), 58)
+        for a, b in zip(first, second):
+            self.assertEqual(a["rows"], b["rows"])
+            self.assertAlmostEqual(a["best_total"], b["best_total"], 6)
+            self.assertAlmostEqual(a["lower"] / b["lower"], 1.0, 5)
+            self.assertAlmostEqual(a["upper"] / b["upper"], 1.0, 5)
+
+    def test_stands(self):
+        """stand totals sum the point estimates of their trees"""
+        mc = MonteCarlo(samples=100)
+        self.assertEqual(mc.run(iter(self.rows)), len(self.rows))
+        stands = mc.stand_intervals()
+        self.assertEqual(sum(s["rows"] for s in stands), len(self.rows))
+        best = compute_biomass([r[2] for r in self.rows],
+                               [r[5] for r in self.rows],
+                               [r[1] for r in self.rows])[0]
+        self.assertAlmostEqual(sum(s["best_total"] for s in stands),
+                               best.sum(), 4)
+        for stand in stands:
+            self.assertTrue(stand["lower"] < stand["best_total"] <
+                            stand["upper"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+bigtrees what-if recalibration unit tests
+
+"""
+from __future__ import division
+import os
+import sys
+import copy
+import platform
+if platform.python_version() < "2.7":
+    unittest = __import__("unittest2")
+else:
+    import unittest
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from bigtrees.aggregate import aggregate_output
+from bigtrees.registry import REGISTRY, Registry
+from bigtrees.treetable import TreeTable
+from bigtrees.whatif import WhatIf, patched_equations
+
+OUTPUT = os.path.join(HERE, os.pardir, "bigtrees", "bigtrees_tp001_v3.csv")
+
+def recalibrated(overrides):
+    """ a whole Registry with overrides applied, to recompute from scratch """
+    equations = []
+    for equation in REGISTRY.equations:
+        equation = copy.copy(equation)
+        for override in overrides:
+            if equation.species == override["species"] and \
+                    equation.component == override.get("component", "BIOMASS"):
+                for name, value in override.items():
+                    if name not in ("species", "component"):
+                        setattr(equation, name, value)
+        equations.append(equation)
+    return Registry(equations)
+
+class WhatIfTest(unittest.TestCase):
+    """ recomputing a resident inventory with changed parameters """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.table = TreeTable.load_output(OUTPUT)
+        cls.whatif = WhatIf(cls.table)
+
+    def check(self, overrides):
+        """ a what-if equals recomputing everything with the overrides """
+        result = self.whatif.evaluate(overrides)
+        best, _ = self.table.biomass(recalibrated(overrides))
+        np.testing.assert_allclose(result.best, best, rtol=1e-12)
+        changed = np.flatnonzero(result.best != self.whatif.best)
+        self.assertTrue(set(changed.tolist()) <= set(result.rows.tolist()))
+        for stand in result.stands():
+            rows = ((self.table.decode("psp_studyid") == stand["psp_studyid"]) &
+                    (self.table.decode("standid") == stand["standid"]))
+            self.assertAlmostEqual(stand["whatif_total"], best[rows].sum(),
+                                   places=6)
+        return result
+
+    def test_baseline(self):
+        """ with no overrides nothing is recomputed and totals match """
+        result = self.whatif.evaluate([])
+        self.assertEqual(len(result.rows), 0)
+        expected = aggregate_output(OUTPUT, ["psp_studyid", "standid"])
+        totals = dict(((r["psp_studyid"], r["standid"]), r["best_total"])
+                      for r in expected.results())
+        for stand in result.stands():
+            self.assertAlmostEqual(
+                stand["whatif_total"],
+                totals[(stand["psp_studyid"], stand["standid"])], places=2)
+            self.assertEqual(stand["difference"], 0.0)
+
+    def test_power(self):
+        """ a power equation's correction factor and wood density """
+        result = self.check([{"species": "PISI", "baskerville": 1.1,
+                              "woodden": 0.4}])
+        self.assertEqual(len(result.rows), 635)
+        self.assertEqual(set(tree["species"] for tree in result.trees()),
+                         set(["PISI"]))
+
+    def test_height(self):
+        """ a height equation changes the form factor models using it """
+        result = self.check([{"species": "PSME", "component": "HEIGHT",
+                              "b0": 60.0}])
+        self.assertTrue(all(model.height is not None
+                            for model in result.models.values()))
+        self.assertTrue(len(result.rows) > 0)
+
+    def test_several(self):
+        """ overrides of several species apply together """
+        self.check([{"species": "PSME", "b1": 0.25},
+                    {"species": "ABCO", "b0": 0.0001},
+                    {"species": "SEGI", "b0": -11.0}])
+
+    def test_proxy(self):
+        """ overriding a species also changes the species that borrow it """
+        result = self.whatif.evaluate([{"species": "ABCO", "b0": 0.0001}])
+        self.assertEqual(set(tree["species"] for tree in result.trees()),
+                         set(["ABCO", "ABMA"]))
+
+    def test_registry_unchanged(self):
+        """ overrides work on copies of the equations """
+        before = [(e.key, e.b0, e.woodden) for e in REGISTRY.equations]
+        self.whatif.evaluate([{"species": "PSME", "woodden": 0.5}])
+        self.assertEqual([(e.key, e.b0, e.woodden)
+                          for e in REGISTRY.equations], before)
+
+    def test_errors(self):
+        """ malformed overrides raise ValueError """
+        for overrides in ([{"b0": 1.0}], ["PSME"],
+                          [{"species": "FAKE", "b0": 1.0}],
+                          [{"species": "PSME", "b9": 1.0}],
+                          [{"species": "PSME", "b0": "high"}],
+                          [{"species": "PSME", "b0": None}],
+                          [{"species": "PSME", "b0": "nan"}],
+                          [{"species": "PISI", "woodden": float("inf")}],
+                          [{"species": "PSME", "geo": "EAST", "b0": 1.0}]):
+            self.assertRaises(ValueError, patched_equations, overrides)
+
+if __name__ == "__main__":
+    unittest.main()